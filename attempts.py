@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import atexit
+from database import Database
+
+
+class AttemptLog:
+    """
+    An append-only history of every answer given: when, to which question, which answers were chosen, whether that was
+    correct, how long it took, and in which session.
+
+    Attempts are buffered in memory and inserted `flush_every` at a time, each batch in one transaction, so the answer
+    loop doesn't wait on the log.  Whatever is still buffered is flushed when the log is closed, including when the
+    process exits.
+
+    The attempted and correct counts on `questions` are kept up to date as answers are given, but they're a cache of
+    what the log records, and can be rebuilt from it.
+    """
+
+    # both indexes cover every column the analytics read, so queries never have to visit the table itself
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS `attempts_question_id` "
+        "ON attempts (`question_id`, `answered_at`, `is_correct`, `latency`)",
+
+        "CREATE INDEX IF NOT EXISTS `attempts_answered_at` "
+        "ON attempts (`answered_at`, `question_id`, `is_correct`, `latency`)"
+    ]
+
+    def __init__(self, database, session_id=None, flush_every=20, clock=time.time):
+        self.database = database
+        self.session_id = session_id or uuid.uuid4().hex
+        self.flush_every = flush_every
+        self.clock = clock
+        self.buffer = []
+
+        # the log itself is one of `Database.tables`, which every database is given when it's opened
+        for s in self.indexes:
+            self.database.create(s)
+
+        self.database.commit()
+
+        atexit.register(self.close)
+
+    def record(self, question_id, chosen_answer_ids, is_correct, latency=None, answered_at=None):
+        self.buffer.append((
+            self.session_id,
+            question_id,
+            self.clock() if answered_at is None else answered_at,
+            ",".join(str(i) for i in chosen_answer_ids),
+            1 if is_correct else 0,
+            latency
+        ))
+
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer or not self.database.conn:
+            return
+
+        # each attempt is written to the database its question came from
+        rows_by_table = {}
+
+        for row in self.buffer:
+            table, question_id = self.database.route(row[1], "attempts")
+            rows_by_table.setdefault(table, []).append((row[0], question_id) + row[2:])
+
+        for table, rows in rows_by_table.items():
+            self.database.execute_many(
+                f"INSERT INTO {table} "
+                f"(session_id, question_id, answered_at, chosen_answer_ids, is_correct, latency) "
+                f"VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+        self.database.commit()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.close)
+
+    def accuracy_by_question(self, days, limit=None):
+        """
+        Returns (question_id, attempts, correct, percent) for every question answered in the last `days` days, least
+        accurate first.
+        """
+
+        return self.database.fetch_all(
+            "SELECT question_id, COUNT(*), SUM(is_correct), ROUND(SUM(is_correct) * 100.0 / COUNT(*), 2) AS percent "
+            "FROM attempts WHERE answered_at >= ? "
+            "GROUP BY question_id ORDER BY percent, question_id LIMIT ?",
+            (self.clock() - days * 24 * 60 * 60, -1 if limit is None else limit)
+        )
+
+    def slowest_questions(self, limit=10, days=None):
+        """
+        Returns (question_id, attempts, mean latency in seconds) for the questions that have taken longest to answer,
+        optionally only over the last `days` days.
+        """
+
+        return self.database.fetch_all(
+            "SELECT question_id, COUNT(latency), ROUND(AVG(latency), 3) AS mean_latency "
+            "FROM attempts WHERE answered_at >= ? AND latency IS NOT NULL "
+            "GROUP BY question_id ORDER BY mean_latency DESC, question_id LIMIT ?",
+            (0 if days is None else self.clock() - days * 24 * 60 * 60, limit)
+        )
+
+    def rebuild_counters(self):
+        """
+        Recomputes every question's attempted and correct counts from the log, returning the number of questions whose
+        counts changed.  Answers given before the log existed aren't in it, so they'll no longer be counted.
+        """
+
+        self.flush()
+
+        cursor = self.database.execute(
+            "UPDATE questions SET (attempted_count, correct_count) = ("
+            "SELECT COUNT(*), COALESCE(SUM(is_correct), 0) FROM attempts a WHERE a.question_id = questions.id"
+            ") WHERE (attempted_count, correct_count) IS NOT ("
+            "SELECT COUNT(*), COALESCE(SUM(is_correct), 0) FROM attempts a WHERE a.question_id = questions.id"
+            ")"
+        )
+
+        self.database.commit()
+
+        return cursor.rowcount
+
+    @staticmethod
+    def main(database_path, days=30, limit=10, rebuild_counters=False):
+        """
+        Prints the least accurate questions over the last `days` days, and the slowest questions to answer.
+        """
+
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        database = Database(database_path)
+        log = AttemptLog(database, flush_every=1)
+
+        def describe(question_id):
+            text = database.fetch_one("SELECT text FROM questions WHERE id = ?", (question_id,))[0]
+            return text if len(text) <= 60 else text[:57] + "..."
+
+        if rebuild_counters:
+            print(f"INFO: {log.rebuild_counters()} questions' counts have been rebuilt from the attempt log.")
+
+        print(f"LEAST ACCURATE (last {days} days):")
+
+        for question_id, attempt_count, correct_count, percent in log.accuracy_by_question(days, limit):
+            print(f"    #{question_id}: {percent}% ({correct_count}/{attempt_count} correct) {describe(question_id)}")
+
+        print("SLOWEST:")
+
+        for question_id, attempt_count, mean_latency in log.slowest_questions(limit):
+            print(f"    #{question_id}: {mean_latency}s on average ({attempt_count} attempts) {describe(question_id)}")
+
+        log.close()
+        database.close()
@@ -0,0 +1,347 @@
+import os
+import mmap
+import json
+import zlib
+import struct
+import sqlite3
+from itertools import chain, groupby
+from models import Question, Answer
+from utils import DumpyfileReader
+from database import Database
+from validator import DumpyfileValidator
+
+
+class CompiledBank:
+    """
+    A read-only question bank compiled into a single binary file, which is read through `mmap`.
+
+    The file is laid out as:
+
+        header      magic, version, flags, question count, and the offsets of the metadata and the index
+        questions   one length-prefixed block per question (zlib-compressed if the bank was compiled with compression)
+        metadata    a length-prefixed JSON object
+        index       one fixed-size entry per question, sorted by question id: its id, the offset of its block, and its
+                    attempted count, correct count and enabled flag
+
+    Any question can be fetched by id with a binary search over the index and a single block decode, without reading
+    the rest of the bank, and sessions can be ordered from the index alone.  Since the file is only ever mapped
+    read-only, any number of sessions on the same bank share its pages in the OS page cache.
+    """
+
+    magic = b"DMPB"
+    version = 1
+
+    COMPRESSED = 1
+
+    header = struct.Struct("<4sHHIQQ")
+    index_entry = struct.Struct("<qQiiB")
+    question_header = struct.Struct("<qiiBH")
+    answer_header = struct.Struct("<qB")
+    length = struct.Struct("<I")
+
+    def __init__(self, bank_path):
+        self.bank_path = bank_path
+
+        self.file = open(bank_path, 'rb')
+        self.mmap = None
+
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, self.flags, self.question_count, self.metadata_offset, self.index_offset = \
+                self.header.unpack_from(self.mmap, 0)
+
+        # an empty file can't be mapped, and one shorter than the header can't be unpacked
+        except (ValueError, struct.error):
+            self.close()
+            raise ValueError(f"{bank_path} is not a compiled bank.")
+
+        if magic != self.magic or version != self.version:
+            self.close()
+            raise ValueError(f"{bank_path} is not a version {self.version} compiled bank.")
+
+    def __len__(self):
+        return self.question_count
+
+    def close(self):
+        if self.mmap:
+            self.mmap.close()
+            self.mmap = None
+
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def read_block(self, offset):
+        size = self.length.unpack_from(self.mmap, offset)[0]
+        block = self.mmap[offset + self.length.size:offset + self.length.size + size]
+
+        return zlib.decompress(block) if self.flags & self.COMPRESSED else block
+
+    def load_metadata(self):
+        """
+        Returns the bank's (description, shuffle_answers, shuffle_questions_by_weight), like `Database.load_metadata`.
+        """
+
+        metadata = json.loads(self.read_block(self.metadata_offset).decode("utf-8"))
+
+        return metadata["description"], metadata["shuffle_answers"], metadata["shuffle_questions_by_weight"]
+
+    def load_index(self):
+        """
+        Returns every question's (question_id, offset, attempted_count, correct_count, enabled), in id order.
+        """
+
+        return list(self.index_entry.iter_unpack(
+            self.mmap[self.index_offset:self.index_offset + self.question_count * self.index_entry.size]
+        ))
+
+    def find(self, question_id):
+        """
+        Binary searches the index for a question, returning the offset of its block (or None).
+        """
+
+        lo, hi = 0, self.question_count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_offset = self.index_offset + mid * self.index_entry.size
+            mid_id, offset = self.index_entry.unpack_from(self.mmap, entry_offset)[:2]
+
+            if mid_id == question_id:
+                return offset
+
+            if mid_id < question_id:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return None
+
+    def load_question(self, question_id):
+        offset = self.find(question_id)
+
+        return self.load_question_at(offset) if offset is not None else None
+
+    def load_question_at(self, offset):
+        return self.decode_question(self.read_block(offset))
+
+    def load_questions(self):
+        return [self.load_question_at(entry[1]) for entry in self.load_index()]
+
+    @classmethod
+    def decode_question(cls, block):
+        question_id, attempted_count, correct_count, enabled, answer_count = cls.question_header.unpack_from(block, 0)
+        position = cls.question_header.size
+
+        text, position = cls.decode_text(block, position)
+        postmortem, position = cls.decode_text(block, position)
+
+        answers = []
+
+        for _ in range(answer_count):
+            answer_id, is_correct = cls.answer_header.unpack_from(block, position)
+            answer_text, position = cls.decode_text(block, position + cls.answer_header.size)
+
+            answers.append(
+                Answer(answer_id=answer_id, question_id=question_id, text=answer_text, is_correct=is_correct == 1)
+            )
+
+        return Question(
+            question_id=question_id,
+            text=text,
+            postmortem=postmortem,
+            answers=answers,
+            attempted_count=attempted_count,
+            correct_count=correct_count,
+            enabled=enabled
+        )
+
+    @classmethod
+    def decode_text(cls, block, position):
+        size = cls.length.unpack_from(block, position)[0]
+        position += cls.length.size
+
+        return block[position:position + size].decode("utf-8"), position + size
+
+    @classmethod
+    def encode_question(cls, question_id, text, postmortem, attempted_count, correct_count, enabled, answers):
+        """
+        Encodes a question, and its (answer_id, text, is_correct) answers, as a block.
+        """
+
+        parts = [cls.question_header.pack(question_id, attempted_count, correct_count, enabled, len(answers))]
+        parts.extend(cls.encode_text(text))
+        parts.extend(cls.encode_text(postmortem or ""))
+
+        for answer_id, answer_text, is_correct in answers:
+            parts.append(cls.answer_header.pack(answer_id, 1 if is_correct else 0))
+            parts.extend(cls.encode_text(answer_text))
+
+        return b"".join(parts)
+
+    @classmethod
+    def encode_text(cls, text):
+        encoded = str(text).encode("utf-8")
+
+        return cls.length.pack(len(encoded)), encoded
+
+    @staticmethod
+    def generate_records_from_database(database_path, metadata):
+        """
+        Yields the rows of every question in a database, in id order, and fills in its metadata.
+        """
+
+        database = Database(database_path)
+
+        try:
+            database.create_indexes()
+
+            description, shuffle_answers, shuffle_questions_by_weight = database.load_metadata()
+            metadata.update(
+                description=description,
+                shuffle_answers=shuffle_answers,
+                shuffle_questions_by_weight=shuffle_questions_by_weight
+            )
+
+            rows = database.execute(
+                "SELECT q.id, q.text, q.postmortem, q.attempted_count, q.correct_count, q.enabled, "
+                "a.id, a.text, a.is_correct "
+                "FROM questions q LEFT JOIN answers a ON a.question_id = q.id "
+                "ORDER BY q.id, a.id"
+            )
+
+            for _, question_rows in groupby(rows, key=lambda r: r[0]):
+                q = next(question_rows)
+                answers = [(a[6], a[7], a[8] == 1) for a in chain([q], question_rows) if a[6] is not None]
+
+                yield q[0], q[1], q[2], q[3] or 0, q[4] or 0, 1 if q[5] is None else q[5], answers
+
+        finally:
+            database.close()
+
+    @staticmethod
+    def generate_records_from_dumpyfile(dumpyfile_path, metadata):
+        """
+        Yields the rows of every question in a dumpyfile, numbered as `import_dumpyfile` would number them, and fills
+        in its metadata.
+        """
+
+        # imported here rather than at the top, since dumpy imports this module
+        from dumpy import Dumpy
+
+        question_id, answer_id = 0, 0
+
+        def update_metadata(value):
+            description, shuffle_answers, shuffle_questions_by_weight = Dumpy.read_metadata(value)
+
+            metadata.update(
+                description=description,
+                shuffle_answers=1 if shuffle_answers else 0,
+                shuffle_questions_by_weight=1 if shuffle_questions_by_weight else 0
+            )
+
+        # metadata is optional
+        update_metadata({})
+
+        for key, value in DumpyfileReader(dumpyfile_path):
+            if key == "metadata":
+                update_metadata(value)
+
+            elif key == "question":
+                question_id += 1
+                question_row, answer_rows = Dumpy.generate_question_rows(question_id, value)
+
+                answers = []
+
+                for a in answer_rows:
+                    answer_id += 1
+                    answers.append((answer_id, a[1], a[2]))
+
+                yield question_id, question_row[1], question_row[2], 0, 0, 1, answers
+
+    @classmethod
+    def compile(cls, source_path, bank_path, compress=False):
+        """
+        Compiles a dumpyfile or a database (which also carries its learner statistics) into a bank, returning the
+        number of questions compiled.
+        """
+
+        metadata = {}
+
+        if source_path.endswith(".dumpy"):
+            # a dumpyfile is validated in full first, as it is before an import
+            validator = DumpyfileValidator(max_errors=5)
+
+            if not validator.validate(source_path):
+                raise ValueError(f"it has {validator.error_count} error(s): {'; '.join(validator.errors)}")
+
+            records = cls.generate_records_from_dumpyfile(source_path, metadata)
+        else:
+            records = cls.generate_records_from_database(source_path, metadata)
+
+        flags = cls.COMPRESSED if compress else 0
+        index = bytearray()
+        question_count, last_question_id = 0, None
+
+        # the bank is written to a temporary file that replaces it once it's complete, so a bank that fails to compile
+        # never leaves a partial one behind
+        temp_path = bank_path + ".tmp"
+
+        try:
+            with open(temp_path, 'wb') as bank_file:
+                bank_file.write(b"\0" * cls.header.size)
+
+                def write_block(block):
+                    offset = bank_file.tell()
+                    block = zlib.compress(block) if compress else block
+                    bank_file.write(cls.length.pack(len(block)))
+                    bank_file.write(block)
+
+                    return offset
+
+                for question_id, text, postmortem, attempted_count, correct_count, enabled, answers in records:
+                    if last_question_id is not None and question_id <= last_question_id:
+                        raise ValueError(f"{source_path}: questions must be compiled in id order.")
+
+                    offset = write_block(cls.encode_question(
+                        question_id, text, postmortem, attempted_count, correct_count, enabled, answers
+                    ))
+
+                    index += cls.index_entry.pack(question_id, offset, attempted_count, correct_count, enabled)
+                    question_count, last_question_id = question_count + 1, question_id
+
+                metadata_offset = write_block(json.dumps(metadata).encode("utf-8"))
+                index_offset = bank_file.tell()
+                bank_file.write(index)
+
+                bank_file.seek(0)
+                bank_file.write(
+                    cls.header.pack(cls.magic, cls.version, flags, question_count, metadata_offset, index_offset)
+                )
+
+            os.replace(temp_path, bank_path)
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return question_count
+
+    @staticmethod
+    def main(source_path, bank_path, compress=False):
+        if not os.path.exists(source_path):
+            print(f"ERROR: {source_path} was not found.")
+            exit(1)
+
+        try:
+            question_count = CompiledBank.compile(source_path, bank_path, compress)
+
+        except (sqlite3.Error, ValueError, KeyError, OSError) as e:
+            print(f"ERROR: {source_path} could not be compiled: {e}")
+            exit(1)
+
+        print(
+            f"INFO: {question_count} questions have been compiled into {bank_path} "
+            f"({round(os.path.getsize(bank_path) / 1000000, 1)} MB)."
+        )
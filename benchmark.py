@@ -0,0 +1,608 @@
+"""
+Benchmarks for dumpy's main paths, run against deterministic synthetic dumpyfiles.
+
+    python3 benchmark.py --questions 100000 --output results.json
+
+Results are printed (and optionally written) as JSON, so that runs can be compared with one another.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from unittest import mock
+from dumpy import Dumpy
+from database import Database
+from utils import DumpyfileUtils
+from search import SearchIndex
+from dedup import DuplicateFinder
+from renderer import TerminalRenderer
+from validator import DumpyfileValidator
+from progress import ProgressSnapshot
+
+WORDS = [
+    "which", "of", "the", "following", "is", "not", "a", "valid", "subnet", "policy", "role", "bucket", "instance",
+    "region", "zone", "replica", "queue", "topic", "stream", "table", "index", "cache", "cluster", "node", "key"
+]
+
+
+def generate_text(r, length):
+    """
+    Generates roughly `length` characters of filler text.
+    """
+
+    words = []
+
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(r.choice(WORDS))
+
+    return " ".join(words)
+
+
+def generate_dumpyfile(dumpyfile_path, question_count, answers_per_question=4, correct_answers_per_question=1,
+                       question_length=80, answer_length=30, postmortem_length=120, seed=0):
+    """
+    Writes a synthetic .dumpy file.  The same arguments always produce the same file.
+    """
+
+    r = random.Random(seed)
+
+    with open(dumpyfile_path, "w") as dumpyfile:
+        dumpyfile.write('{"metadata": ')
+        dumpyfile.write(json.dumps({
+            "description": f"Synthetic \"benchmark\" bank ({question_count} questions)",
+            "shuffle_answers": True,
+            "shuffle_questions_by_weight": True
+        }))
+        dumpyfile.write(', "questions": [\n')
+
+        for i in range(question_count):
+            correct_answers = r.sample(range(answers_per_question), correct_answers_per_question)
+
+            question = {
+                "text": f"Question {i}: {generate_text(r, question_length)}?",
+                "answers": [
+                    {"text": generate_text(r, answer_length), "is_correct": j in correct_answers}
+                    for j in range(answers_per_question)
+                ],
+                "postmortem": generate_text(r, postmortem_length)
+            }
+
+            dumpyfile.write(("" if i == 0 else ",\n") + json.dumps(question))
+
+        dumpyfile.write("\n]}")
+
+
+def quietly():
+    """
+    Silences dumpy's output while something is being timed.
+    """
+
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+@contextlib.contextmanager
+def terminal_to_devnull():
+    """
+    Sends everything written to the terminal to /dev/null, including the output of child processes (e.g. `clear`).
+    """
+
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            mock.patch.dict(os.environ, {"TERM": os.environ.get("TERM", "xterm")}):
+        os.dup2(devnull.fileno(), 1)
+
+        try:
+            yield
+
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved_fd, 1)
+            os.close(saved_fd)
+
+
+def legacy_render(q):
+    """
+    The way questions were drawn before the renderer, kept as a baseline: the screen is cleared by running `clear` (or
+    `cls`) in a shell, and each line is printed on its own.
+    """
+
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+    print(f"{q.text}\n")
+
+    for a in q.answers:
+        print(f"  {a.letter}. {a.text}")
+
+    print("")
+
+
+def legacy_import(dumpyfile_path, database_path):
+    """
+    The import path that preceded bulk loading, kept as a baseline: the whole dumpyfile is parsed up front and every row
+    is inserted with its own hand-escaped INSERT statement, one `execute` at a time.
+    """
+
+    with open(dumpyfile_path, 'r') as dumpyfile:
+        dumpyfile_contents = json.loads(dumpyfile.read())
+
+    conn = sqlite3.connect(database_path)
+    c = conn.cursor()
+
+    for s in Database.schema:
+        c.execute(s)
+
+    for i, q in enumerate(dumpyfile_contents["questions"]):
+        question_text = q["text"].replace("'", "''")
+        question_postmortem = q["postmortem"].replace("'", "''") if q.get("postmortem") else ""
+
+        c.execute(
+            f"INSERT INTO questions (id, text, postmortem, attempted_count, correct_count, enabled) VALUES "
+            f"({i + 1}, '{question_text}', '{question_postmortem}', '0', '0', '1')"
+        )
+
+        for a in q["answers"]:
+            answer_text = a["text"].replace("'", "''")
+
+            c.execute(
+                f"INSERT INTO answers (question_id, text, is_correct) VALUES "
+                f"({i + 1}, '{answer_text}', '{1 if a['is_correct'] else 0}')"
+            )
+
+    conn.commit()
+    conn.close()
+
+
+def benchmark_import(dumpyfile_path, database_path, question_count, answers_per_question, legacy=True):
+    rows = question_count * (answers_per_question + 1)
+    results = {}
+
+    if legacy:
+        seconds = timed(legacy_import, dumpyfile_path, database_path + ".legacy")
+        results["legacy"] = {"seconds": round(seconds, 4), "rows_per_second": round(rows / seconds)}
+
+    with quietly():
+        seconds = timed(Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile)
+
+    results["bulk"] = {"seconds": round(seconds, 4), "rows_per_second": round(rows / seconds)}
+
+    return results
+
+
+def benchmark_load(database_path, question_count):
+    dumpy = Dumpy(selected_database=database_path)
+
+    with quietly():
+        seconds = timed(dumpy.load_questions_from_database)
+
+    dumpy.disconnect()
+
+    return {"seconds": round(seconds, 4), "microseconds_per_question": round(seconds * 1000000 / question_count, 2)}
+
+
+def benchmark_sample(database_path, sample_size):
+    """
+    Times starting a session on a random sample of the bank, which only loads the questions sampled.
+    """
+
+    with mock.patch.dict(os.environ, {"DUMPY_SAMPLE": str(sample_size)}):
+        dumpy = Dumpy(selected_database=database_path)
+
+    with quietly():
+        seconds = timed(dumpy.load_questions_from_database)
+
+    dumpy.disconnect()
+
+    return {"questions": len(dumpy.questions), "milliseconds": round(seconds * 1000, 2)}
+
+
+def benchmark_federation(directory, database_path, question_count, sample_size, copies=3):
+    """
+    Times starting sessions across several copies of the bank at once, attached to one connection: on every question,
+    and on a random sample of them.
+    """
+
+    database_paths = []
+
+    for i in range(copies):
+        database_paths.append(os.path.join(directory, f"federated_{i}.db"))
+        shutil.copyfile(database_path, database_paths[-1])
+
+    results = {"databases": copies, "questions": question_count * copies}
+
+    for name, environment in [("load", {}), ("sample", {"DUMPY_SAMPLE": str(sample_size)})]:
+        with mock.patch.dict(os.environ, environment):
+            dumpy = Dumpy(selected_databases=database_paths)
+
+        with quietly():
+            seconds = timed(dumpy.load_questions_from_database)
+
+        dumpy.disconnect()
+
+        results[f"{name}_questions"] = len(dumpy.questions)
+        results[f"{name}_milliseconds"] = round(seconds * 1000, 2)
+
+    results["load_microseconds_per_question"] = round(results["load_milliseconds"] * 1000 / results["questions"], 2)
+
+    return results
+
+
+def benchmark_render(database_path, question_count):
+    """
+    Times drawing each question of a session, which is the time between continuing past one question and seeing the
+    next, both the old way and with the renderer.
+    """
+
+    dumpy = Dumpy(selected_database=database_path)
+    dumpy.renderer = TerminalRenderer(clear_screen=True)
+
+    database = Database(database_path)
+    questions = database.load_questions("id <= ?", (question_count,))
+    database.close()
+
+    for q in questions:
+        q.assign_letters_to_answers()
+
+    with terminal_to_devnull():
+        legacy_seconds = timed(lambda: [legacy_render(q) for q in questions])
+        seconds = timed(lambda: [dumpy.render_question(q) for q in questions])
+
+    return {
+        "questions": len(questions),
+        "legacy_milliseconds_per_question": round(legacy_seconds * 1000 / len(questions), 3),
+        "milliseconds_per_question": round(seconds * 1000 / len(questions), 3)
+    }
+
+
+def benchmark_load_scaling(directory, question_counts, shape):
+    """
+    Times loading banks of increasing size, to show that loading scales linearly with the number of questions.
+    """
+
+    results = []
+
+    for question_count in question_counts:
+        dumpyfile_path = os.path.join(directory, f"load-{question_count}.dumpy")
+        database_path = os.path.join(directory, f"load-{question_count}.db")
+
+        generate_dumpyfile(dumpyfile_path, question_count, **shape)
+
+        with quietly():
+            Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+        database = Database(database_path)
+        seconds = timed(database.load_questions)
+        database.close()
+
+        results.append({
+            "questions": question_count,
+            "seconds": round(seconds, 4),
+            "microseconds_per_question": round(seconds * 1000000 / question_count, 2)
+        })
+
+    return results
+
+
+def benchmark_memory(database_path, question_count):
+    """
+    Measures the memory held by a loaded bank, and the cost of grading a response to each of its questions.
+    """
+
+    database = Database(database_path)
+
+    gc.collect()
+    tracemalloc.start()
+
+    questions = database.load_questions()
+
+    for q in questions:
+        q.assign_letters_to_answers()
+
+    resident_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    database.close()
+
+    seconds = timed(lambda: [q.grade("B") for q in questions])
+
+    return {
+        "resident_megabytes": round(resident_bytes / 1000000, 1),
+        "bytes_per_question": round(resident_bytes / question_count),
+        "grading_microseconds_per_question": round(seconds * 1000000 / question_count, 3)
+    }
+
+
+def benchmark_session(database_path, question_count, commit_policy="answer"):
+    """
+    Drives `begin_braindump` with scripted input: every question gets a response with the right number of letters,
+    and is then continued past, so that each question goes through grading, recording and both grades.  How long
+    recording each answer holds up the session is measured separately.
+    """
+
+    dumpy = Dumpy(selected_database=database_path)
+    dumpy.commit_policy = commit_policy
+
+    with quietly():
+        dumpy.load_questions_from_database()
+
+    dumpy.questions = dumpy.questions[:question_count]
+
+    responses = iter([
+        r for q in dumpy.questions for r in ["ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:len(q.correct_answers)], ""]
+    ])
+
+    record_answer, record_seconds = dumpy.record_answer, []
+    dumpy.record_answer = lambda *args: record_seconds.append(timed(record_answer, *args))
+
+    with mock.patch("builtins.input", lambda *args: next(responses)), quietly():
+        seconds = timed(dumpy.begin_braindump)
+
+    record_seconds.sort()
+
+    return {
+        "questions": len(dumpy.questions),
+        "commit_policy": commit_policy,
+        "seconds": round(seconds, 4),
+        "microseconds_per_question": round(seconds * 1000000 / len(dumpy.questions), 2),
+        "record_answer_p99_microseconds": round(record_seconds[int(len(record_seconds) * 0.99)] * 1000000, 2),
+        "record_answer_max_microseconds": round(record_seconds[-1] * 1000000, 2)
+    }
+
+
+def benchmark_overall_grade(database_path, repeats):
+    dumpy = Dumpy(selected_database=database_path)
+
+    with quietly():
+        dumpy.load_questions_from_database()
+        seconds = timed(lambda: [print(dumpy.format_overall_grade()) for _ in range(repeats)])
+
+    dumpy.disconnect()
+
+    return {"microseconds_per_call": round(seconds * 1000000 / repeats, 2)}
+
+
+def benchmark_search(database_path, queries):
+    """
+    Times each search on its own, and loading the questions it matches, as a search-driven session does.
+    """
+
+    database = Database(database_path)
+
+    # databases are indexed as they're imported, so this only builds the index for older databases
+    build_seconds = timed(SearchIndex.where, database, queries[0])
+
+    results = {"build_seconds": round(build_seconds, 4), "queries": []}
+
+    for query in queries:
+        where, parameters = SearchIndex.where(database, query)
+
+        match_seconds = timed(
+            database.fetch_all, "SELECT rowid FROM questions_search WHERE questions_search MATCH ?", parameters
+        )
+
+        load_seconds = timed(database.load_questions, where, parameters)
+
+        results["queries"].append({
+            "query": query,
+            "matches": database.fetch_one(f"SELECT COUNT(*) FROM questions WHERE {where}", parameters)[0],
+            "match_milliseconds": round(match_seconds * 1000, 2),
+            "load_milliseconds": round(load_seconds * 1000, 2)
+        })
+
+    database.close()
+
+    return results
+
+
+def benchmark_validate(dumpyfile_path, question_count):
+    """
+    Times a full validation of the dumpyfile, which every import now starts with.
+    """
+
+    validator = DumpyfileValidator()
+    seconds = timed(validator.validate, dumpyfile_path)
+
+    return {
+        "seconds": round(seconds, 4),
+        "microseconds_per_question": round(seconds * 1000000 / question_count, 2),
+        "errors": validator.error_count
+    }
+
+
+def benchmark_dedup(database_path, question_count):
+    """
+    Times a search for near-duplicate questions over the whole bank.
+    """
+
+    conn = sqlite3.connect(database_path)
+    clusters = []
+
+    def find_clusters():
+        clusters.extend(DuplicateFinder().find_clusters(conn))
+
+    seconds = timed(find_clusters)
+    conn.close()
+
+    return {
+        "seconds": round(seconds, 4),
+        "microseconds_per_question": round(seconds * 1000000 / question_count, 2),
+        "clusters": len(clusters)
+    }
+
+
+def benchmark_progress(directory, database_path, question_count, answered_count, session_count=100):
+    """
+    Times exporting a snapshot of the progress made on some of the bank's questions, then a delta snapshot of one more
+    session, and merging both into another copy of the bank.
+    """
+
+    database_paths = []
+
+    for name in ["progress_first", "progress_second"]:
+        database_paths.append(os.path.join(directory, f"{name}.db"))
+        shutil.copyfile(database_path, database_paths[-1])
+
+    first, second = [Database(p) for p in database_paths]
+    r = random.Random(0)
+
+    def answer(count):
+        first.execute_many(
+            "UPDATE questions SET attempted_count = attempted_count + 1, correct_count = correct_count + ? "
+            "WHERE id = ?",
+            [(r.randint(0, 1), r.randint(1, question_count)) for _ in range(count)]
+        )
+        first.commit()
+
+    results = {"answered_questions": answered_count, "session_questions": session_count}
+
+    for name, count, delta in [("full", answered_count, False), ("delta", session_count, True)]:
+        answer(count)
+        snapshot_path = os.path.join(directory, f"{name}.snapshot")
+
+        def export():
+            snapshot = ProgressSnapshot.take(first, delta)
+            snapshot.write(snapshot_path)
+            first.commit()
+
+        export_seconds = timed(export)
+
+        def merge():
+            ProgressSnapshot.prepare(second)
+            ProgressSnapshot.read(snapshot_path).merge(second)
+            second.commit()
+
+        merge_seconds = timed(merge)
+
+        results[name] = {
+            "entries": len(ProgressSnapshot.read(snapshot_path)),
+            "kilobytes": round(os.path.getsize(snapshot_path) / 1000, 1),
+            "export_milliseconds": round(export_seconds * 1000, 2),
+            "merge_milliseconds": round(merge_seconds * 1000, 2)
+        }
+
+    first.close()
+    second.close()
+
+    return results
+
+
+def benchmark_export(database_path, output_path, question_count):
+    with quietly():
+        seconds = timed(DumpyfileUtils.generate_dumpyfile_from_database, database_path, output_path)
+
+    return {
+        "seconds": round(seconds, 4),
+        "questions_per_second": round(question_count / seconds),
+        "megabytes": round(os.path.getsize(output_path) / 1000000, 1)
+    }
+
+
+def run(args):
+    shape = {
+        "answers_per_question": args.answers_per_question,
+        "correct_answers_per_question": args.correct_answers_per_question,
+        "question_length": args.question_length,
+        "answer_length": args.answer_length,
+        "postmortem_length": args.postmortem_length,
+        "seed": args.seed
+    }
+
+    results = {
+        "parameters": dict(shape, questions=args.questions),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform()
+        }
+    }
+
+    with tempfile.TemporaryDirectory() as d:
+        dumpyfile_path = os.path.join(d, "benchmark.dumpy")
+        database_path = os.path.join(d, "benchmark.db")
+
+        generate_dumpyfile(dumpyfile_path, args.questions, **shape)
+
+        results["validate"] = benchmark_validate(dumpyfile_path, args.questions)
+        results["import"] = benchmark_import(
+            dumpyfile_path, database_path, args.questions, args.answers_per_question, legacy=not args.no_legacy
+        )
+
+        results["load"] = benchmark_load(database_path, args.questions)
+        results["sample"] = benchmark_sample(database_path, args.sample_questions)
+        results["federation"] = benchmark_federation(d, database_path, args.questions, args.sample_questions)
+        results["render"] = benchmark_render(database_path, args.render_questions)
+        results["memory"] = benchmark_memory(database_path, args.questions)
+
+        results["session"] = [
+            benchmark_session(database_path, args.session_questions, commit_policy)
+            for commit_policy in ["answer", "exit"]
+        ]
+
+        results["overall_grade"] = benchmark_overall_grade(database_path, args.grade_repeats)
+        results["search"] = benchmark_search(database_path, args.search_queries.split(","))
+        results["dedup"] = benchmark_dedup(database_path, args.questions)
+        results["export"] = benchmark_export(database_path, os.path.join(d, "export.dumpy"), args.questions)
+        results["progress"] = benchmark_progress(d, database_path, args.questions, args.progress_questions)
+
+        if args.load_scaling:
+            results["load_scaling"] = benchmark_load_scaling(
+                d, [int(n) for n in args.load_scaling.split(",")], shape
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks dumpy against synthetic dumpyfiles.")
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--answers-per-question", type=int, default=4)
+    parser.add_argument("--correct-answers-per-question", type=int, default=1)
+    parser.add_argument("--question-length", type=int, default=80, help="The length of each question's text.")
+    parser.add_argument("--answer-length", type=int, default=30, help="The length of each answer's text.")
+    parser.add_argument("--postmortem-length", type=int, default=120, help="The length of each postmortem.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--session-questions", type=int, default=1000, help="The number of questions to answer.")
+    parser.add_argument("--grade-repeats", type=int, default=1000)
+    parser.add_argument("--render-questions", type=int, default=200, help="The number of questions to draw.")
+    parser.add_argument("--sample-questions", type=int, default=20, help="The size of the sampled session to start.")
+    parser.add_argument(
+        "--progress-questions", type=int, default=10000, help="The number of answers in the full progress snapshot."
+    )
+    parser.add_argument(
+        "--search-queries", default="123,subnet replica,subnet",
+        help="Comma-separated searches to time (the synthetic banks' questions are numbered, so e.g. '123' is rare)."
+    )
+    parser.add_argument("--no-legacy", action="store_true", help="Skip the (slow) legacy import baseline.")
+    parser.add_argument(
+        "--load-scaling", default="",
+        help="Comma-separated bank sizes to time loading at, e.g. 1000,10000,100000,1000000."
+    )
+    parser.add_argument("--output", help="A file to write the results to, as well as printing them.")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(json.dumps(results, indent=4))
+
+    json.dump(results, sys.stdout, indent=4)
+    print("")
@@ -0,0 +1,289 @@
+import atexit
+import sqlite3
+from itertools import groupby
+from models import Question, Answer
+
+
+class Database:
+    """
+    A long-lived connection to a dumpy database, shared for the whole session.
+
+    The database is switched to WAL mode, so that a commit is an append to the write-ahead log rather than an fsync of
+    the database itself; committed answers survive the process crashing.  Parameterized statements are prepared once
+    and reused from the connection's statement cache.
+
+    Writes are committed according to a commit policy:
+
+        "answer"    commit after every write (the default)
+        N           commit after every N writes
+        "exit"      commit only when the connection is closed
+
+    Pending writes are committed when the connection is closed, including when the process exits.
+    """
+
+    schema = [
+        "CREATE TABLE metadata ("
+        "`description` TEXT,"
+        "`shuffle_answers` INTEGER DEFAULT 0,"
+        "`shuffle_questions_by_weight` INTEGER DEFAULT 1,"
+        "`database_created_time` TEXT,"
+        "`source_hash` TEXT,"
+        "`source_size` INTEGER,"
+        "`source_mtime` REAL"
+        ");",
+
+        "CREATE TABLE questions ("
+        "`id`	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,"
+        "`text`	TEXT NOT NULL,"
+        "`postmortem` TEXT,"
+        "`attempted_count` INTEGER DEFAULT 0,"
+        "`correct_count` INTEGER DEFAULT 0,"
+        "`enabled` INTEGER DEFAULT 1,"
+        "`removed` INTEGER DEFAULT 0,"
+        "`text_hash` TEXT,"
+        "`content_hash` TEXT,"
+        "`tag` TEXT,"
+        "`box` INTEGER DEFAULT 0,"
+        "`due_at` REAL DEFAULT ((random() & 4294967295) / 4294967296.0)"
+        ");",
+
+        "CREATE TABLE answers ("
+        " `id`	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,"
+        " `question_id`	INTEGER NOT NULL,"
+        " `text`	TEXT NOT NULL,"
+        " `is_correct`	INTEGER NOT NULL DEFAULT 0,"
+        " `content_hash` TEXT"
+        ");"
+    ]
+
+    # tables added to the schema since databases were first created, which `migrate` gives to older databases
+    tables = [
+        "CREATE TABLE IF NOT EXISTS attempts ("
+        "`id` INTEGER NOT NULL PRIMARY KEY,"
+        "`session_id` TEXT NOT NULL,"
+        "`question_id` INTEGER NOT NULL,"
+        "`answered_at` REAL NOT NULL,"
+        "`chosen_answer_ids` TEXT,"
+        "`is_correct` INTEGER NOT NULL,"
+        "`latency` REAL"
+        ")"
+    ]
+
+    # columns added to the schema since databases were first created, which `migrate` gives to older databases
+    columns = [
+        ("metadata", "source_hash", "TEXT"),
+        ("metadata", "source_size", "INTEGER"),
+        ("metadata", "source_mtime", "REAL"),
+        ("questions", "text_hash", "TEXT"),
+        ("questions", "content_hash", "TEXT"),
+        ("questions", "tag", "TEXT"),
+        ("questions", "box", "INTEGER DEFAULT 0"),
+        ("questions", "due_at", "REAL DEFAULT 0"),
+        ("questions", "removed", "INTEGER DEFAULT 0"),
+        ("answers", "content_hash", "TEXT")
+    ]
+
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS `answers_question_id` ON answers (`question_id`)"
+    ]
+
+    def __init__(self, database_path, commit_policy="answer"):
+        self.database_path = database_path
+        self.commit_policy = str(commit_policy).lower()
+
+        if self.commit_policy == "answer":
+            self.commit_every = 1
+        elif self.commit_policy == "exit":
+            self.commit_every = None
+        elif self.commit_policy.isdigit() and int(self.commit_policy) > 0:
+            self.commit_every = int(self.commit_policy)
+        else:
+            raise ValueError(f"'{commit_policy}' is not a valid commit policy; expected 'answer', 'exit' or a number.")
+
+        self.pending_writes = 0
+
+        self.conn = sqlite3.connect(database_path, cached_statements=256)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+
+        self.migrate(self.conn)
+        self.commit()
+
+        atexit.register(self.close)
+
+    @classmethod
+    def migrate(cls, conn, schema="main"):
+        """
+        Gives a database imported by an earlier version of dumpy (or one of the databases attached to a connection, by
+        its schema name) the tables and columns that it's missing.  Nothing is written to a database that's up to date,
+        or to one that has no questions table yet, so it's safe to run whenever a connection is opened.  Returns the
+        columns that were added, as (table, column).
+        """
+
+        tables = [t[0] for t in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")]
+
+        if "questions" not in tables:
+            return []
+
+        added_columns, columns_by_table = [], {}
+
+        for table, column, column_type in cls.columns:
+            if table not in tables:
+                continue
+
+            if table not in columns_by_table:
+                columns_by_table[table] = [c[1] for c in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+            if column not in columns_by_table[table]:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN `{column}` {column_type}")
+                added_columns.append((table, column))
+
+        # questions are given randomized due times, as they would have been given at import
+        if ("questions", "due_at") in added_columns:
+            conn.execute(f"UPDATE {schema}.questions SET due_at = (random() & 4294967295) / 4294967296.0")
+
+        for s in cls.tables:
+            conn.execute(s.replace("IF NOT EXISTS ", f"IF NOT EXISTS {schema}.", 1))
+
+        return added_columns
+
+    def create_indexes(self):
+        for s in self.indexes:
+            self.create(s)
+
+        self.commit()
+
+    def create(self, sql):
+        """
+        Executes a `CREATE ... IF NOT EXISTS` statement, for the tables and indexes that are added to databases as
+        they're needed.
+        """
+
+        self.conn.execute(sql)
+
+    def route(self, question_id, table="questions"):
+        """
+        Returns the table that holds a question's rows (in `questions`, or e.g. `attempts`), and the question's id in
+        it.  A database's questions are all its own, but a `FederatedDatabase` spreads them over several databases.
+        """
+
+        return table, question_id
+
+    def execute(self, sql, parameters=()):
+        return self.conn.execute(sql, parameters)
+
+    def execute_many(self, sql, parameters):
+        return self.conn.executemany(sql, parameters)
+
+    def fetch_one(self, sql, parameters=()):
+        return self.conn.execute(sql, parameters).fetchone()
+
+    def fetch_all(self, sql, parameters=()):
+        return self.conn.execute(sql, parameters).fetchall()
+
+    def load_metadata(self):
+        return self.fetch_one("SELECT description, shuffle_answers, shuffle_questions_by_weight FROM metadata")
+
+    def load_overall_counts(self):
+        """
+        Counts the questions that have been attempted, answered correctly at least once, and never seen, in one scan.
+        """
+
+        return self.fetch_one(
+            "SELECT "
+            "COALESCE(SUM(attempted_count > 0), 0), "
+            "COALESCE(SUM(correct_count > 0), 0), "
+            "COALESCE(SUM(attempted_count = 0), 0) "
+            "FROM questions"
+        )
+
+    def load_questions(self, where=None, parameters=(), schema="main"):
+        """
+        Loads every question (or every question matching a `where` clause over the `questions` table), along with its
+        answers, from the database (or from one of the databases attached to it, by its schema name).
+
+        Questions and answers are read as two cursors ordered by question id, and merged in a single pass, so loading
+        takes linear time in the size of the bank.
+        """
+
+        # databases imported before the index existed get it here, so that answers can be read in question order
+        self.create_indexes()
+
+        questions = []
+
+        questions_sql = f"SELECT id, text, postmortem, attempted_count, correct_count, enabled FROM {schema}.questions"
+        answers_sql = f"SELECT id, question_id, text, is_correct FROM {schema}.answers"
+
+        if where:
+            questions_sql += f" WHERE {where}"
+            answers_sql += f" WHERE question_id IN (SELECT id FROM {schema}.questions WHERE {where})"
+        else:
+            parameters = ()
+
+        answers = groupby(
+            self.conn.execute(answers_sql + " ORDER BY question_id, id", parameters),
+            key=lambda a: a[1]
+        )
+
+        answers_question_id, question_answers = next(answers, (None, None))
+
+        for q in self.conn.execute(questions_sql + " ORDER BY id", parameters):
+            # skip past answers which belong to questions that no longer exist
+            while answers_question_id is not None and answers_question_id < q[0]:
+                answers_question_id, question_answers = next(answers, (None, None))
+
+            this_question_answers = []
+
+            if answers_question_id == q[0]:
+                # answers share their question's id, rather than each holding a copy of it
+                this_question_answers = [
+                    Answer(
+                        answer_id=a[0],
+                        question_id=q[0],
+                        text=a[2],
+                        is_correct=True if a[3] == 1 else False
+                    )
+                    for a in question_answers
+                ]
+
+                answers_question_id, question_answers = next(answers, (None, None))
+
+            questions.append(
+                Question(
+                    question_id=q[0],
+                    text=q[1],
+                    postmortem=q[2],
+                    answers=this_question_answers,
+                    attempted_count=q[3],
+                    correct_count=q[4],
+                    enabled=q[5]
+                )
+            )
+
+        return questions
+
+    def write(self, sql_statements):
+        """
+        Executes a group of (sql, parameters) statements as a single write, committing if the commit policy says to.
+        """
+
+        for sql, parameters in sql_statements:
+            self.conn.execute(sql, parameters)
+
+        self.pending_writes += 1
+
+        if self.commit_every and self.pending_writes >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        if self.conn:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        if self.conn:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+        atexit.unregister(self.close)
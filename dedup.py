@@ -0,0 +1,258 @@
+import os
+import re
+import zlib
+import array
+import random
+import sqlite3
+from itertools import chain, groupby
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DuplicateFinder:
+    """
+    Finds clusters of near-duplicate questions in a database, with MinHash and locality-sensitive hashing.
+
+    Each question is reduced to a set of shingles (the pairs of adjacent words in its text, and each of its answers as
+    a whole, so that answer order doesn't matter), and then to a MinHash signature: the minimum of its shingles'
+    hashes under each of `permutations` random permutations.  Two questions' signatures agree at any one position with
+    probability equal to the Jaccard similarity of their shingles.
+
+    Signatures are cut into `bands`, and questions that agree on every position of any one band share a bucket, so
+    similar questions are found as candidates in a single pass over the bank rather than by comparing every pair.
+    Candidates are confirmed by estimating their similarity from their whole signatures, and confirmed pairs are
+    joined into clusters.  With the default 8 bands of 4, a pair of questions that are 80% similar is a candidate
+    98% of the time, and one that is 30% similar only 6% of the time.
+
+    Signatures and buckets are kept in temporary tables rather than in memory, so very large banks can be checked.
+    """
+
+    def __init__(self, threshold=0.8, permutations=32, bands=8, seed=0):
+        if permutations % bands:
+            raise ValueError(f"the number of permutations ({permutations}) must be a multiple of bands ({bands}).")
+
+        if not 0 < threshold <= 1:
+            raise ValueError(f"the similarity threshold must be between 0 and 1 (not {threshold}).")
+
+        self.threshold = threshold
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+
+        # shingles are hashed to 32 bits, and each permutation is an xor with a random mask
+        r = random.Random(seed)
+        self.masks = [r.getrandbits(32) for _ in range(permutations)]
+
+        if numpy is not None:
+            self.masks = numpy.array(self.masks, dtype=numpy.uint32)[:, None]
+
+    @staticmethod
+    def shingle(text, answers):
+        """
+        Returns the hashes of a question's shingles, normalized for case, whitespace and punctuation.
+        """
+
+        words = re.findall(r"\w+", str(text).lower())
+        shingles = [f"{a} {b}" for a, b in zip(words, words[1:])] or words
+        shingles.extend("\x1f" + " ".join(re.findall(r"\w+", str(a).lower())) for a in answers)
+
+        return list(set(zlib.crc32(s.encode("utf-8")) for s in shingles))
+
+    def signature(self, hashes):
+        if not hashes:
+            hashes = [0]
+
+        if numpy is not None:
+            return (numpy.array(hashes, dtype=numpy.uint32)[None, :] ^ self.masks).min(axis=1).tolist()
+
+        return [min(map(m.__xor__, hashes)) for m in self.masks]
+
+    def similarity(self, a, b):
+        return sum(1 for x, y in zip(a, b) if x == y) / self.permutations
+
+    def find_clusters(self, conn, batch_size=10000):
+        """
+        Returns clusters of near-duplicate enabled questions, each a list of question ids with the question to keep
+        first (the one that has been attempted most, or else the earliest).
+        """
+
+        conn.execute("DROP TABLE IF EXISTS temp.minhash_signatures")
+        conn.execute("DROP TABLE IF EXISTS temp.minhash_buckets")
+        conn.execute("CREATE TEMP TABLE minhash_signatures (`question_id` INTEGER PRIMARY KEY, `signature` BLOB)")
+        conn.execute("CREATE TEMP TABLE minhash_buckets (`bucket` INTEGER, `question_id` INTEGER)")
+
+        rows = conn.execute(
+            "SELECT q.id, q.text, a.text FROM questions q LEFT JOIN answers a ON a.question_id = q.id "
+            "WHERE q.enabled = 1 ORDER BY q.id, a.id"
+        )
+
+        signature_rows, bucket_rows = [], []
+
+        def flush():
+            conn.executemany("INSERT INTO temp.minhash_signatures VALUES (?, ?)", signature_rows)
+            conn.executemany("INSERT INTO temp.minhash_buckets VALUES (?, ?)", bucket_rows)
+            signature_rows.clear()
+            bucket_rows.clear()
+
+        for question_id, question_rows in groupby(rows, key=lambda r: r[0]):
+            q = next(question_rows)
+            answers = [a[2] for a in chain([q], question_rows) if a[2] is not None]
+            signature = self.signature(self.shingle(q[1], answers))
+
+            signature_rows.append((question_id, array.array("I", signature).tobytes()))
+
+            # tuples of ints hash the same in every process, so buckets are reproducible
+            for band in range(self.bands):
+                bucket_rows.append(
+                    (hash((band,) + tuple(signature[band * self.rows:(band + 1) * self.rows])), question_id)
+                )
+
+            if len(signature_rows) >= batch_size:
+                flush()
+
+        flush()
+
+        parents = {}
+
+        def find(i):
+            while parents.setdefault(i, i) != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+
+            return i
+
+        def load_signature(question_id):
+            blob = conn.execute(
+                "SELECT signature FROM temp.minhash_signatures WHERE question_id = ?", (question_id,)
+            ).fetchone()[0]
+
+            return array.array("I", blob)
+
+        # every member of a bucket is compared with its first member only, so a bucket of n questions costs n - 1
+        # comparisons, and clusters are closed transitively
+        for bucket_ids in conn.execute(
+            "SELECT group_concat(question_id) FROM temp.minhash_buckets GROUP BY bucket HAVING COUNT(*) > 1"
+        ).fetchall():
+            question_ids = sorted(int(i) for i in bucket_ids[0].split(","))
+            first_signature = load_signature(question_ids[0])
+
+            for question_id in question_ids[1:]:
+                if find(question_id) == find(question_ids[0]):
+                    continue
+
+                if self.similarity(first_signature, load_signature(question_id)) >= self.threshold:
+                    parents[find(question_id)] = find(question_ids[0])
+
+        conn.execute("DROP TABLE temp.minhash_signatures")
+        conn.execute("DROP TABLE temp.minhash_buckets")
+
+        clusters = {}
+
+        for question_id in parents:
+            clusters.setdefault(find(question_id), set()).add(question_id)
+
+        attempted_counts = dict(conn.execute(
+            "SELECT id, attempted_count FROM questions WHERE id IN (SELECT value FROM json_each(?))",
+            (f"[{','.join(str(i) for c in clusters.values() for i in c)}]",)
+        ).fetchall())
+
+        return sorted(
+            sorted(c, key=lambda i: (-(attempted_counts.get(i) or 0), i)) for c in clusters.values() if len(c) > 1
+        )
+
+    @staticmethod
+    def resolve(conn, clusters, action):
+        """
+        Disables every question but the first in each cluster.  If the action is "merge", the disabled questions'
+        attempted and correct counts, and their answer history, are first moved onto the question kept.  Returns the
+        number of questions disabled.
+        """
+
+        if action not in ["disable", "merge"]:
+            raise ValueError(f"'{action}' is not a valid action; expected 'disable' or 'merge'.")
+
+        has_attempts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'attempts'").fetchone() is not None
+        duplicates = [(c[0], i) for c in clusters for i in c[1:]]
+
+        if action == "merge":
+            conn.executemany(
+                "UPDATE questions SET "
+                "attempted_count = attempted_count + (SELECT attempted_count FROM questions WHERE id = ?2), "
+                "correct_count = correct_count + (SELECT correct_count FROM questions WHERE id = ?2) "
+                "WHERE id = ?1",
+                duplicates
+            )
+
+            conn.executemany(
+                "UPDATE questions SET attempted_count = 0, correct_count = 0 WHERE id = ?",
+                [(i,) for _, i in duplicates]
+            )
+
+            if has_attempts:
+                conn.executemany("UPDATE attempts SET question_id = ? WHERE question_id = ?", duplicates)
+
+        conn.executemany("UPDATE questions SET enabled = 0 WHERE id = ?", [(i,) for _, i in duplicates])
+
+        return len(duplicates)
+
+    @staticmethod
+    def report(conn, clusters, limit=None):
+        for c in clusters[:limit]:
+            texts = dict(conn.execute(
+                "SELECT id, text FROM questions WHERE id IN (SELECT value FROM json_each(?))",
+                (f"[{','.join(map(str, c))}]",)
+            ).fetchall())
+
+            texts = {i: text if len(text) <= 60 else text[:57] + "..." for i, text in texts.items()}
+
+            print(f"    keep #{c[0]}: {texts[c[0]]}")
+
+            for i in c[1:]:
+                print(f"        duplicate #{i}: {texts[i]}")
+
+        if limit is not None and len(clusters) > limit:
+            print(f"    ... and {len(clusters) - limit} more clusters.")
+
+    @staticmethod
+    def main(database_path, threshold=0.8, action="report", limit=20):
+        """
+        Reports the clusters of near-duplicate questions in a database, and optionally disables or merges them.
+        """
+
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        conn = None
+
+        try:
+            finder = DuplicateFinder(threshold)
+
+            conn = sqlite3.connect(database_path)
+            clusters = finder.find_clusters(conn)
+
+            print(
+                f"INFO: {len(clusters)} clusters of near-duplicate questions were found "
+                f"({sum(len(c) - 1 for c in clusters)} duplicates)."
+            )
+
+            DuplicateFinder.report(conn, clusters, limit)
+
+            if action != "report":
+                with conn:
+                    disabled_count = DuplicateFinder.resolve(conn, clusters, action)
+
+                print(
+                    f"INFO: {disabled_count} duplicates have been {'merged and ' if action == 'merge' else ''}disabled."
+                )
+
+        except (sqlite3.Error, ValueError) as e:
+            print(f"ERROR: {database_path} could not be deduplicated: {e}")
+            exit(1)
+
+        finally:
+            if conn:
+                conn.close()
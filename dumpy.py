@@ -1,28 +1,67 @@
 import os
-import json
+import argparse
+import hashlib
 import sqlite3
 import datetime
 import time
 import random
 from random import shuffle
-from models import Question, Answer, TerminalColors
+from itertools import groupby
+from models import Scoreboard, TerminalColors
+from utils import DumpyfileUtils, DumpyfileReader
+from database import Database
+from federation import FederatedDatabase
+from scheduler import LeitnerScheduler
+from instrumentation import instrumentation
+from grader import BatchGrader
+from bank import CompiledBank
+from server import SessionServer, load_test
+from attempts import AttemptLog
+from search import SearchIndex
+from selection import SessionFilter
+from dedup import DuplicateFinder
+from renderer import TerminalRenderer
+from engine import SessionEngine
+from validator import DumpyfileValidator
+from progress import ProgressSnapshot
+from importer import BulkImporter
 
 
 class Dumpy:
-    def __init__(self):
+    def __init__(self, selected_database=None, selected_dumpyfile=None, selected_bank=None, selected_databases=None):
+        """
+        Starts dumpy interactively.  If a database (and optionally a dumpyfile), several databases to study together,
+        or a compiled bank is provided, dumpy is instead set up headlessly against it, and nothing is printed or
+        prompted; this is intended for scripts and benchmarks.
+        """
 
-        print("\n", end='', flush=True)
-        print("THANK YOU FOR USING ....\n", end='', flush=True)
-        print("     _                             \n", end='', flush=True)
-        print("  __| |_   _ _ __ ___  _ __  _   _ \n", end='', flush=True)
-        print(" / _` | | | | '_ ` _ \\| '_ \\| | | |\n", end='', flush=True)
-        print("| (_| | |_| | | | | | | |_) | |_| |\n", end='', flush=True)
-        print(" \\__,_|\\__,_|_| |_| |_| .__/ \\__, |\n", end='', flush=True)
-        print("                      |_|    |___/\n\n", end='', flush=True)
+        self.questions = []
+        self.import_batch_size = 1000
 
-        time.sleep(1)
+        self.database = None
+        self.bank = None
+        self.commit_policy = os.environ["DUMPY_COMMIT_POLICY"] if "DUMPY_COMMIT_POLICY" in os.environ else "answer"
 
-        self.questions = []
+        self.scoreboard = None
+        self.scheduler = None
+        self.attempt_log = None
+        self.engine = None
+        self.scheduler_name = os.environ["DUMPY_SCHEDULER"].lower() if "DUMPY_SCHEDULER" in os.environ else None
+        self.search_query = os.environ["DUMPY_SEARCH"].strip() if "DUMPY_SEARCH" in os.environ else None
+
+        try:
+            self.session_filter = SessionFilter.from_environment()
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            exit(1)
+
+        self.dedup_action = os.environ["DUMPY_DEDUP"].lower() if "DUMPY_DEDUP" in os.environ else None
+
+        if self.dedup_action not in [None, "report", "disable", "merge"]:
+            print(
+                f"ERROR: `DUMPY_DEDUP` must be 'report', 'disable' or 'merge' if it is set (not '{self.dedup_action}')."
+            )
+            exit(1)
 
         self.description = None
         self.shuffle_answers = None
@@ -33,16 +72,50 @@ class Dumpy:
         self.databases_directory = os.path.join(self.dumpy_path, "databases")
         self.dumpyfiles_directory = os.path.join(self.dumpy_path, "dumpyfiles")
 
+        self.selected_database = selected_database
+        self.selected_dumpyfile = selected_dumpyfile
+        self.selected_bank = selected_bank
+        self.selected_databases = selected_databases
+
+        self.renderer = TerminalRenderer()
+
+        if selected_database or selected_bank or selected_databases:
+            return
+
+        try:
+            banner_delay = float(os.environ["DUMPY_BANNER_DELAY"]) if "DUMPY_BANNER_DELAY" in os.environ else 1
+        except ValueError:
+            print(f"ERROR: `DUMPY_BANNER_DELAY` must be a number of seconds, not '{os.environ['DUMPY_BANNER_DELAY']}'.")
+            exit(1)
+
+        self.renderer.write(
+            "",
+            "THANK YOU FOR USING ....",
+            "     _                             ",
+            "  __| |_   _ _ __ ___  _ __  _   _ ",
+            " / _` | | | | '_ ` _ \\| '_ \\| | | |",
+            "| (_| | |_| | | | | | | |_) | |_| |",
+            " \\__,_|\\__,_|_| |_| |_| .__/ \\__, |",
+            "                      |_|    |___/",
+            ""
+        )
+
+        time.sleep(banner_delay)
+
         for d in [self.databases_directory, self.dumpyfiles_directory]:
             if not os.path.exists(d):
                 os.mkdir(d)
 
-        self.available_databases = os.listdir(self.databases_directory)
+        self.available_databases = [d for d in os.listdir(self.databases_directory) if d.endswith(".db")]
+        self.available_banks = [b for b in os.listdir(self.databases_directory) if b.endswith(".bank")]
 
         # this is just a convenience.  by convention, a single dumpyfile is specified in the environment
         self.available_dumpyfiles = os.listdir(self.dumpyfiles_directory)
 
-        if len(self.available_databases) == 0:
+        if "DUMPY_DATABASES" in os.environ:
+            self.selected_databases = [d for d in os.environ["DUMPY_DATABASES"].split(os.pathsep) if d]
+
+        elif len(self.available_databases) == 0 and len(self.available_banks) == 0:
 
             # ensure dumpyfile was specified and exists
             if not self.dumpyfile_path:
@@ -69,8 +142,15 @@ class Dumpy:
             for ad in self.available_databases:
                 options.append(("LOAD", f"Load {ad}", ad.replace(".db", "")))
 
+            if 1 < len(self.available_databases) <= FederatedDatabase.max_databases:
+                options.append(("FEDERATE", f"Load all {len(self.available_databases)} databases together", None))
+
+            for ab in self.available_banks:
+                options.append(("BANK", f"Load {ab} (read-only)", ab))
+
             if self.dumpyfile_path:
                 options.append(("IMPORT", f"Import {self.dumpyfile_path}", self.dumpyfile_path))
+                options.append(("SYNC", f"Sync {self.dumpyfile_path} (keeps progress)", self.dumpyfile_path))
 
             for i in range(1, len(options) + 1):
                 print(f"    {i}. {options[i - 1][1]}")
@@ -86,7 +166,29 @@ class Dumpy:
                 self.selected_database = os.path.join(self.databases_directory, selected_database_name + ".db")
                 self.selected_dumpyfile = os.path.join(self.dumpyfiles_directory, selected_database_name + ".dumpy")
 
-            elif selection_type == "IMPORT":
+                # a database whose dumpyfile has changed since it was imported is brought up to date first
+                if os.path.exists(self.selected_dumpyfile) and not self.dumpyfile_is_unchanged():
+                    print(f"INFO: {self.selected_dumpyfile} has changed since it was imported.")
+                    self.sync_dumpyfile()
+
+            elif selection_type == "FEDERATE":
+                self.selected_databases = [
+                    os.path.join(self.databases_directory, ad) for ad in self.available_databases
+                ]
+
+                # each database whose dumpyfile has changed since it was imported is brought up to date first
+                for ad in self.available_databases:
+                    self.selected_database = os.path.join(self.databases_directory, ad)
+                    self.selected_dumpyfile = os.path.join(self.dumpyfiles_directory, ad.replace(".db", ".dumpy"))
+
+                    if os.path.exists(self.selected_dumpyfile) and not self.dumpyfile_is_unchanged():
+                        print(f"INFO: {self.selected_dumpyfile} has changed since it was imported.")
+                        self.sync_dumpyfile()
+
+            elif selection_type == "BANK":
+                self.selected_bank = os.path.join(self.databases_directory, selection[2])
+
+            elif selection_type in ["IMPORT", "SYNC"]:
 
                 if self.dumpyfile_path:
                     self.selected_database = os.path.join(
@@ -103,9 +205,32 @@ class Dumpy:
                     self.selected_database = os.path.join(self.databases_directory, selected_database_name + ".db")
                     self.selected_dumpyfile = os.path.join(self.dumpyfiles_directory, selected_database_name + ".dumpy")
 
-                self.import_dumpyfile()
+                if self.dumpyfile_is_unchanged():
+                    print(f"INFO: {self.selected_database} is already up to date with {self.selected_dumpyfile}.\n")
+                elif selection_type == "SYNC":
+                    self.sync_dumpyfile()
+                else:
+                    self.import_dumpyfile()
+
+        if self.selected_databases:
+            for d in self.selected_databases:
+                if not os.path.exists(d):
+                    print(f"ERROR: {d} was not found.")
+                    exit(1)
+
+            if len(set(os.path.abspath(d) for d in self.selected_databases)) > FederatedDatabase.max_databases:
+                print(f"ERROR: at most {FederatedDatabase.max_databases} databases can be studied at once.")
+                exit(1)
+
+        # an import that failed (e.g. of an invalid dumpyfile) has already said why
+        elif not self.selected_bank and not os.path.exists(self.selected_database):
+            exit(1)
+
+        if self.selected_bank:
+            self.load_questions_from_bank()
+        else:
+            self.load_questions_from_database()
 
-        self.load_questions_from_database()
         self.begin_braindump()
 
     def load_questions_from_database(self):
@@ -113,31 +238,59 @@ class Dumpy:
         Validates the existence of the local dumpy database and loads all questions/answers from it.
         """
 
-        questions, answers, metadata, conn = None, None, None, None
+        questions, metadata = [], None
 
-        try:
-            conn = sqlite3.connect(self.selected_database)
-            c = conn.cursor()
+        if self.scheduler_name not in [None, "leitner"]:
+            print(f"ERROR: `DUMPY_SCHEDULER` must be 'leitner' if it is set (not '{self.scheduler_name}').")
+            exit(1)
 
-            c.execute("SELECT * FROM metadata")
-            metadata = c.fetchone()
+        if self.search_query and self.scheduler_name:
+            print("ERROR: `DUMPY_SEARCH` can't be combined with `DUMPY_SCHEDULER`.")
+            exit(1)
 
-            c.execute("SELECT * FROM questions")
-            questions = c.fetchall()
+        if self.session_filter and self.scheduler_name:
+            print("ERROR: `DUMPY_SCHEDULER` picks its own questions, so it can't be combined with a session's filters.")
+            exit(1)
+
+        if self.selected_databases and (self.scheduler_name or self.search_query):
+            print("ERROR: `DUMPY_SCHEDULER` and `DUMPY_SEARCH` can't be used with several databases at once.")
+            exit(1)
 
-            c.execute("SELECT * FROM answers")
-            answers = c.fetchall()
+        if self.search_query and not SearchIndex.is_available():
+            print("ERROR: `DUMPY_SEARCH` needs an SQLite build with FTS5, which this Python doesn't have.")
+            exit(1)
 
-            conn.close()
+        try:
+            database = self.connect()
+            metadata = database.load_metadata()
+            self.scoreboard = Scoreboard(*database.load_overall_counts())
+            self.attempt_log = AttemptLog(database)
+
+            # a scheduler picks each question as it's needed, so nothing is loaded up front
+            if self.scheduler_name == "leitner":
+                self.scheduler = LeitnerScheduler(database)
+            else:
+                with instrumentation.span("load_questions"):
+                    # questions are selected in SQL, so only the ones that will be asked are ever loaded
+                    questions = database.load_questions(*self.session_filter.where(
+                        database,
+                        metadata[2],
+                        *(SearchIndex.where(database, self.search_query) if self.search_query else ())
+                    ))
 
         except sqlite3.Error as e:
-            print(e)
+            print(f"ERROR: {self.selected_database or 'the databases'} could not be loaded: {e}")
+            exit(1)
 
-        finally:
-            if conn:
-                conn.close()
+        if self.search_query and len(questions) == 0:
+            print(f"ERROR: no questions match '{self.search_query}'.")
+            exit(1)
+
+        if self.session_filter and len(questions) == 0:
+            print("ERROR: no questions match the session's filters.")
+            exit(1)
 
-        if len(questions) == 0 or len(answers) == 0:
+        if not self.scheduler and (len(questions) == 0 or not any(q.answers for q in questions)):
             print("ERROR: the database is empty and will need to be deleted and re-imported.")
             exit(1)
 
@@ -145,332 +298,830 @@ class Dumpy:
         self.shuffle_answers = metadata[1]
         self.shuffle_questions_by_weight = metadata[2]
 
-        answers = [
-            Answer(
-                answer_id=a[0],
-                question_id=a[1],
-                text=a[2],
-                is_correct=True if a[3] == 1 else False
-            )
-            for a in answers
-        ]
+        if self.scheduler:
+            self.questions = self.schedule_questions(self.scheduler)
+            return
 
-        self.questions.extend(
-            [
-                Question(
-                    question_id=q[0],
-                    text=q[1],
-                    postmortem=q[2],
-                    answers=[a for a in answers if int(a.question_id) == q[0]],
-                    attempted_count=q[3],
-                    correct_count=q[4],
-                    enabled=q[5]
-                )
-                for q in questions
-            ]
-        )
+        self.questions.extend(questions)
 
         if self.shuffle_answers:
             [q.shuffle_answers() for q in self.questions]
 
-        # idea here is to perform a simple weighted shuffle based on how often questions have been answered correctly.
-        # weights with '0' are ignored by the lambda, so do an initial shuffle prior to the weighted one.
         if self.shuffle_questions_by_weight:
+            self.shuffle_by_weight(self.questions, lambda q: (q.attempted_count, q.correct_count))
+        elif self.session_filter.sample:
             shuffle(self.questions)
 
-            self.questions.sort(
-                key=lambda q: (random.random() * (q.correct_count / q.attempted_count)) if q.attempted_count > 0 else 0
-            )
-
         for q in self.questions:
             q.assign_letters_to_answers()
 
-        self.questions = [q for q in self.questions if q.enabled == 1]
+    def load_questions_from_bank(self):
+        """
+        Sets up a read-only session on a compiled bank.
+
+        Questions are ordered using the bank's index alone, and each one is only read out of the bank when it's about
+        to be displayed, so a session starts without decoding the bank.  Answers count towards the session's grade, but
+        aren't recorded anywhere.
+        """
+
+        if self.scheduler_name:
+            print("ERROR: `DUMPY_SCHEDULER` can't be used with a compiled bank, which is read-only.")
+            exit(1)
+
+        if self.search_query:
+            print("ERROR: `DUMPY_SEARCH` can't be used with a compiled bank, which has no search index.")
+            exit(1)
+
+        try:
+            self.bank = CompiledBank(self.selected_bank)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}")
+            exit(1)
+
+        self.description, self.shuffle_answers, self.shuffle_questions_by_weight = self.bank.load_metadata()
+
+        index = self.bank.load_index()
+
+        self.scoreboard = Scoreboard(
+            sum(1 for e in index if e[2] > 0), sum(1 for e in index if e[3] > 0), sum(1 for e in index if e[2] == 0)
+        )
+
+        try:
+            index = self.session_filter.filter_index(index)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            exit(1)
+
+        if len(index) == 0 and self.session_filter:
+            print("ERROR: no questions match the session's filters.")
+            exit(1)
+
+        if len(index) == 0:
+            print("ERROR: the bank is empty and will need to be recompiled.")
+            exit(1)
+
+        if self.shuffle_questions_by_weight:
+            self.shuffle_by_weight(index, lambda e: (e[2], e[3]))
+        elif self.session_filter.sample:
+            shuffle(index)
+
+        if self.session_filter.sample:
+            index = index[:self.session_filter.sample]
+
+        self.questions = self.read_questions_from_bank([e[1] for e in index])
+
+    def read_questions_from_bank(self, offsets):
+        """
+        Yields the questions at some offsets in the bank, ready to be displayed.
+        """
+
+        for offset in offsets:
+            q = self.bank.load_question_at(offset)
+
+            if self.shuffle_answers:
+                q.shuffle_answers()
+
+            q.assign_letters_to_answers()
+
+            yield q
+
+    @staticmethod
+    def shuffle_by_weight(items, counts):
+        """
+        Shuffles some questions (or index entries) in place, weighted by how often they've been answered correctly;
+        `counts` returns an item's (attempted_count, correct_count).
+        """
+
+        def weight(item):
+            attempted_count, correct_count = counts(item)
+            return (random.random() * (correct_count / attempted_count)) if attempted_count > 0 else 0
+
+        # idea here is to perform a simple weighted shuffle based on how often questions have been answered correctly.
+        # weights with '0' are ignored by the lambda, so do an initial shuffle prior to the weighted one.
+        shuffle(items)
+        items.sort(key=weight)
+
+    def schedule_questions(self, scheduler):
+        """
+        Yields questions in the order that a scheduler picks them, ready to be displayed.
+        """
+
+        for q in scheduler:
+            if self.shuffle_answers:
+                q.shuffle_answers()
+
+            q.assign_letters_to_answers()
+
+            yield q
 
     def begin_braindump(self):
         """
         Starts the test.
+
+        Questions are fetched, and answers written, by a `SessionEngine` in the background, so the test itself never
+        waits on the database.  If the test is interrupted (e.g. with Ctrl-C), every answer given so far is still saved.
         """
 
-        current_session_correct_count = 0
-        current_session_displayed_count = 0
+        self.engine = self.start_engine()
 
-        for q in self.questions:
-            os.system('cls' if os.name == 'nt' else 'clear')
+        try:
+            for q in self.engine:
+                self.ask_question(q)
 
-            current_session_displayed_count += 1
-            valid_answer_choices = [a.letter.lower() for a in q.answers]
+        except KeyboardInterrupt:
+            print("\nINFO: the braindump was interrupted; every answer given has been saved.")
 
-            print(f"{q.text}\n")
+        finally:
+            self.disconnect()
+
+    def start_engine(self):
+        if self.bank:
+            # compiled banks are read-only, so there's nothing to write to
+            return SessionEngine(None, lambda database: self.questions)
+
+        if self.scheduler:
+            # each question is picked only once the answer to the previous one has been written
+            return SessionEngine(
+                self.selected_database,
+                lambda database: self.schedule_questions(LeitnerScheduler(database, self.scheduler.clock)),
+                self.commit_policy,
+                ahead=0,
+                session_id=self.attempt_log.session_id
+            )
 
-            for a in q.answers:
-                print(f"  {a.letter}. {a.text}")
+        return SessionEngine(
+            self.selected_databases or self.selected_database,
+            lambda database: self.questions,
+            self.commit_policy,
+            session_id=self.attempt_log.session_id if self.attempt_log else None,
+            database_class=FederatedDatabase if self.selected_databases else Database
+        )
 
-            print("")
+    def ask_question(self, q):
+        with instrumentation.span("render"):
+            self.render_question(q)
 
-            answer = None
+        displayed_at = time.perf_counter()
+        valid_answer_choices = [a.letter.lower() for a in q.answers]
 
-            while answer is None:
-                answer = input()
+        answer, result = None, None
 
-                all_inputs_are_valid = set(list(answer.lower())).issubset(valid_answer_choices)
+        while answer is None:
+            answer = input()
 
-                if all_inputs_are_valid:
-                    chosen_answer_ids = [a.answer_id for a in q.answers if a.letter.lower() in list(answer.lower())]
-                    correct_answers = " and ".join(a.letter for a in q.correct_answers)
-                    postmortem = f"\n{q.postmortem}\n" if q.postmortem else ""
+            all_inputs_are_valid = set(list(answer.lower())).issubset(valid_answer_choices)
 
-                    if sorted(chosen_answer_ids) == sorted(q.correct_answer_ids):
-                        print(f"{TerminalColors.OKGREEN}CORRECT{TerminalColors.ENDC}: {correct_answers}\n{postmortem}")
+            if all_inputs_are_valid:
+                chosen_mask = q.mask_letters(answer)
+                correct_answers = " and ".join(a.letter for a in q.correct_answers)
+                postmortem = f"\n{q.postmortem}\n" if q.postmortem else ""
 
-                        self.execute_sqlite([
-                            f"UPDATE questions SET attempted_count = attempted_count + 1 WHERE id = {q.question_id}",
-                            f"UPDATE questions SET correct_count = correct_count + 1 WHERE id = {q.question_id}",
-                        ])
+                if chosen_mask == q.correct_mask:
+                    result = (f"{TerminalColors.OKGREEN}CORRECT{TerminalColors.ENDC}: "
+                              f"{correct_answers}\n{postmortem}")
 
-                        current_session_correct_count += 1
+                    self.record_answer(q, True, chosen_mask, time.perf_counter() - displayed_at)
 
-                    else:
-                        if len(q.correct_answer_ids) != len(chosen_answer_ids):
+                else:
+                    if len(q.correct_answers) != bin(chosen_mask).count("1"):
 
-                            print(
-                                f"ERROR: please provide exactly {len(q.correct_answer_ids)} answer(s); eg. 'C', 'DA'."
-                            )
+                        self.renderer.write(
+                            f"ERROR: please provide exactly {len(q.correct_answers)} answer(s); eg. 'C', 'DA'."
+                        )
 
-                            answer = None
+                        answer = None
 
-                        else:
-                            if len(q.correct_answer_ids) == 1:
-                                print(f"{TerminalColors.WARNING}FALSE{TerminalColors.ENDC}: The correct answer "
+                    else:
+                        if len(q.correct_answers) == 1:
+                            result = (f"{TerminalColors.WARNING}FALSE{TerminalColors.ENDC}: The correct answer "
                                       f"is {q.correct_answers[0].letter}.\n{postmortem}")
-                            else:
-                                print(f"{TerminalColors.WARNING}FALSE{TerminalColors.ENDC}: The correct answers "
+                        else:
+                            result = (f"{TerminalColors.WARNING}FALSE{TerminalColors.ENDC}: The correct answers "
                                       f"are {correct_answers}.\n{postmortem}")
 
-                            self.execute_sqlite([
-                                f"UPDATE questions SET attempted_count = attempted_count + 1 WHERE id = {q.question_id}"
-                            ])
-                else:
-                    print(
-                        f"ERROR: the provided answer ('{answer.lower()}') is invalid.\n"
-                        f"Please provide answers from the above list; eg. 'C', 'DA'."
-                    )
-                    answer = None
+                        self.record_answer(q, False, chosen_mask, time.perf_counter() - displayed_at)
+            else:
+                self.renderer.write(
+                    f"ERROR: the provided answer ('{answer.lower()}') is invalid.\n"
+                    f"Please provide answers from the above list; eg. 'C', 'DA'."
+                )
+                answer = None
+
+        # the result and both grades are drawn together
+        self.renderer.write(
+            result,
+            self.format_current_session_grade(),
+            self.format_overall_grade(),
+            "",
+            "Press the enter key to continue."
+        )
+        input()
 
-            self.print_current_session_grade(current_session_correct_count, current_session_displayed_count)
-            self.print_overall_grade()
-            print("\nPress the enter key to continue.")
-            input()
+    def render_question(self, q):
+        self.renderer.frame(q.text, "", *[f"  {a.letter}. {a.text}" for a in q.answers], "")
 
-    def print_overall_grade(self):
-        overall_attempted_count = self.execute_sqlite(
-            ["SELECT COUNT(*) FROM questions WHERE attempted_count > 0"],
-            fetch_one=True
+    def format_overall_grade(self):
+        return (
+            f"OVERALL GRADE: {Scoreboard.grade(self.scoreboard.overall_percent)} ("
+            f"{self.scoreboard.overall_correct_at_least_once_count}/{self.scoreboard.overall_attempted_count} "
+            f"correct at-least-once, "
+            f"{self.scoreboard.unseen_count} unseen"
+            f")"
         )
 
-        overall_correct_at_least_once_count =self.execute_sqlite(
-            ["SELECT COUNT(*) FROM questions WHERE correct_count > 0"],
-            fetch_one=True
+    def format_current_session_grade(self):
+        return (
+            f"CURRENT GRADE: {Scoreboard.grade(self.scoreboard.current_session_percent)} ("
+            f"{self.scoreboard.current_session_correct_count}/{self.scoreboard.current_session_displayed_count} "
+            f"correct)"
         )
 
-        unseen_count = self.execute_sqlite(
-            ["SELECT COUNT(*) FROM questions WHERE attempted_count = 0"],
-            fetch_one=True
-        )
+    def import_dumpyfile(self):
+        """
+        Creates a local database from a .dumpy file.
+
+        The dumpyfile is validated in full first, so an existing database is only replaced by a dumpyfile that can be
+        imported.  It's then streamed in one question at a time and bulk-loaded with parameterized `executemany`
+        batches inside a single transaction, so memory stays flat and the database is only ever left fully imported.
+        Returns whether the import succeeded.
+        """
+
+        if not self.validate_dumpyfile():
+            return False
+
+        self.disconnect()
 
-        overall_percent = (overall_correct_at_least_once_count / overall_attempted_count) * 100
+        # recreate the database if it exists
+        for path in [self.selected_database, self.selected_database + "-wal", self.selected_database + "-shm"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+        print(f"INFO: Importing {self.selected_dumpyfile} into {self.selected_database} ...")
+
+        # the dumpyfile's size and mtime are taken before it's read, so that a change made during the import is noticed
+        source_stat = os.stat(self.selected_dumpyfile)
+        reader = DumpyfileReader(self.selected_dumpyfile)
+        question_rows, answer_rows = [], []
+        question_count, reported_percent = 0, 0
+        conn, imported, clusters = None, False, []
+        self.description, self.shuffle_answers, self.shuffle_questions_by_weight = self.read_metadata({})
+
+        try:
+            conn = sqlite3.connect(self.selected_database, isolation_level=None)
+            c = conn.cursor()
+
+            # the database is rebuilt from scratch if an import fails, so durability can be traded away for speed
+            c.execute("PRAGMA journal_mode = MEMORY")
+            c.execute("PRAGMA synchronous = OFF")
+            c.execute(f"PRAGMA cache_size = -{64 * 1024}")
+
+            c.execute("BEGIN")
+
+            for s in Database.schema + Database.tables:
+                c.execute(s)
+
+            for key, value in instrumentation.iterate("import.parse", reader):
+
+                if key == "metadata":
+                    self.description, self.shuffle_answers, self.shuffle_questions_by_weight = self.read_metadata(value)
+
+                elif key == "question":
+                    question_count += 1
+                    question_row, this_answer_rows = self.generate_question_rows(question_count, value)
+                    question_rows.append(question_row)
+                    answer_rows.extend(this_answer_rows)
+
+                if len(question_rows) >= self.import_batch_size:
+                    self.insert_question_rows(c, question_rows, answer_rows)
+                    question_rows, answer_rows = [], []
+
+                    if reader.percent_read >= reported_percent + 10:
+                        reported_percent = reader.percent_read - reader.percent_read % 10
+                        print(f"INFO: {reported_percent}% imported ({question_count} questions) ...")
+
+            self.insert_question_rows(c, question_rows, answer_rows)
+
+            # the metadata is written once the whole dumpyfile has been read, since it's optional
+            c.execute(
+                "INSERT INTO metadata "
+                "(description, shuffle_answers, shuffle_questions_by_weight, database_created_time) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    self.description,
+                    1 if self.shuffle_answers else 0,
+                    1 if self.shuffle_questions_by_weight else 0,
+                    str(datetime.datetime.now())
+                )
+            )
+
+            # indexes are cheaper to build once over the loaded data than to maintain row by row
+            with instrumentation.span("import.indexes"):
+                for s in Database.indexes:
+                    c.execute(s)
+
+            with instrumentation.span("import.search"):
+                SearchIndex.build(c)
+
+            if self.dedup_action:
+                with instrumentation.span("import.dedup"):
+                    clusters = DuplicateFinder().find_clusters(conn)
+
+                    if self.dedup_action != "report":
+                        DuplicateFinder.resolve(conn, clusters, self.dedup_action)
+
+            # the dumpyfile has been read in full by now, so its hash is complete
+            c.execute(
+                "UPDATE metadata SET source_hash = ?, source_size = ?, source_mtime = ?",
+                (reader.source_hash, source_stat.st_size, source_stat.st_mtime)
+            )
 
-        overall_grade = f"{TerminalColors.WARNING}F{TerminalColors.ENDC}"
+            with instrumentation.span("import.commit"):
+                c.execute("COMMIT")
 
-        if overall_percent >= 90:
-            overall_grade = f"{TerminalColors.OKGREEN}A{TerminalColors.ENDC}"
-        elif overall_percent >= 80:
-            overall_grade = f"{TerminalColors.OKGREEN}B{TerminalColors.ENDC}"
-        elif overall_percent >= 70:
-            overall_grade = f"{TerminalColors.OKGREEN}C{TerminalColors.ENDC}"
-        elif overall_percent >= 60:
-            overall_grade = f"{TerminalColors.WARNING}D{TerminalColors.ENDC}"
+            imported = True
+
+        except sqlite3.Error as e:
+            print(e)
+
+        finally:
+            if conn:
+                conn.close()
+
+        if imported and self.dedup_action:
+            print(
+                f"INFO: {len(clusters)} clusters of near-duplicate questions were found "
+                f"({sum(len(cluster) - 1 for cluster in clusters)} duplicates"
+                f"{', which have been disabled' if self.dedup_action != 'report' else ''})."
+            )
+
+        if imported:
+            print(f"INFO: {question_count} questions have been imported into {self.selected_database}.\n")
+
+        return imported
+
+    def validate_dumpyfile(self):
+        """
+        Validates the selected dumpyfile, printing its errors if it isn't valid.  Returns whether it's valid.
+        """
+
+        validator = DumpyfileValidator(max_errors=20)
+
+        with instrumentation.span("validate"):
+            validator.validate(self.selected_dumpyfile)
+
+        if validator.is_valid:
+            return True
+
+        for e in validator.errors:
+            print(f"    {e}")
+
+        if validator.error_count > len(validator.errors):
+            print(f"    ... and {validator.error_count - len(validator.errors)} more.")
 
         print(
-            f"OVERALL GRADE: {overall_grade} ("
-            f"{overall_correct_at_least_once_count}/{overall_attempted_count} correct at-least-once, "
-            f"{unseen_count} unseen"
-            f")"
+            f"ERROR: {self.selected_dumpyfile} has {validator.error_count} error(s), "
+            f"so {self.selected_database} has been left as it was."
         )
 
+        return False
+
     @staticmethod
-    def print_current_session_grade(current_session_correct_count, current_session_displayed_count):
-        current_session_percent = (current_session_correct_count / current_session_displayed_count) * 100
+    def read_metadata(metadata):
+        """
+        Returns a dumpyfile's (description, shuffle_answers, shuffle_questions_by_weight), with the defaults for any
+        that it leaves out.
+        """
+
+        return (
+            metadata.get("description"),
+            bool(metadata.get("shuffle_answers", False)),
+            bool(metadata.get("shuffle_questions_by_weight", True))
+        )
 
-        current_session_grade = f"{TerminalColors.WARNING}F{TerminalColors.ENDC}"
+    @staticmethod
+    def insert_question_rows(c, question_rows, answer_rows):
+        with instrumentation.span("import.insert"):
+            c.executemany(
+                "INSERT INTO questions "
+                "(id, text, postmortem, text_hash, content_hash, tag, attempted_count, correct_count, enabled) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, 0, 1)",
+                question_rows
+            )
 
-        if current_session_percent >= 90:
-            current_session_grade = f"{TerminalColors.OKGREEN}A{TerminalColors.ENDC}"
-        elif current_session_percent >= 80:
-            current_session_grade = f"{TerminalColors.OKGREEN}B{TerminalColors.ENDC}"
-        elif current_session_percent >= 70:
-            current_session_grade = f"{TerminalColors.OKGREEN}C{TerminalColors.ENDC}"
-        elif current_session_percent >= 60:
-            current_session_grade = f"{TerminalColors.WARNING}D{TerminalColors.ENDC}"
+            c.executemany(
+                "INSERT INTO answers (question_id, text, is_correct, content_hash) VALUES (?, ?, ?, ?)",
+                answer_rows
+            )
 
-        print(
-            f"CURRENT GRADE: {current_session_grade} ("
-            f"{current_session_correct_count}/{current_session_displayed_count} correct)"
+    @staticmethod
+    def hash_content(*values):
+        """
+        Hashes some values into a short, stable hex digest, used to tell whether questions and answers have changed.
+        """
+
+        return hashlib.sha1("\x1f".join(map(str, values)).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def generate_question_rows(question_id, this_question):
+        """
+        Generates the `questions` row and `answers` rows for a single question parsed out of a .dumpy file, coercing
+        values the same way that `Question` and `Answer` do.
+        """
+
+        postmortem = this_question["postmortem"] if "postmortem" in this_question else None
+        text, postmortem = str(this_question["text"]), str(postmortem) if postmortem else ""
+        tag = str(this_question["tag"]) if this_question.get("tag") is not None else None
+
+        answer_rows = []
+
+        for a in this_question["answers"]:
+            answer_text = str(a["text"])
+            answer_is_correct = 1 if a["is_correct"] is True or a["is_correct"] == "True" else 0
+
+            answer_rows.append(
+                (question_id, answer_text, answer_is_correct, Dumpy.hash_content(answer_text, answer_is_correct))
+            )
+
+        question_row = (
+            question_id,
+            text,
+            postmortem,
+            Dumpy.hash_content(text),
+            # untagged questions hash as they did before questions could be tagged
+            Dumpy.hash_content(text, postmortem, *[a[3] for a in answer_rows], *([tag] if tag is not None else [])),
+            tag
         )
 
-    def import_dumpyfile(self):
+        return question_row, answer_rows
+
+    @staticmethod
+    def hash_unhashed_rows(c):
         """
-        Creates a local database from a .dumpy file.
+        Hashes the questions and answers of a database imported before content was hashed, from the same values that
+        `generate_question_rows` hashes, so that they can be matched against its dumpyfile.  Returns the number of
+        questions hashed.
         """
 
-        sql_statements = []
+        c.executemany(
+            "UPDATE answers SET content_hash = ? WHERE id = ?",
+            [
+                (Dumpy.hash_content(text, 1 if is_correct == 1 else 0), answer_id)
+                for answer_id, text, is_correct in c.execute(
+                    "SELECT id, text, is_correct FROM answers WHERE content_hash IS NULL"
+                ).fetchall()
+            ]
+        )
 
-        # recreate the database if it exists
-        if os.path.exists(self.selected_database):
-            os.remove(self.selected_database)
+        rows = c.execute(
+            "SELECT q.id, q.text, q.postmortem, q.tag, a.content_hash "
+            "FROM questions q LEFT JOIN answers a ON a.question_id = q.id "
+            "WHERE q.content_hash IS NULL ORDER BY q.id, a.id"
+        ).fetchall()
+
+        question_hashes = []
+
+        for question_id, question_rows in groupby(rows, key=lambda r: r[0]):
+            question_rows = list(question_rows)
+            _, text, postmortem, tag, _ = question_rows[0]
+            answer_hashes = [r[4] for r in question_rows if r[4] is not None]
+
+            question_hashes.append((
+                Dumpy.hash_content(text),
+                Dumpy.hash_content(text, postmortem or "", *answer_hashes, *([tag] if tag is not None else [])),
+                question_id
+            ))
+
+        c.executemany("UPDATE questions SET text_hash = ?, content_hash = ? WHERE id = ?", question_hashes)
+
+        return len(question_hashes)
+
+    def sync_dumpyfile(self):
+        """
+        Brings an existing database up to date with its .dumpy file without rebuilding it.
+
+        Questions are matched by content hash, and only the rows that changed are written: new questions are inserted,
+        questions whose text is unchanged but whose postmortem or answers changed are updated in place, and questions
+        that are no longer in the dumpyfile are disabled and marked as removed (and enabled again if they're added back,
+        while questions disabled for any other reason, e.g. as duplicates, stay disabled).  Learner statistics are kept
+        for every question that was not removed.
+        A database imported by an earlier version is migrated, and its questions hashed, within the same transaction.
+        Returns whether the sync succeeded.
+        """
 
-        # create the database; any self.execute_sqlite() operation will create it if it doesn't already exist
         if not os.path.exists(self.selected_database):
-            print(f"INFO: Importing {self.dumpyfile_path} into {self.selected_database} ...")
-
-            self.execute_sqlite([
-                "CREATE TABLE metadata ("
-                "`description` TEXT,"
-                "`shuffle_answers` INTEGER DEFAULT 0,"
-                "`shuffle_questions_by_weight` INTEGER DEFAULT 1,"
-                "`database_created_time` TEXT"
-                ");",
-
-                "CREATE TABLE questions ("
-                "`id`	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,"
-                "`text`	TEXT NOT NULL,"
-                "`postmortem` TEXT,"
-                "`attempted_count` INTEGER DEFAULT 0,"
-                "`correct_count` INTEGER DEFAULT 0,"
-                "`enabled` INTEGER DEFAULT 1"
-                ");",
-
-                "CREATE TABLE answers ("
-                " `id`	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,"
-                " `question_id`	INTEGER NOT NULL,"
-                " `text`	TEXT NOT NULL,"
-                " `is_correct`	INTEGER NOT NULL DEFAULT 0"
-                ");"
-            ])
-
-            print(f"INFO: {self.selected_database} has been successfully created.\n")
-
-        with open(self.selected_dumpyfile, 'r') as dumpyfile:
-            dumpyfile_contents = json.loads(dumpyfile.read())
-
-        self.description = dumpyfile_contents["metadata"]["description"]
-        self.shuffle_answers = dumpyfile_contents["metadata"]["shuffle_answers"]
-        self.shuffle_questions_by_weight = dumpyfile_contents["metadata"]["shuffle_questions_by_weight"]
-
-        sql_statements.append(
-            f"INSERT INTO metadata VALUES ("
-            f"\"{dumpyfile_contents["metadata"]["description"]}\", "
-            f"\"{1 if dumpyfile_contents["metadata"]["shuffle_answers"] else 0}\", "
-            f"\"{1 if dumpyfile_contents["metadata"]["shuffle_questions_by_weight"] else 0}\", "
-            f"\"{datetime.datetime.now()}\""
-            f")"
-        )
+            return self.import_dumpyfile()
+
+        self.disconnect()
+
+        conn, synced = None, False
+        inserted_count, updated_count, disabled_count, unchanged_count = 0, 0, 0, 0
+
+        try:
+            conn = sqlite3.connect(self.selected_database, isolation_level=None)
+            c = conn.cursor()
+
+            if not self.validate_dumpyfile():
+                return False
+
+            print(f"INFO: Syncing {self.selected_dumpyfile} into {self.selected_database} ...")
 
-        for i in range(len(dumpyfile_contents["questions"])):
+            c.execute("BEGIN")
 
-            question = None
-            this_question = dumpyfile_contents["questions"][i]
+            # databases imported by earlier versions are brought up to date here, rather than re-imported, so that
+            # their learner statistics are kept
+            Database.migrate(conn)
 
-            try:
-                question = Question(
-                    question_id=i + 1,
-                    text=this_question["text"],
-                    postmortem=this_question["postmortem"] if "postmortem" in this_question else None,
-                    answers=[],
-                    attempted_count=0,
-                    correct_count=0,
-                    enabled=True
+            hashed_count = self.hash_unhashed_rows(c)
+
+            if hashed_count:
+                print(f"INFO: {hashed_count} questions in {self.selected_database} have been hashed for syncing.")
+
+            # questions may legitimately be duplicated, so each hash maps to every row that has it.  rows that are still
+            # in the dumpyfile are matched first, and a removed row only matches a question that has been added back
+            ids_by_content_hash, ids_by_text_hash = {}, {}
+            matched_ids = []
+
+            for question_id, text_hash, content_hash in c.execute(
+                "SELECT id, text_hash, content_hash FROM questions ORDER BY removed, id"
+            ).fetchall():
+                ids_by_content_hash.setdefault(content_hash, []).append(question_id)
+                ids_by_text_hash.setdefault(text_hash, []).append(question_id)
+
+            changed_questions = []
+            self.description, self.shuffle_answers, self.shuffle_questions_by_weight = self.read_metadata({})
+            source_stat = os.stat(self.selected_dumpyfile)
+            reader = DumpyfileReader(self.selected_dumpyfile)
+
+            for key, value in instrumentation.iterate("sync.parse", reader):
+
+                if key == "metadata":
+                    self.description, self.shuffle_answers, self.shuffle_questions_by_weight = self.read_metadata(value)
+
+                elif key == "question":
+                    question_row, answer_rows = self.generate_question_rows(None, value)
+                    matching_ids = ids_by_content_hash.get(question_row[4])
+
+                    if matching_ids:
+                        matched_ids.append(matching_ids.pop(0))
+                        unchanged_count += 1
+                    else:
+                        changed_questions.append((question_row, answer_rows))
+
+            unmatched_ids = set(i for ids in ids_by_content_hash.values() for i in ids)
+
+            c.execute(
+                "UPDATE metadata "
+                "SET description = ?, shuffle_answers = ?, shuffle_questions_by_weight = ?, "
+                "source_hash = ?, source_size = ?, source_mtime = ?",
+                (
+                    self.description,
+                    1 if self.shuffle_answers else 0,
+                    1 if self.shuffle_questions_by_weight else 0,
+                    reader.source_hash,
+                    source_stat.st_size,
+                    source_stat.st_mtime
                 )
+            )
+
+            # questions that are inserted or updated are re-indexed for search once they've all been written
+            indexed_ids = []
 
-            except Exception as e:
-                print(e)
+            for question_row, answer_rows in changed_questions:
+                question_id = next((i for i in ids_by_text_hash.get(question_row[3], []) if i in unmatched_ids), None)
 
-            for j in range(len(this_question["answers"])):
-                answer = this_question["answers"][j]
+                if question_id is None:
+                    c.execute(
+                        "INSERT INTO questions (text, postmortem, text_hash, content_hash, tag) VALUES (?, ?, ?, ?, ?)",
+                        question_row[1:]
+                    )
 
-                if "is_correct" not in answer:
-                    pass
+                    indexed_ids.append(c.lastrowid)
 
-                question.answers.append(
-                    Answer(
-                        answer_id=j + 1,
-                        question_id=i + 1,
-                        text=answer["text"],
-                        is_correct=answer["is_correct"]
+                    c.executemany(
+                        "INSERT INTO answers (question_id, text, is_correct, content_hash) VALUES (?, ?, ?, ?)",
+                        [(c.lastrowid,) + a[1:] for a in answer_rows]
                     )
+
+                    inserted_count += 1
+                    continue
+
+                unmatched_ids.remove(question_id)
+
+                c.execute(
+                    "UPDATE questions SET postmortem = ?, content_hash = ?, tag = ?, "
+                    "enabled = CASE WHEN removed = 1 THEN 1 ELSE enabled END, removed = 0 WHERE id = ?",
+                    (question_row[2], question_row[4], question_row[5], question_id)
                 )
 
-            self.questions.append(question)
+                # answers are loaded in id order, so they're diffed by position: a changed answer is updated in place,
+                # and keeps both its id and its letter
+                existing_answers = c.execute(
+                    "SELECT id, content_hash FROM answers WHERE question_id = ? ORDER BY id", (question_id,)
+                ).fetchall()
+
+                for (answer_id, content_hash), a in zip(existing_answers, answer_rows):
+                    if content_hash != a[3]:
+                        c.execute(
+                            "UPDATE answers SET text = ?, is_correct = ?, content_hash = ? WHERE id = ?",
+                            a[1:] + (answer_id,)
+                        )
+
+                c.executemany(
+                    "INSERT INTO answers (question_id, text, is_correct, content_hash) VALUES (?, ?, ?, ?)",
+                    [(question_id,) + a[1:] for a in answer_rows[len(existing_answers):]]
+                )
 
-        for q in self.questions:
+                c.executemany(
+                    "DELETE FROM answers WHERE id = ?", [(e[0],) for e in existing_answers[len(answer_rows):]]
+                )
+
+                indexed_ids.append(question_id)
+                updated_count += 1
 
-            question_id = q.question_id
-            question_text = q.text.replace(f"\'", "\'\'")
-            question_postmortem = q.postmortem.replace(f"\'", "\'\'") if q.postmortem else ""
-
-            sql_statements.append(
-                f"INSERT INTO questions VALUES ("
-                f"{question_id},"
-                f"'{question_text}',"
-                f"'{question_postmortem}',"
-                f"'0',"  # attempted_count
-                f"'0',"  # correct_count
-                f"'1'"  # enabled
-                f")"
+            c.executemany(
+                "UPDATE questions SET enabled = 0, removed = 1 WHERE id = ? AND enabled = 1",
+                [(i,) for i in unmatched_ids]
             )
+            disabled_count = c.rowcount
 
-            for i in range(len(q.answers)):
-                answer_question_id = q.answers[i].question_id
-                answer_text = q.answers[i].text.replace("'", "''")
-                answer_is_correct = 1 if q.answers[i].is_correct else 0
-
-                sql_statements.append(
-                    f"INSERT INTO answers (question_id, text, is_correct) VALUES ("
-                    f"{answer_question_id}, "
-                    f"'{answer_text}', "
-                    f"'{answer_is_correct}'"
-                    f")"
-                )
+            # questions that sync removed, and that have since been added back unchanged, are enabled again
+            c.executemany(
+                "UPDATE questions SET enabled = 1, removed = 0 WHERE id = ? AND removed = 1",
+                [(i,) for i in matched_ids]
+            )
 
-        self.execute_sqlite(sql_statements)
+            # databases that have never been searched are indexed in full when they first are
+            if SearchIndex.exists(c):
+                SearchIndex.build(c, indexed_ids)
 
-    def execute_sqlite(self, sql_statements, fetch_one=False):
+            c.execute("COMMIT")
+            synced = True
+
+        except sqlite3.Error as e:
+            print(e)
+
+        finally:
+            if conn:
+                conn.close()
+
+        if synced:
+            print(
+                f"INFO: {self.selected_database} has been synced ("
+                f"{inserted_count} inserted, {updated_count} updated, {disabled_count} disabled, "
+                f"{unchanged_count} unchanged).\n"
+            )
+
+        return synced
+
+    def dumpyfile_is_unchanged(self):
         """
-        Executes some SQL.
+        Checks whether the selected dumpyfile is still the one that the selected database was imported (or last synced)
+        from.
+
+        The dumpyfile's size and mtime are compared with those recorded at import first, so an untouched dumpyfile is
+        recognized without being read.  If they differ, the dumpyfile is hashed, and if only its mtime had changed,
+        the new mtime is recorded so that the next check is fast again.
         """
 
-        s, conn, results = "", None, []
+        if not os.path.exists(self.selected_database) or not os.path.exists(self.selected_dumpyfile):
+            return False
+
+        conn = None
 
         try:
             conn = sqlite3.connect(self.selected_database)
-            c = conn.cursor()
+            row = conn.execute("SELECT source_hash, source_size, source_mtime FROM metadata").fetchone()
 
-            for s in sql_statements:
-                c.execute(s)
+            if not row or not row[0]:
+                return False
 
-                if fetch_one:
-                    results.append(c.fetchone()[0])
+            source_hash, source_size, source_mtime = row
+            source_stat = os.stat(self.selected_dumpyfile)
 
-            conn.commit()
-            conn.close()
+            if source_stat.st_size == source_size and source_stat.st_mtime == source_mtime:
+                return True
 
-        except sqlite3.Error as e:
-            print(e, s)
+            if source_stat.st_size != source_size:
+                return False
+
+            if DumpyfileUtils.hash_dumpyfile(self.selected_dumpyfile) != source_hash:
+                return False
+
+            with conn:
+                conn.execute("UPDATE metadata SET source_mtime = ?", (source_stat.st_mtime,))
+
+            return True
+
+        # databases imported before their dumpyfile was recorded can't be vouched for
+        except sqlite3.Error:
+            return False
 
         finally:
             if conn:
                 conn.close()
 
+    def connect(self):
+        """
+        Returns the persistent connection to the selected database, opening it if necessary.
+        """
+
+        if self.database is None and self.selected_databases:
+            self.database = FederatedDatabase(self.selected_databases, self.commit_policy)
+
+        elif self.database is None:
+            self.database = Database(self.selected_database, self.commit_policy)
+
+        return self.database
+
+    def disconnect(self):
+        """
+        Commits any pending writes and closes the persistent connection.
+        """
+
+        if self.engine:
+            self.engine.close()
+            self.engine = None
+
+        if self.attempt_log:
+            self.attempt_log.close()
+            self.attempt_log = None
+
+        if self.database:
+            self.database.close()
+            self.database = None
+
+        if self.bank:
+            self.bank.close()
+            self.bank = None
+
+    def record_answer(self, question, is_correct, chosen_mask=None, latency=None):
+        """
+        Records an answer to a question, optionally with the answers chosen (as a mask over the question's answers) and
+        how many seconds it took.
+        """
+
+        # during a braindump, the answer is only queued here, and the engine times its write
+        with instrumentation.span("answer.queue" if self.engine else "answer.write"):
+            # a question studied from several databases at once is written back to the one that it came from
+            table, question_id = (
+                self.database.route(question.question_id) if self.database else ("questions", question.question_id)
+            )
+
+            sql_statements = [(
+                f"UPDATE {table} "
+                f"SET attempted_count = attempted_count + 1, correct_count = correct_count + ? "
+                f"WHERE id = ?",
+                (1 if is_correct else 0, question_id)
+            )]
+
+            if self.scheduler:
+                sql_statements.append(self.scheduler.generate_answer_sql(question, is_correct))
+
+            chosen_answer_ids = [a.answer_id for i, a in enumerate(question.answers) if (chosen_mask or 0) >> i & 1]
+
+            # during a braindump, answers are queued for the engine to write in the background
+            if self.engine:
+                self.engine.record(
+                    sql_statements, question.question_id, chosen_answer_ids, is_correct, latency, time.time()
+                )
+
+            else:
+                # compiled banks are read-only, so their answers only count towards the session
+                if not self.bank:
+                    self.execute_sqlite(sql_statements)
+
+                if self.attempt_log:
+                    self.attempt_log.record(question.question_id, chosen_answer_ids, is_correct, latency)
+
+            self.scoreboard.record(question, is_correct)
+            question.attempted_count += 1
+
+            if is_correct:
+                question.correct_count += 1
+
+    def execute_sqlite(self, sql_statements, fetch_one=False):
+        """
+        Executes some SQL over the persistent connection.  Each statement is either a string or a (sql, parameters)
+        tuple; statements that don't fetch are applied as a single write, and committed according to the commit policy.
+        """
+
+        s, results = "", []
+        sql_statements = [(s, ()) if isinstance(s, str) else s for s in sql_statements]
+
+        try:
+            database = self.connect()
+
+            if fetch_one:
+                with instrumentation.span("sql.fetch"):
+                    for s, parameters in sql_statements:
+                        results.append(database.fetch_one(s, parameters)[0])
+            else:
+                with instrumentation.span("sql.write"):
+                    database.write(sql_statements)
+
+        except sqlite3.Error as e:
+            print(e, s)
+
         if fetch_one:
 
             if len(results) == 1:
@@ -480,4 +1131,185 @@ class Dumpy:
 
 
 if __name__ == "__main__":
-    Dumpy()
+    parser = argparse.ArgumentParser(description="Issues multiple-choice quizzes in your terminal.")
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="Record timings of dumpy's hot paths, and write them to PATH as a Chrome trace when dumpy exits."
+    )
+
+    parser.add_argument(
+        "--search", metavar="QUERY",
+        help="Only ask the questions whose text, answers or postmortem contain every word of QUERY."
+    )
+
+    parser.add_argument(
+        "--no-banner-delay", action="store_true", help="Don't pause on the banner when dumpy starts."
+    )
+
+    parser.add_argument(
+        "--dedup", choices=["report", "disable", "merge"],
+        help="Look for near-duplicate questions when importing, and report them, or disable all but one of each."
+    )
+
+    parser.add_argument(
+        "--federate", nargs="+", metavar="DATABASE",
+        help="Study several databases together, as one bank; each answer is recorded in its question's own database."
+    )
+
+    parser.add_argument("--tag", help="Only ask the questions with this tag.")
+    parser.add_argument("--unseen", action="store_true", help="Only ask the questions that have never been attempted.")
+    parser.add_argument(
+        "--missed", type=int, metavar="N", help="Only ask the questions answered incorrectly more than N times."
+    )
+    parser.add_argument("--sample", type=int, metavar="K", help="Only ask (at most) K questions, picked at random.")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    grade_parser = subparsers.add_parser("grade", help="Grade recorded answer sheets against a database.")
+    grade_parser.add_argument("database", help="The database to grade against.")
+    grade_parser.add_argument("sheets", nargs="+", help="JSON or CSV files of question ids and the letters chosen.")
+    grade_parser.add_argument("--output", help="A file to write each sheet's results to, as JSON.")
+    grade_parser.add_argument("--dry-run", action="store_true", help="Don't record the graded answers.")
+
+    import_parser = subparsers.add_parser(
+        "import-all", help="Import every dumpyfile in a directory (or matching a glob) in parallel."
+    )
+    import_parser.add_argument(
+        "pattern", nargs="?", help="A directory or glob of .dumpy files (by default, the dumpyfiles directory)."
+    )
+    import_parser.add_argument("--jobs", type=int, help="The number of worker processes (by default, one per CPU).")
+    import_parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Re-import every dumpyfile from scratch, even if it hasn't changed (this discards progress)."
+    )
+
+    compile_parser = subparsers.add_parser(
+        "compile", help="Compile a dumpyfile or database into a read-only bank, for fast, shared sessions."
+    )
+    compile_parser.add_argument("source", help="The dumpyfile or database to compile.")
+    compile_parser.add_argument("output", help="The bank to write (e.g. databases/example.bank).")
+    compile_parser.add_argument("--compress", action="store_true", help="Compress each question with zlib.")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve braindumps from a database to many users over TCP.")
+    serve_parser.add_argument("database", help="The database to serve.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8750)
+
+    load_test_parser = subparsers.add_parser(
+        "loadtest", help="Measure the server's throughput and answer latency against a copy of a database."
+    )
+    load_test_parser.add_argument("database", help="The database to copy and serve.")
+    load_test_parser.add_argument("--users", type=int, default=100, help="The number of concurrent users.")
+    load_test_parser.add_argument("--answers", type=int, default=100, help="The number of answers per user.")
+
+    stats_parser = subparsers.add_parser("stats", help="Report on a database's history of answers.")
+    stats_parser.add_argument("database", help="The database to report on.")
+    stats_parser.add_argument("--days", type=float, default=30, help="How many days back to measure accuracy over.")
+    stats_parser.add_argument("--limit", type=int, default=10, help="How many questions to list.")
+    stats_parser.add_argument(
+        "--rebuild-counters", action="store_true",
+        help="Recompute each question's attempted/correct counts from the answer history first."
+    )
+
+    export_parser = subparsers.add_parser("export", help="Export a database to a dumpyfile.")
+    export_parser.add_argument("database", help="The database to export.")
+    export_parser.add_argument("output", help="The dumpyfile to write.")
+    export_parser.add_argument(
+        "--no-statistics", action="store_true", help="Leave out each question's attempted/correct counts and status."
+    )
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Export a database's progress alone, compactly, e.g. to merge it into another machine's."
+    )
+    snapshot_parser.add_argument("database", help="The database whose progress to export.")
+    snapshot_parser.add_argument("output", help="The snapshot to write.")
+    snapshot_parser.add_argument(
+        "--delta", action="store_true", help="Only export what has changed since the database was last synced."
+    )
+
+    merge_parser = subparsers.add_parser("merge", help="Merge progress snapshots into a database, in one transaction.")
+    merge_parser.add_argument("database", help="The database to merge progress into.")
+    merge_parser.add_argument("snapshots", nargs="+", help="The snapshots to merge.")
+
+    validate_parser = subparsers.add_parser(
+        "validate", help="Check dumpyfiles for errors (in parallel), without importing them."
+    )
+    validate_parser.add_argument("pattern", help="A .dumpy file, or a directory or glob of them.")
+    validate_parser.add_argument("--jobs", type=int, help="The number of worker processes (by default, one per CPU).")
+    validate_parser.add_argument("--max-errors", type=int, default=20, help="How many errors to list for each file.")
+
+    dedup_parser = subparsers.add_parser("dedup", help="Find (and optionally resolve) near-duplicate questions.")
+    dedup_parser.add_argument("database", help="The database to check.")
+    dedup_parser.add_argument(
+        "--threshold", type=float, default=0.8,
+        help="How similar two questions' text and answers must be to count as duplicates, from 0 to 1."
+    )
+    dedup_parser.add_argument(
+        "--action", choices=["report", "disable", "merge"], default="report",
+        help="Disable all but one question of each cluster, or also merge their statistics into the one kept."
+    )
+    dedup_parser.add_argument("--limit", type=int, default=20, help="How many clusters to list.")
+
+    args = parser.parse_args()
+
+    if args.search:
+        os.environ["DUMPY_SEARCH"] = args.search
+
+    for name, value in [("DUMPY_TAG", args.tag), ("DUMPY_MISSED", args.missed), ("DUMPY_SAMPLE", args.sample)]:
+        if value is not None:
+            os.environ[name] = str(value)
+
+    if args.federate:
+        os.environ["DUMPY_DATABASES"] = os.pathsep.join(args.federate)
+
+    if args.unseen:
+        os.environ["DUMPY_UNSEEN"] = "1"
+
+    if args.dedup:
+        os.environ["DUMPY_DEDUP"] = args.dedup
+
+    if args.no_banner_delay:
+        os.environ["DUMPY_BANNER_DELAY"] = "0"
+
+    if args.profile:
+        instrumentation.enable(args.profile)
+
+    dumpy_path = os.path.dirname(os.path.abspath(__file__))
+
+    if args.command == "grade":
+        BatchGrader.main(args.database, args.sheets, args.output, args.dry_run)
+    elif args.command == "import-all":
+        BulkImporter.main(
+            args.pattern or os.path.join(dumpy_path, "dumpyfiles"),
+            os.path.join(dumpy_path, "databases"),
+            args.jobs,
+            args.rebuild
+        )
+    elif args.command == "compile":
+        CompiledBank.main(args.source, args.output, args.compress)
+    elif args.command == "serve":
+        SessionServer.main(args.database, args.host, args.port)
+    elif args.command == "loadtest":
+        load_test(args.database, args.users, args.answers)
+    elif args.command == "stats":
+        AttemptLog.main(args.database, args.days, args.limit, args.rebuild_counters)
+    elif args.command == "snapshot":
+        ProgressSnapshot.export_main(args.database, args.output, args.delta)
+    elif args.command == "merge":
+        ProgressSnapshot.merge_main(args.database, args.snapshots)
+    elif args.command == "validate":
+        DumpyfileValidator.main(args.pattern, args.jobs, args.max_errors)
+    elif args.command == "dedup":
+        DuplicateFinder.main(args.database, args.threshold, args.action, args.limit)
+    elif args.command == "export":
+        if not os.path.exists(args.database):
+            print(f"ERROR: {args.database} was not found.")
+            exit(1)
+
+        exported_count = DumpyfileUtils.generate_dumpyfile_from_database(
+            args.database, args.output, include_statistics=not args.no_statistics
+        )
+
+        print(f"INFO: {exported_count} questions have been exported to {args.output}.")
+    else:
+        Dumpy()
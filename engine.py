@@ -0,0 +1,145 @@
+import queue
+import atexit
+import sqlite3
+import threading
+from database import Database
+from attempts import AttemptLog
+from instrumentation import instrumentation
+
+
+class SessionEngine:
+    """
+    Runs a session's database work on a background thread, so that the interactive loop only ever reads from memory.
+
+    The worker thread has its own connection to the database.  It prefetches the session's questions `ahead` at a time,
+    and applies each answer's writes (and logs the attempt) from a queue, in the order the answers were given.  A
+    session whose next question depends on the answers given so far (e.g. one picked by a scheduler) is run with
+    `ahead=0`, which fetches each question only once the answer to the previous one has been written.
+
+    Everything queued is written, and the connection closed, when the engine is closed, which happens when the session
+    ends, is interrupted, or the process exits.
+    """
+
+    FETCH = "fetch"
+    STOP = "stop"
+    END = "end"
+
+    def __init__(
+        self, database_path, source, commit_policy="answer", ahead=3, session_id=None, database_class=Database
+    ):
+        """
+        `source` is called on the worker thread with its database (or None, if there's no database to write to) and
+        returns the session's questions, ready to be displayed.  The database is opened with `database_class` (e.g. a
+        `FederatedDatabase`, whose `database_path` is a list of paths).
+        """
+
+        self.database_path = database_path
+        self.database_class = database_class
+        self.source = source
+        self.commit_policy = commit_policy
+        self.ahead = ahead
+        self.session_id = session_id
+
+        self.tasks = queue.Queue()
+        self.ready = queue.Queue()
+
+        # the worker is a daemon so that it never holds up the interpreter's exit; it's stopped (and flushed) at exit
+        self.thread = threading.Thread(target=self.run, name="dumpy-session", daemon=True)
+        self.thread.start()
+
+        for _ in range(max(ahead, 1)):
+            self.tasks.put(self.FETCH)
+
+        atexit.register(self.close)
+
+    def __iter__(self):
+        while True:
+            q = self.ready.get()
+
+            if q is self.END:
+                return
+
+            if isinstance(q, Exception):
+                raise q
+
+            if self.ahead:
+                self.tasks.put(self.FETCH)
+
+            yield q
+
+    def record(self, sql_statements, question_id, chosen_answer_ids, is_correct, latency, answered_at):
+        self.tasks.put((sql_statements, (question_id, chosen_answer_ids, is_correct, latency, answered_at)))
+
+        if not self.ahead:
+            self.tasks.put(self.FETCH)
+
+    def close(self):
+        """
+        Waits for everything queued to be written, and stops the worker.
+        """
+
+        if self.thread.is_alive():
+            self.tasks.put(self.STOP)
+            self.thread.join()
+
+        atexit.unregister(self.close)
+
+    def run(self):
+        database, attempt_log, exhausted = None, None, False
+
+        try:
+            if self.database_path:
+                database = self.database_class(self.database_path, self.commit_policy)
+                attempt_log = AttemptLog(database, self.session_id)
+
+                # both are closed here, on the thread that owns the connection, rather than at exit
+                atexit.unregister(database.close)
+                atexit.unregister(attempt_log.close)
+
+            questions = iter(self.source(database))
+
+            while True:
+                task = self.tasks.get()
+
+                if task is self.STOP:
+                    return
+
+                if task is self.FETCH:
+                    if exhausted:
+                        continue
+
+                    try:
+                        self.ready.put(next(questions))
+
+                    except StopIteration:
+                        exhausted = True
+                        self.ready.put(self.END)
+
+                    except Exception as e:
+                        exhausted = True
+                        self.ready.put(e)
+
+                    continue
+
+                sql_statements, attempt = task
+
+                if database:
+                    try:
+                        with instrumentation.span("answer.write"):
+                            with instrumentation.span("sql.write"):
+                                database.write(sql_statements)
+
+                            attempt_log.record(*attempt)
+
+                    except sqlite3.Error as e:
+                        print(e)
+
+        except Exception as e:
+            self.ready.put(e)
+
+        finally:
+            if attempt_log:
+                attempt_log.close()
+
+            if database:
+                database.close()
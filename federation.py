@@ -0,0 +1,109 @@
+import os
+from database import Database
+
+
+class FederatedDatabase(Database):
+    """
+    Several dumpy databases attached to one connection and studied as a single bank, without copying or re-importing
+    anything.
+
+    Each database is attached under its own schema (`source_0`, `source_1`, ...), and their questions are unioned into
+    a temporary `questions` view, so a session's questions are selected (and sampled) across every database with a
+    single query, with each database's own indexes serving the session's filters.  Questions are given federated ids,
+    `id * n + source` for n databases, which `route` maps back to the database that each answer (and attempt) is
+    written to.  Answers keep their own ids, which are only ever recorded in their own database.
+
+    SQLite attaches at most 10 databases to a connection (unless it was built to allow more).
+    """
+
+    max_databases = 10
+
+    def __init__(self, database_paths, commit_policy="answer"):
+        # the same database attached twice would have each of its questions asked twice
+        self.database_paths = list(dict.fromkeys(os.path.abspath(p) for p in database_paths))
+
+        if len(self.database_paths) > self.max_databases:
+            raise ValueError(
+                f"at most {self.max_databases} databases can be studied at once (not {len(self.database_paths)})."
+            )
+
+        self.schemas = [f"source_{i}" for i in range(len(self.database_paths))]
+
+        # the databases are attached to a connection of their own, so that none of them is treated differently
+        super().__init__(":memory:", commit_policy)
+
+        for schema, database_path in zip(self.schemas, self.database_paths):
+            self.conn.execute(f"ATTACH DATABASE ? AS {schema}", (database_path,))
+            self.conn.execute(f"PRAGMA {schema}.journal_mode = WAL")
+            self.conn.execute(f"PRAGMA {schema}.synchronous = NORMAL")
+
+            # databases imported by earlier versions are brought up to date, so that they can all be unioned
+            self.migrate(self.conn, schema)
+
+        self.conn.execute(
+            "CREATE TEMP VIEW questions AS " + " UNION ALL ".join(
+                f"SELECT id * {len(self.schemas)} + {source} AS id, {source} AS source, id AS local_id, text, "
+                f"postmortem, attempted_count, correct_count, enabled, tag FROM {schema}.questions"
+                for source, schema in enumerate(self.schemas)
+            )
+        )
+
+        self.commit()
+
+    def create(self, sql):
+        """
+        Creates a table or index in every database.
+        """
+
+        for schema in self.schemas:
+            self.conn.execute(sql.replace("IF NOT EXISTS ", f"IF NOT EXISTS {schema}.", 1))
+
+    def route(self, question_id, table="questions"):
+        return f"{self.schemas[question_id % len(self.schemas)]}.{table}", question_id // len(self.schemas)
+
+    def load_metadata(self):
+        """
+        Combines the databases' metadata: their descriptions are joined, and answers (or questions) are shuffled if any
+        of the databases shuffles them.
+        """
+
+        rows = [
+            self.fetch_one(f"SELECT description, shuffle_answers, shuffle_questions_by_weight FROM {schema}.metadata")
+            for schema in self.schemas
+        ]
+
+        rows = [r for r in rows if r]
+
+        return (
+            " + ".join(r[0] for r in rows if r[0]) or None,
+            max((r[1] for r in rows), default=0),
+            max((r[2] for r in rows), default=1)
+        )
+
+    def load_questions(self, where=None, parameters=()):
+        """
+        Selects the questions matching a `where` clause over the federated `questions` view in one query, then loads
+        them, and their answers, from each database in turn.
+        """
+
+        self.conn.execute("DROP TABLE IF EXISTS temp.federated_questions")
+        self.conn.execute(
+            "CREATE TEMP TABLE federated_questions AS SELECT source, local_id FROM questions" +
+            (f" WHERE {where}" if where else ""),
+            parameters if where else ()
+        )
+
+        questions = []
+
+        for source, schema in enumerate(self.schemas):
+            for q in super().load_questions(
+                "id IN (SELECT local_id FROM temp.federated_questions WHERE source = ?)", (source,), schema
+            ):
+                q.question_id = q.question_id * len(self.schemas) + source
+
+                for a in q.answers:
+                    a.question_id = q.question_id
+
+                questions.append(q)
+
+        return questions
@@ -0,0 +1,273 @@
+import os
+import csv
+import json
+import time
+import uuid
+import sqlite3
+from models import Question, Scoreboard
+from database import Database
+from attempts import AttemptLog
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class AnswerSheet:
+    """
+    A recorded set of responses, mapping question ids to the letters chosen for them (e.g. {12: "DA"}).  Letters refer
+    to each question's answers in the order they were imported, so "A" is always a question's first answer.
+    """
+
+    def __init__(self, name, responses):
+        self.name = name
+        self.responses = responses
+
+    @staticmethod
+    def read(path):
+        """
+        Reads the answer sheets in a file.
+
+        A .json file holds either one sheet ({"12": "DA", ...}) or a list of them.  A .csv file has rows of either
+        `question_id,letters` (one sheet), or `sheet,question_id,letters` (any number of sheets); a header row is
+        skipped.
+        """
+
+        name = os.path.basename(path)
+
+        if path.lower().endswith(".csv"):
+            sheets = {}
+
+            with open(path, newline='') as csv_file:
+                for row in csv.reader(csv_file):
+                    if len(row) < 2 or not row[-2].strip().isdigit():
+                        continue
+
+                    sheet_name = f"{name}#{row[0]}" if len(row) > 2 else name
+                    sheets.setdefault(sheet_name, {})[int(row[-2])] = row[-1].strip()
+
+            return [AnswerSheet(sheet_name, responses) for sheet_name, responses in sheets.items()]
+
+        with open(path) as json_file:
+            contents = json.loads(json_file.read())
+
+        if isinstance(contents, dict):
+            contents = [contents]
+
+        # keys that aren't question ids are kept as they are, so that they're graded as invalid
+        return [
+            AnswerSheet(
+                name if len(contents) == 1 else f"{name}#{i + 1}",
+                {int(k) if k.strip().isdigit() else k: v for k, v in c.items()}
+            )
+            for i, c in enumerate(contents)
+        ]
+
+
+class BatchGrader:
+    """
+    Grades answer sheets against a database in bulk, without any interaction.
+
+    Every question's correct answers are loaded once as a bitmask over its answers, so that grading a response is one
+    integer comparison.  Responses from every sheet are graded together, as arrays, with NumPy if it's installed (and
+    with plain Python otherwise).  The resulting statistics, and an attempt for every graded response (each sheet being
+    a session of its own), can then be written back in a single transaction.
+    """
+
+    def __init__(self, database_path, clock=time.time):
+        self.database_path = database_path
+        self.clock = clock
+
+        self.question_ids = []
+        self.correct_masks = []
+        self.answer_ids = []
+
+        conn = sqlite3.connect(database_path)
+
+        try:
+            question_id, mask, answer_ids = None, 0, []
+
+            for answer_question_id, answer_id, is_correct in conn.execute(
+                "SELECT question_id, id, is_correct FROM answers "
+                "WHERE question_id IN (SELECT id FROM questions WHERE enabled = 1) "
+                "ORDER BY question_id, id"
+            ):
+                if answer_question_id != question_id:
+                    if question_id is not None:
+                        self.add_question(question_id, mask, answer_ids)
+
+                    question_id, mask, answer_ids = answer_question_id, 0, []
+
+                mask |= (1 if is_correct else 0) << len(answer_ids)
+                answer_ids.append(answer_id)
+
+            if question_id is not None:
+                self.add_question(question_id, mask, answer_ids)
+
+        finally:
+            conn.close()
+
+        self.positions = {question_id: i for i, question_id in enumerate(self.question_ids)}
+
+        if numpy is not None:
+            self.correct_masks = numpy.array(self.correct_masks, dtype=numpy.int64)
+
+    def add_question(self, question_id, mask, answer_ids):
+        self.question_ids.append(question_id)
+        self.correct_masks.append(mask)
+        self.answer_ids.append(answer_ids)
+
+    def grade(self, sheets):
+        """
+        Grades some answer sheets, returning a result for each sheet, the attempted and correct counts to add to each
+        question, and the attempts to log for each graded response.  Responses to unknown (or disabled) questions, or
+        with letters that don't name one of a question's answers, are counted as invalid and otherwise ignored.
+        """
+
+        sheet_indexes, positions, chosen_masks = [], [], []
+        invalid_counts = [0] * len(sheets)
+
+        for i, sheet in enumerate(sheets):
+            for question_id, letters in sheet.responses.items():
+                position = self.positions.get(question_id)
+
+                if position is None or not isinstance(letters, str) or not letters or not letters.isalpha():
+                    invalid_counts[i] += 1
+                    continue
+
+                chosen_mask = Question.mask_letters(letters)
+
+                if chosen_mask >> len(self.answer_ids[position]):
+                    invalid_counts[i] += 1
+                    continue
+
+                sheet_indexes.append(i)
+                positions.append(position)
+                chosen_masks.append(chosen_mask)
+
+        if numpy is not None:
+            sheet_indexes = numpy.array(sheet_indexes, dtype=numpy.int64)
+            positions = numpy.array(positions, dtype=numpy.int64)
+
+            correct = self.correct_masks[positions] == numpy.array(chosen_masks, dtype=numpy.int64)
+
+            answered_counts = numpy.bincount(sheet_indexes, minlength=len(sheets)).tolist()
+            correct_counts = numpy.bincount(sheet_indexes, weights=correct, minlength=len(sheets)).astype(int).tolist()
+
+            attempted_deltas = numpy.bincount(positions, minlength=len(self.question_ids))
+            correct_deltas = numpy.bincount(positions, weights=correct, minlength=len(self.question_ids)).astype(int)
+            touched = numpy.nonzero(attempted_deltas)[0]
+
+            question_deltas = [
+                (int(attempted_deltas[p]), int(correct_deltas[p]), self.question_ids[p]) for p in touched
+            ]
+
+            correct = correct.tolist()
+
+        else:
+            answered_counts, correct_counts = [0] * len(sheets), [0] * len(sheets)
+            deltas, correct = {}, []
+
+            for sheet_index, position, chosen_mask in zip(sheet_indexes, positions, chosen_masks):
+                is_correct = self.correct_masks[position] == chosen_mask
+                correct.append(is_correct)
+
+                answered_counts[sheet_index] += 1
+                correct_counts[sheet_index] += is_correct
+
+                attempted_delta, correct_delta = deltas.get(position, (0, 0))
+                deltas[position] = (attempted_delta + 1, correct_delta + is_correct)
+
+            question_deltas = [(a, c, self.question_ids[p]) for p, (a, c) in sorted(deltas.items())]
+
+        results = [
+            {
+                "sheet": sheet.name,
+                "answered": answered_counts[i],
+                "correct": correct_counts[i],
+                "invalid": invalid_counts[i],
+                "percent": round(correct_counts[i] * 100 / answered_counts[i], 2) if answered_counts[i] else 0.0
+            }
+            for i, sheet in enumerate(sheets)
+        ]
+
+        session_ids = [uuid.uuid4().hex for _ in sheets]
+        answered_at = self.clock()
+
+        attempts = [
+            (
+                session_ids[sheet_index],
+                self.question_ids[position],
+                answered_at,
+                ",".join(str(a) for j, a in enumerate(self.answer_ids[position]) if chosen_mask >> j & 1),
+                1 if is_correct else 0,
+                None
+            )
+            for sheet_index, position, chosen_mask, is_correct in zip(sheet_indexes, positions, chosen_masks, correct)
+        ]
+
+        return results, question_deltas, attempts
+
+    def record(self, question_deltas, attempts):
+        """
+        Adds graded attempts to each question's statistics, and to the attempt log that they're a cache of, in a single
+        transaction.
+        """
+
+        conn = sqlite3.connect(self.database_path)
+
+        try:
+            with conn:
+                # databases imported before the log existed are given it here
+                Database.migrate(conn)
+
+                for s in AttemptLog.indexes:
+                    conn.execute(s)
+
+                conn.executemany(
+                    "INSERT INTO attempts "
+                    "(session_id, question_id, answered_at, chosen_answer_ids, is_correct, latency) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    attempts
+                )
+
+                conn.executemany(
+                    "UPDATE questions "
+                    "SET attempted_count = attempted_count + ?, correct_count = correct_count + ? "
+                    "WHERE id = ?",
+                    question_deltas
+                )
+
+        finally:
+            conn.close()
+
+    @staticmethod
+    def main(database_path, sheet_paths, output_path=None, dry_run=False):
+        """
+        Grades every sheet in some files, prints the results, and records them unless this is a dry run.
+        """
+
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        sheets = [sheet for path in sheet_paths for sheet in AnswerSheet.read(path)]
+
+        grader = BatchGrader(database_path)
+        results, question_deltas, attempts = grader.grade(sheets)
+
+        for r in results:
+            print(
+                f"{r['sheet']}: {Scoreboard.grade(r['percent'])} "
+                f"({r['correct']}/{r['answered']} correct"
+                f"{', ' + str(r['invalid']) + ' invalid' if r['invalid'] else ''})"
+            )
+
+        if output_path:
+            with open(output_path, "w") as output_file:
+                output_file.write(json.dumps(results, indent=4))
+
+        if not dry_run:
+            grader.record(question_deltas, attempts)
+            print(f"INFO: {sum(d[0] for d in question_deltas)} graded answers have been recorded in {database_path}.")
@@ -0,0 +1,154 @@
+import io
+import os
+import glob
+import time
+import sqlite3
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def import_dumpyfile(dumpyfile_path, database_path, rebuild=False):
+    """
+    Brings one database up to date with its .dumpy file, in a worker process, and returns what happened to it.
+
+    A database that is up to date with its dumpyfile is skipped.  A database that already exists is synced,
+    so that learner statistics are kept, unless `rebuild` is set; otherwise the dumpyfile is imported from scratch.
+    """
+
+    # imported here rather than at the top, since dumpy imports this module
+    from dumpy import Dumpy
+
+    start = time.perf_counter()
+    result = {"dumpyfile": dumpyfile_path, "database": database_path, "status": None, "questions": 0, "error": None}
+    output = io.StringIO()
+
+    try:
+        dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+        if not rebuild and dumpy.dumpyfile_is_unchanged():
+            result["status"] = "skipped"
+        else:
+            with contextlib.redirect_stdout(output):
+                if os.path.exists(database_path) and not rebuild:
+                    result["status"] = "synced" if dumpy.sync_dumpyfile() else "failed"
+                else:
+                    result["status"] = "imported" if dumpy.import_dumpyfile() else "failed"
+
+            if result["status"] == "failed":
+                # the import or sync has already reported its own error, as the last thing it printed
+                result["error"] = ([line for line in output.getvalue().splitlines() if line] or ["unknown error"])[-1]
+
+    except Exception as e:
+        result["status"], result["error"] = "failed", f"{type(e).__name__}: {e}"
+
+    if result["status"] != "failed":
+        result["questions"] = BulkImporter.count_questions(database_path)
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+
+    return result
+
+
+class BulkImporter:
+    """
+    Imports many .dumpy files at once, each into its own database, with a pool of worker processes.
+
+    Every worker parses and writes a separate file, so imports run in parallel without contending for a database.
+    Dumpyfiles whose contents haven't changed since they were last imported are skipped, and a failure in one file is
+    reported without affecting the others.
+    """
+
+    def __init__(self, databases_directory, jobs=None, rebuild=False):
+        self.databases_directory = databases_directory
+        self.jobs = jobs or os.cpu_count() or 1
+        self.rebuild = rebuild
+
+    @staticmethod
+    def find_dumpyfiles(pattern):
+        """
+        Returns the .dumpy files matching a glob, or every .dumpy file in a directory.
+        """
+
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.dumpy")
+
+        return sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+
+    @staticmethod
+    def count_questions(database_path):
+        conn = sqlite3.connect(database_path)
+
+        try:
+            return conn.execute("SELECT COUNT(*) FROM questions WHERE enabled = 1").fetchone()[0]
+
+        finally:
+            conn.close()
+
+    def database_path(self, dumpyfile_path):
+        return os.path.join(self.databases_directory, os.path.basename(dumpyfile_path.replace(".dumpy", "")) + ".db")
+
+    def run(self, dumpyfile_paths, report=None):
+        """
+        Imports some dumpyfiles, calling `report` with each result as it finishes, and returns every result in the
+        order the dumpyfiles were given.
+        """
+
+        if not os.path.exists(self.databases_directory):
+            os.makedirs(self.databases_directory)
+
+        results = [None] * len(dumpyfile_paths)
+
+        with ProcessPoolExecutor(max_workers=min(self.jobs, max(len(dumpyfile_paths), 1))) as executor:
+            futures = {
+                executor.submit(import_dumpyfile, p, self.database_path(p), self.rebuild): i
+                for i, p in enumerate(dumpyfile_paths)
+            }
+
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+                if report:
+                    report(results[futures[future]])
+
+        return results
+
+    @staticmethod
+    def main(pattern, databases_directory, jobs=None, rebuild=False):
+        """
+        Imports every dumpyfile matching a glob (or in a directory), and prints how each one went.
+        """
+
+        dumpyfile_paths = BulkImporter.find_dumpyfiles(pattern)
+
+        if not dumpyfile_paths:
+            print(f"ERROR: no .dumpy files were found in {pattern}.")
+            exit(1)
+
+        importer = BulkImporter(databases_directory, jobs, rebuild)
+
+        print(
+            f"INFO: Importing {len(dumpyfile_paths)} dumpyfiles into {databases_directory} ({importer.jobs} jobs) ..."
+        )
+
+        def report(r):
+            if r["status"] == "failed":
+                print(f"ERROR: {r['dumpyfile']} failed: {r['error']}")
+            else:
+                print(f"INFO: {r['dumpyfile']} {r['status']} ({r['questions']} questions, {r['seconds']}s).")
+
+        start = time.perf_counter()
+        results = importer.run(dumpyfile_paths, report)
+
+        counts = {}
+
+        for r in results:
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+
+        print(
+            f"INFO: {len(results)} dumpyfiles processed in {round(time.perf_counter() - start, 2)}s ("
+            + ", ".join(f"{counts.get(s, 0)} {s}" for s in ["imported", "synced", "skipped", "failed"])
+            + ")."
+        )
+
+        if counts.get("failed"):
+            exit(1)
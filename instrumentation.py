@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+
+class Span:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.instrumentation.record(self.name, self.start, time.perf_counter())
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Instrumentation:
+    """
+    Opt-in timing instrumentation for dumpy's hot paths.
+
+    When enabled (with the `DUMPY_PROFILE` environment variable or the `--profile` option), every span records its wall
+    time, and on exit the spans are written to a file in the Chrome trace event format, which can be opened with
+    chrome://tracing or https://ui.perfetto.dev.  The file also carries a `summary` of the count and total time of each
+    kind of span.  Only the first `max_events` spans are kept as trace events; all of them count towards the summary.
+
+    When disabled, `span()` hands back a shared no-op context manager, so instrumented code costs next to nothing.
+    """
+
+    def __init__(self, max_events=100000):
+        self.enabled = False
+        self.output_path = None
+        self.max_events = max_events
+
+        self.origin = time.perf_counter()
+        self.events = []
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def enable(self, output_path):
+        if not self.enabled:
+            atexit.register(self.write)
+
+        self.enabled = True
+        self.output_path = output_path
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+
+        return Span(self, name)
+
+    def iterate(self, name, iterable):
+        """
+        Times each step of an iterable (e.g. each question parsed out of a dumpyfile) as a span.
+        """
+
+        if not self.enabled:
+            return iterable
+
+        return self.iterate_timed(name, iterable)
+
+    def iterate_timed(self, name, iterable):
+        iterator = iter(iterable)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+            self.record(name, start, time.perf_counter())
+
+            yield item
+
+    def record(self, name, start, end):
+        with self.lock:
+            count, seconds = self.totals.get(name, (0, 0.0))
+            self.totals[name] = (count + 1, seconds + end - start)
+
+            if len(self.events) < self.max_events:
+                self.events.append({
+                    "name": name,
+                    "ph": "X",
+                    "ts": round((start - self.origin) * 1000000, 3),
+                    "dur": round((end - start) * 1000000, 3),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident()
+                })
+
+    def summary(self):
+        return {
+            name: {
+                "count": count,
+                "seconds": round(seconds, 6),
+                "mean_microseconds": round(seconds * 1000000 / count, 3)
+            }
+            for name, (count, seconds) in sorted(self.totals.items())
+        }
+
+    def write(self):
+        with self.lock:
+            trace = {"traceEvents": self.events, "displayTimeUnit": "ms", "summary": self.summary()}
+
+        with open(self.output_path, "w") as output_file:
+            output_file.write(json.dumps(trace))
+
+        print(f"INFO: timings have been written to {self.output_path}.")
+
+
+NULL_SPAN = NullSpan()
+
+instrumentation = Instrumentation()
+
+if "DUMPY_PROFILE" in os.environ:
+    instrumentation.enable(os.environ["DUMPY_PROFILE"])
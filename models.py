@@ -1,3 +1,4 @@
+import sys
 from random import shuffle
 
 """
@@ -13,6 +14,15 @@ class Metadata:
 
 
 class Question:
+    """
+    A question and its answers.  Which answers are correct is worked out up front, as a bitmask over the positions of
+    the answers, so grading a response is a single comparison.
+    """
+
+    __slots__ = [
+        "question_id", "text", "answers", "postmortem", "attempted_count", "correct_count", "enabled", "correct_mask"
+    ]
+
     def __init__(self, text, answers, postmortem, attempted_count, correct_count, enabled, question_id=None):
         self.question_id = int(question_id) if question_id else None
         self.text = str(text)
@@ -22,13 +32,22 @@ class Question:
         self.correct_count = correct_count
         self.enabled = enabled
 
+        self.update_correct_mask()
+
     @property
     def correct_answers(self):
-        return [a for a in self.answers if a.is_correct]
+        return [self.answers[i] for i in range(len(self.answers)) if self.correct_mask >> i & 1]
 
     @property
     def correct_answer_ids(self):
-        return [a.answer_id for a in self.answers if a.is_correct]
+        return [a.answer_id for a in self.correct_answers]
+
+    def update_correct_mask(self):
+        """
+        Works out the correct answers again; this must be called whenever `answers` is changed or reordered.
+        """
+
+        self.correct_mask = sum(1 << i for i in range(len(self.answers)) if self.answers[i].is_correct)
 
     def assign_letters_to_answers(self):
         for i in range(len(self.answers)):
@@ -36,11 +55,31 @@ class Question:
 
     def shuffle_answers(self):
         shuffle(self.answers)
+        self.update_correct_mask()
+
+    @staticmethod
+    def mask_letters(letters):
+        """
+        Converts some answer letters (e.g. "DA") into a bitmask over the positions of the answers they refer to.
+        """
+
+        mask = 0
+
+        for letter in letters.upper():
+            mask |= 1 << (ord(letter) - 65)
+
+        return mask
+
+    def grade(self, letters):
+        return self.mask_letters(letters) == self.correct_mask
 
 
 class Answer:
+    __slots__ = ["text", "letter", "is_correct", "answer_id", "question_id"]
+
     def __init__(self, text, letter=None, is_correct=False, answer_id=None, question_id=None):
-        self.text = str(text)
+        # answer texts repeat a lot across a bank (e.g. "True", "None of the above"), so only keep one copy of each
+        self.text = sys.intern(str(text))
         self.letter = str(letter) if letter else None
 
         if is_correct is not None:
@@ -53,6 +92,61 @@ class Answer:
         self.question_id = int(question_id) if question_id else None
 
 
+class Scoreboard:
+    """
+    Overall and current-session grades, kept up to date in memory as questions are answered.
+
+    The overall counts are seeded once from the database when a session starts, so grading after each answer doesn't
+    have to count anything.
+    """
+
+    def __init__(self, overall_attempted_count=0, overall_correct_at_least_once_count=0, unseen_count=0):
+        self.overall_attempted_count = overall_attempted_count
+        self.overall_correct_at_least_once_count = overall_correct_at_least_once_count
+        self.unseen_count = unseen_count
+
+        self.current_session_correct_count = 0
+        self.current_session_displayed_count = 0
+
+    def record(self, question, is_correct):
+        """
+        Records an answer to a question, whose counts must not yet include the answer.
+        """
+
+        if question.attempted_count == 0:
+            self.overall_attempted_count += 1
+            self.unseen_count -= 1
+
+        if is_correct and question.correct_count == 0:
+            self.overall_correct_at_least_once_count += 1
+
+        self.current_session_displayed_count += 1
+
+        if is_correct:
+            self.current_session_correct_count += 1
+
+    @property
+    def overall_percent(self):
+        return (self.overall_correct_at_least_once_count / self.overall_attempted_count) * 100
+
+    @property
+    def current_session_percent(self):
+        return (self.current_session_correct_count / self.current_session_displayed_count) * 100
+
+    @staticmethod
+    def grade(percent):
+        if percent >= 90:
+            return f"{TerminalColors.OKGREEN}A{TerminalColors.ENDC}"
+        elif percent >= 80:
+            return f"{TerminalColors.OKGREEN}B{TerminalColors.ENDC}"
+        elif percent >= 70:
+            return f"{TerminalColors.OKGREEN}C{TerminalColors.ENDC}"
+        elif percent >= 60:
+            return f"{TerminalColors.WARNING}D{TerminalColors.ENDC}"
+
+        return f"{TerminalColors.WARNING}F{TerminalColors.ENDC}"
+
+
 class TerminalColors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -0,0 +1,279 @@
+import os
+import zlib
+import struct
+import sqlite3
+from database import Database
+
+
+class ProgressSnapshot:
+    """
+    A compact snapshot of a database's learner progress (each question's attempted count, correct count and enabled
+    flag) without any of the bank itself, for carrying progress between machines.
+
+    Questions are keyed by their content hash rather than by their id, so a snapshot can be merged into any database
+    imported from the same dumpyfile, however its ids were assigned.  Questions whose content is duplicated in a bank
+    are told apart by their order among the questions that share their hash.
+
+    A full snapshot holds every question that has any progress.  A delta snapshot holds only what has changed since the
+    last snapshot was taken from (or merged into) the database, as increments, so that progress can be synced back and
+    forth between machines without being counted twice; what was last synced is kept in a `synced_progress` table.
+
+    The file is laid out as:
+
+        header      magic, version, flags, and entry count
+        entries     zlib-compressed, one fixed-size entry per question: its content hash, its order among the questions
+                    that share its hash, its attempted and correct counts (or their increments), and its state
+    """
+
+    magic = b"DMPP"
+    version = 1
+
+    DELTA = 1
+
+    # an entry's state: whether the question is enabled, and whether that should be applied
+    ENABLED = 1
+    ENABLED_CHANGED = 2
+
+    header = struct.Struct("<4sHHI")
+    entry = struct.Struct("<8sHiiB")
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS synced_progress ("
+        "`question_id` INTEGER NOT NULL PRIMARY KEY,"
+        "`attempted_count` INTEGER NOT NULL,"
+        "`correct_count` INTEGER NOT NULL,"
+        "`enabled` INTEGER NOT NULL"
+        ")"
+    )
+
+    index = "CREATE INDEX IF NOT EXISTS `questions_content_hash` ON questions (`content_hash`, `id`)"
+
+    # every question's progress, alongside what was last synced (a question never synced was synced as imported)
+    progress_sql = (
+        "SELECT q.id, q.content_hash, "
+        "(SELECT COUNT(*) FROM questions d WHERE d.content_hash = q.content_hash AND d.id < q.id), "
+        "q.attempted_count, q.correct_count, q.enabled, "
+        "COALESCE(s.attempted_count, 0), COALESCE(s.correct_count, 0), COALESCE(s.enabled, 1) "
+        "FROM questions q LEFT JOIN synced_progress s ON s.question_id = q.id "
+        "WHERE q.content_hash IS NOT NULL"
+    )
+
+    def __init__(self, entries, delta=False):
+        self.entries = entries
+        self.delta = delta
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def prepare(database):
+        """
+        Gives a database the table and index that snapshots need.
+        """
+
+        if database.fetch_one("SELECT 1 FROM questions WHERE content_hash IS NULL LIMIT 1"):
+            raise ValueError(f"{database.database_path} predates content hashes, so it must be synced first.")
+
+        database.create(ProgressSnapshot.schema)
+        database.create(ProgressSnapshot.index)
+        database.commit()
+
+    @classmethod
+    def take(cls, database, delta=False):
+        """
+        Takes a snapshot of a database's progress, and records it as synced, in a transaction that's left open for the
+        caller to commit once the snapshot has been written (or to roll back if it couldn't be).
+        """
+
+        cls.prepare(database)
+
+        # nothing can be answered between the snapshot being taken and it being recorded as synced
+        database.execute("BEGIN IMMEDIATE")
+
+        if delta:
+            rows = database.fetch_all(
+                cls.progress_sql + " AND (q.attempted_count, q.correct_count, q.enabled) IS NOT "
+                "(COALESCE(s.attempted_count, 0), COALESCE(s.correct_count, 0), COALESCE(s.enabled, 1))"
+            )
+        else:
+            rows = database.fetch_all(
+                cls.progress_sql + " AND (q.attempted_count > 0 OR q.correct_count > 0 OR q.enabled = 0)"
+            )
+
+        entries = []
+
+        for _, content_hash, order, attempted_count, correct_count, enabled, \
+                synced_attempted_count, synced_correct_count, synced_enabled in rows:
+
+            if delta:
+                attempted_count -= synced_attempted_count
+                correct_count -= synced_correct_count
+                enabled_changed = enabled != synced_enabled
+            else:
+                enabled_changed = enabled == 0
+
+            entries.append((
+                bytes.fromhex(content_hash),
+                order,
+                attempted_count,
+                correct_count,
+                (cls.ENABLED if enabled else 0) | (cls.ENABLED_CHANGED if enabled_changed else 0)
+            ))
+
+        database.execute_many(
+            "INSERT OR REPLACE INTO synced_progress VALUES (?, ?, ?, ?)",
+            [(r[0], r[3], r[4], r[5]) for r in rows]
+        )
+
+        # entries are written in hash order, so the same progress always makes the same snapshot
+        return cls(sorted(entries), delta)
+
+    def merge(self, database):
+        """
+        Merges the snapshot into a database, within the caller's transaction.
+
+        A delta snapshot's increments are added to the database's counts.  A full snapshot's counts are taken wherever
+        they're higher than the database's, so merging the same one twice changes nothing.  What's merged is recorded
+        as synced, so that it isn't sent back in the database's next delta.  Returns the number of entries applied, and
+        the number of entries whose questions aren't in the database.
+        """
+
+        updates, skipped_count = [], 0
+
+        for content_hash, order, attempted_count, correct_count, state in self.entries:
+            row = database.fetch_one(
+                "SELECT q.id, q.attempted_count, q.correct_count, q.enabled, "
+                "COALESCE(s.attempted_count, 0), COALESCE(s.correct_count, 0), COALESCE(s.enabled, 1) "
+                "FROM questions q LEFT JOIN synced_progress s ON s.question_id = q.id "
+                "WHERE q.content_hash = ? ORDER BY q.id LIMIT 1 OFFSET ?",
+                (content_hash.hex(), order)
+            )
+
+            if row is None:
+                skipped_count += 1
+                continue
+
+            question_id, current_attempted_count, current_correct_count, current_enabled, \
+                synced_attempted_count, synced_correct_count, synced_enabled = row
+
+            if self.delta:
+                new_attempted_count = max(current_attempted_count + attempted_count, 0)
+                new_correct_count = max(current_correct_count + correct_count, 0)
+            else:
+                new_attempted_count = max(current_attempted_count, attempted_count)
+                new_correct_count = max(current_correct_count, correct_count)
+
+            new_enabled = (1 if state & self.ENABLED else 0) if state & self.ENABLED_CHANGED else current_enabled
+
+            updates.append((
+                question_id,
+                new_attempted_count,
+                new_correct_count,
+                new_enabled,
+                synced_attempted_count + new_attempted_count - current_attempted_count,
+                synced_correct_count + new_correct_count - current_correct_count,
+                new_enabled if state & self.ENABLED_CHANGED else synced_enabled
+            ))
+
+        database.execute_many(
+            "UPDATE questions SET attempted_count = ?, correct_count = ?, enabled = ? WHERE id = ?",
+            [(u[1], u[2], u[3], u[0]) for u in updates]
+        )
+
+        database.execute_many(
+            "INSERT OR REPLACE INTO synced_progress VALUES (?, ?, ?, ?)", [(u[0],) + u[4:] for u in updates]
+        )
+
+        return len(updates), skipped_count
+
+    def write(self, snapshot_path):
+        body = zlib.compress(b"".join(self.entry.pack(*e) for e in self.entries), 9)
+
+        with open(snapshot_path, "wb") as snapshot_file:
+            snapshot_file.write(
+                self.header.pack(self.magic, self.version, self.DELTA if self.delta else 0, len(self.entries))
+            )
+            snapshot_file.write(body)
+
+    @classmethod
+    def read(cls, snapshot_path):
+        with open(snapshot_path, "rb") as snapshot_file:
+            data = snapshot_file.read()
+
+        try:
+            magic, version, flags, entry_count = cls.header.unpack_from(data, 0)
+            body = zlib.decompress(data[cls.header.size:])
+
+        except (struct.error, zlib.error):
+            raise ValueError(f"{snapshot_path} is not a progress snapshot.")
+
+        if magic != cls.magic or version != cls.version or len(body) != entry_count * cls.entry.size:
+            raise ValueError(f"{snapshot_path} is not a version {cls.version} progress snapshot.")
+
+        return cls(list(cls.entry.iter_unpack(body)), flags & cls.DELTA == cls.DELTA)
+
+    @staticmethod
+    def export_main(database_path, snapshot_path, delta=False):
+        """
+        Writes a snapshot of a database's progress (or of what has changed since it was last synced).
+        """
+
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        database = Database(database_path)
+
+        try:
+            snapshot = ProgressSnapshot.take(database, delta)
+            snapshot.write(snapshot_path)
+            database.commit()
+
+        except (sqlite3.Error, ValueError, OSError) as e:
+            database.conn.rollback()
+            print(f"ERROR: {database_path}'s progress could not be exported: {e}")
+            exit(1)
+
+        finally:
+            database.close()
+
+        print(
+            f"INFO: {len(snapshot)} questions' {'changes in ' if delta else ''}progress have been exported to "
+            f"{snapshot_path} ({round(os.path.getsize(snapshot_path) / 1000, 1)} KB)."
+        )
+
+    @staticmethod
+    def merge_main(database_path, snapshot_paths):
+        """
+        Merges snapshots (e.g. from other machines) into a database, all in one transaction.
+        """
+
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        database = Database(database_path)
+        applied_count, skipped_count = 0, 0
+
+        try:
+            ProgressSnapshot.prepare(database)
+
+            for snapshot_path in snapshot_paths:
+                snapshot_applied_count, snapshot_skipped_count = ProgressSnapshot.read(snapshot_path).merge(database)
+                applied_count += snapshot_applied_count
+                skipped_count += snapshot_skipped_count
+
+            database.commit()
+
+        except (sqlite3.Error, ValueError, OSError) as e:
+            database.conn.rollback()
+            print(f"ERROR: progress could not be merged into {database_path}, which has been left as it was: {e}")
+            exit(1)
+
+        finally:
+            database.close()
+
+        print(
+            f"INFO: {applied_count} questions' progress have been merged into {database_path} "
+            f"({skipped_count} questions weren't found)."
+        )
@@ -0,0 +1,48 @@
+import os
+import sys
+
+
+class TerminalRenderer:
+    """
+    Draws dumpy's screens in-process.
+
+    Each screen is built up as one string and written to the terminal in a single write, and the terminal is cleared
+    with ANSI escape sequences rather than by running `clear` (or `cls`) in a shell, so that drawing the next question
+    doesn't fork a process, and stays fast over SSH and in containers.  When the output isn't a terminal (e.g. it's
+    piped to a file), screens are written without being cleared.
+    """
+
+    # move the cursor home, then clear the screen and its scrollback
+    clear_sequence = "\033[H\033[2J\033[3J"
+
+    def __init__(self, clear_screen=None):
+        self.clear_screen = clear_screen
+
+        # Windows consoles only interpret escape sequences once virtual terminal processing is on, which running any
+        # command turns on; this is done once, rather than once per question
+        if os.name == "nt":
+            os.system("")
+
+    def should_clear(self):
+        if self.clear_screen is not None:
+            return self.clear_screen
+
+        return sys.stdout.isatty()
+
+    def frame(self, *lines):
+        """
+        Clears the screen and draws some lines in its place.
+        """
+
+        self.write(*lines, clear=True)
+
+    def write(self, *lines, clear=False):
+        """
+        Draws some lines below whatever is already on the screen.
+        """
+
+        buffer = self.clear_sequence if clear and self.should_clear() else ""
+        buffer += "".join(f"{line}\n" for line in lines)
+
+        sys.stdout.write(buffer)
+        sys.stdout.flush()
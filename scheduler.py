@@ -0,0 +1,67 @@
+import time
+
+
+class LeitnerScheduler:
+    """
+    Schedules questions with Leitner boxes.
+
+    Every question sits in a box, and is due again once its box's interval has elapsed since it was last answered.
+    Answering a question correctly moves it up a box; answering it incorrectly sends it back to box 0, which is due
+    again a minute later, within the same session.  New questions start in box 0 with a random due time at the epoch, so
+    they are all due immediately and are served in a random order.
+
+    Boxes and due times are stored in the `questions` table and indexed, so picking the next question is a single
+    index seek regardless of the size of the bank, and always reflects the answers given so far.
+    """
+
+    # the number of seconds until a question in each box is due again
+    intervals = [60, 10 * 60, 24 * 60 * 60, 3 * 24 * 60 * 60, 7 * 24 * 60 * 60, 14 * 24 * 60 * 60, 30 * 24 * 60 * 60]
+
+    def __init__(self, database, clock=time.time):
+        self.database = database
+        self.clock = clock
+
+        self.database.create("CREATE INDEX IF NOT EXISTS `questions_due_at` ON questions (`enabled`, `due_at`)")
+        self.database.commit()
+
+    def __iter__(self):
+        """
+        Yields the next due question until no questions are due.  The answer to each question should be recorded before
+        the next one is requested.
+        """
+
+        while True:
+            question_id = self.next_question_id()
+
+            if question_id is None:
+                return
+
+            yield self.database.load_questions("id = ?", (question_id,))[0]
+
+    def next_question_id(self):
+        row = self.database.fetch_one(
+            "SELECT id FROM questions WHERE enabled = 1 AND due_at <= ? ORDER BY due_at, id LIMIT 1", (self.clock(),)
+        )
+
+        return row[0] if row else None
+
+    def generate_answer_sql(self, question, is_correct):
+        """
+        Returns the (sql, parameters) statement that reschedules a question after it has been answered.
+
+        The question's next box is worked out by the statement itself, from the box it's in when the statement runs, so
+        that answers can be queued up and written later (and in any thread) without reading anything first.
+        """
+
+        if not is_correct:
+            return "UPDATE questions SET box = 0, due_at = ? WHERE id = ?", (
+                self.clock() + self.intervals[0], question.question_id
+            )
+
+        next_box = f"MIN(box + 1, {len(self.intervals) - 1})"
+        next_interval = " ".join(f"WHEN {box} THEN {interval}" for box, interval in enumerate(self.intervals))
+
+        return (
+            f"UPDATE questions SET box = {next_box}, due_at = ? + (CASE {next_box} {next_interval} END) WHERE id = ?",
+            (self.clock(), question.question_id)
+        )
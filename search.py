@@ -0,0 +1,87 @@
+import sqlite3
+
+
+class SearchIndex:
+    """
+    A full-text (SQLite FTS5) index over every question's text, postmortem and answers, keyed by question id.
+
+    The index is built in bulk at import, and re-indexed question by question as questions are inserted or updated by
+    a sync.  Databases imported before the index existed are indexed the first time they're searched.  SQLite builds
+    without FTS5 can't be searched, but import and sync work as before.
+    """
+
+    available = None
+
+    schema = "CREATE VIRTUAL TABLE IF NOT EXISTS questions_search USING fts5(text, postmortem, answers)"
+
+    index_sql = (
+        "INSERT INTO questions_search (rowid, text, postmortem, answers) "
+        "SELECT q.id, q.text, q.postmortem, "
+        "(SELECT group_concat(a.text, ' ') FROM answers a WHERE a.question_id = q.id) "
+        "FROM questions q"
+    )
+
+    @staticmethod
+    def is_available():
+        if SearchIndex.available is None:
+            conn = sqlite3.connect(":memory:")
+
+            try:
+                conn.execute("CREATE VIRTUAL TABLE fts5_test USING fts5(text)")
+                SearchIndex.available = True
+
+            except sqlite3.OperationalError:
+                SearchIndex.available = False
+
+            finally:
+                conn.close()
+
+        return SearchIndex.available
+
+    @staticmethod
+    def exists(c):
+        return c.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_search'").fetchone() is not None
+
+    @staticmethod
+    def build(c, question_ids=None):
+        """
+        Indexes every question, or re-indexes just some of them, over a cursor (within the caller's transaction).
+        Does nothing if FTS5 isn't available.
+        """
+
+        if not SearchIndex.is_available():
+            return
+
+        c.execute(SearchIndex.schema)
+
+        if question_ids is None:
+            c.execute("DELETE FROM questions_search")
+            c.execute(SearchIndex.index_sql)
+            return
+
+        c.executemany("DELETE FROM questions_search WHERE rowid = ?", [(i,) for i in question_ids])
+        c.executemany(SearchIndex.index_sql + " WHERE q.id = ?", [(i,) for i in question_ids])
+
+    @staticmethod
+    def match_expression(query):
+        """
+        Turns a search (e.g. `IAM policy`) into an FTS5 query that matches questions containing every word, so that
+        punctuation in a search (e.g. `S3-bucket`) is matched rather than parsed as query syntax.
+        """
+
+        return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+    @staticmethod
+    def where(database, query):
+        """
+        Returns a (where clause, parameters) over the `questions` table that selects the questions matching a search,
+        for `Database.load_questions`.  The index is built first if the database doesn't have one yet.
+        """
+
+        if not SearchIndex.exists(database.conn):
+            SearchIndex.build(database.conn)
+            database.commit()
+
+        return "id IN (SELECT rowid FROM questions_search WHERE questions_search MATCH ?)", (
+            SearchIndex.match_expression(query),
+        )
@@ -0,0 +1,134 @@
+import os
+
+
+class SessionFilter:
+    """
+    Selects which of a database's questions a session asks, as a where clause over the `questions` table, so that only
+    the selected questions (and their answers) are ever read out of the database.
+
+    A session only ever asks enabled questions, and can be narrowed down to:
+
+        tag         the questions with a tag (each question in a dumpyfile may have a "tag")
+        unseen      the questions that have never been attempted
+        missed      the questions that have been answered incorrectly more than some number of times
+        sample      a random sample of some number of the questions left
+
+    Each filter is served by its own index, which is created the first time the filter is used.
+    """
+
+    indexes = {
+        "tag": "CREATE INDEX IF NOT EXISTS `questions_tag` ON questions (`tag`, `enabled`)",
+        "unseen": "CREATE INDEX IF NOT EXISTS `questions_attempted_count` ON questions (`attempted_count`, `enabled`)",
+        "missed": "CREATE INDEX IF NOT EXISTS `questions_missed_count` "
+                  "ON questions ((`attempted_count` - `correct_count`), `enabled`)"
+    }
+
+    def __init__(self, tag=None, unseen=False, missed=None, sample=None):
+        if missed is not None and missed < 0:
+            raise ValueError(f"the number of times missed must be at least 0 (not {missed}).")
+
+        if sample is not None and sample < 1:
+            raise ValueError(f"the sample size must be at least 1 (not {sample}).")
+
+        self.tag = tag
+        self.unseen = unseen
+        self.missed = missed
+        self.sample = sample
+
+    @staticmethod
+    def from_environment():
+        """
+        Reads a session's filters from the `DUMPY_TAG`, `DUMPY_UNSEEN`, `DUMPY_MISSED` and `DUMPY_SAMPLE` environment
+        variables.
+        """
+
+        def number(name):
+            if name not in os.environ:
+                return None
+
+            if not os.environ[name].isdigit():
+                raise ValueError(f"`{name}` must be a number (not '{os.environ[name]}').")
+
+            return int(os.environ[name])
+
+        return SessionFilter(
+            tag=os.environ["DUMPY_TAG"].strip() if "DUMPY_TAG" in os.environ else None,
+            unseen=os.environ.get("DUMPY_UNSEEN", "").lower() in ["1", "true", "yes"],
+            missed=number("DUMPY_MISSED"),
+            sample=number("DUMPY_SAMPLE")
+        )
+
+    def __bool__(self):
+        return self.tag is not None or self.unseen or self.missed is not None or self.sample is not None
+
+    def where(self, database, shuffle_by_weight=False, where=None, parameters=()):
+        """
+        Returns a (where clause, parameters) that selects the session's questions, for `Database.load_questions`,
+        optionally within another where clause (e.g. a search).
+
+        A sample is drawn once, into a temporary table, so that a question's answers are read for exactly the questions
+        sampled.  If the bank is shuffled by weight, the sample is drawn by the same weights, so it holds the questions
+        that a full session would have asked first.
+        """
+
+        conditions, condition_parameters = ["enabled = 1"], []
+
+        if self.tag is not None:
+            database.create(self.indexes["tag"])
+            conditions.append("tag = ?")
+            condition_parameters.append(self.tag)
+
+        if self.unseen:
+            database.create(self.indexes["unseen"])
+            conditions.append("attempted_count = 0")
+
+        if self.missed is not None:
+            database.create(self.indexes["missed"])
+            conditions.append("(attempted_count - correct_count) > ?")
+            condition_parameters.append(self.missed)
+
+        if where:
+            conditions.append(f"({where})")
+            condition_parameters.extend(parameters)
+
+        database.commit()
+
+        where, parameters = " AND ".join(conditions), tuple(condition_parameters)
+
+        if self.sample is None:
+            return where, parameters
+
+        # mirrors `Dumpy.shuffle_by_weight`: unseen questions first, then the least often answered correctly
+        order = (
+            "CASE WHEN attempted_count > 0 "
+            "THEN ((random() & 4294967295) / 4294967296.0) * correct_count / attempted_count ELSE 0 END, random()"
+            if shuffle_by_weight else "random()"
+        )
+
+        database.execute("DROP TABLE IF EXISTS temp.session_questions")
+        database.execute(
+            f"CREATE TEMP TABLE session_questions AS "
+            f"SELECT id FROM questions WHERE {where} ORDER BY {order} LIMIT ?",
+            parameters + (self.sample,)
+        )
+
+        return "id IN (SELECT id FROM temp.session_questions)", ()
+
+    def filter_index(self, index):
+        """
+        Applies the filters to a compiled bank's index entries, returning the entries selected (a bank's questions
+        aren't tagged, so a tag can't be used).
+        """
+
+        if self.tag is not None:
+            raise ValueError("compiled banks aren't tagged, so `DUMPY_TAG` can't be used with one.")
+
+        index = [e for e in index if e[4] == 1]
+
+        if self.unseen:
+            index = [e for e in index if e[2] == 0]
+
+        if self.missed is not None:
+            index = [e for e in index if e[2] - e[3] > self.missed]
+
+        return index
@@ -0,0 +1,448 @@
+import os
+import json
+import math
+import time
+import random
+import sqlite3
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from models import Question, Scoreboard
+from database import Database
+from attempts import AttemptLog
+
+
+class QuestionProgress:
+    """
+    One user's counts for one question, which stand in for the question's own counts when scoring that user.
+    """
+
+    __slots__ = ["attempted_count", "correct_count"]
+
+    def __init__(self, attempted_count=0, correct_count=0):
+        self.attempted_count = attempted_count
+        self.correct_count = correct_count
+
+
+class UserSession:
+    """
+    A user's progress and current session.
+
+    Each user walks the bank in their own random order, without the order having to be stored: position i of the walk
+    is question (start + i * stride) % n, which visits every question once per n answers since the stride is coprime
+    with n.
+    """
+
+    def __init__(self, progress, question_count):
+        self.progress = progress
+
+        self.scoreboard = Scoreboard(
+            sum(1 for p in progress.values() if p.attempted_count > 0),
+            sum(1 for p in progress.values() if p.correct_count > 0),
+            question_count - sum(1 for p in progress.values() if p.attempted_count > 0)
+        )
+
+        self.start = random.randrange(question_count)
+        self.stride = 1
+
+        if question_count > 2:
+            self.stride = random.randrange(1, question_count)
+
+            while math.gcd(self.stride, question_count) != 1:
+                self.stride = random.randrange(1, question_count)
+
+        self.position = 0
+
+
+class SessionServer:
+    """
+    Serves braindumps to many users at once, from one copy of a database's questions held in memory.
+
+    Clients send newline-delimited JSON requests over TCP, each naming its user:
+
+        {"op": "next", "user": "alice"}                                     the user's next question
+        {"op": "answer", "user": "alice", "question_id": 12, "letters": "DA"}   grades an answer
+        {"op": "progress", "user": "alice"}                                 the user's grades
+
+    and get one JSON response per line back.  Answers are graded in memory and answered straight away; their statistics
+    are queued for a single writer, which applies them in batches (one transaction per batch) to the `questions` table,
+    the per-user `user_progress` table and the `attempts` log.  Answers are always in the order they were imported,
+    since the questions are shared between users.
+    """
+
+    user_progress_schema = (
+        "CREATE TABLE IF NOT EXISTS user_progress ("
+        "`user` TEXT NOT NULL,"
+        "`question_id` INTEGER NOT NULL,"
+        "`attempted_count` INTEGER DEFAULT 0,"
+        "`correct_count` INTEGER DEFAULT 0,"
+        "PRIMARY KEY (`user`, `question_id`)"
+        ") WITHOUT ROWID"
+    )
+
+    def __init__(self, database_path, batch_size=256):
+        self.database_path = database_path
+        self.batch_size = batch_size
+
+        self.questions = []
+        self.questions_by_id = {}
+        self.sessions = {}
+
+        # the writer's connection lives on (and is only ever used from) this one thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.database = None
+
+        self.pending = None
+        self.writer = None
+        self.written_count = 0
+        self.batch_count = 0
+
+    def load(self):
+        database = Database(self.database_path)
+
+        try:
+            database.execute(self.user_progress_schema)
+
+            for s in AttemptLog.indexes:
+                database.execute(s)
+
+            database.commit()
+
+            self.questions = database.load_questions("enabled = 1")
+
+        finally:
+            database.close()
+
+        for q in self.questions:
+            q.assign_letters_to_answers()
+
+        self.questions_by_id = {q.question_id: q for q in self.questions}
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Loads the questions and starts serving, returning the asyncio server.
+        """
+
+        if not self.questions:
+            self.load()
+
+        if not self.questions:
+            raise ValueError(f"{self.database_path} has no enabled questions.")
+
+        self.pending = asyncio.Queue()
+        self.writer = asyncio.ensure_future(self.write_stats())
+
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def close(self):
+        """
+        Writes every queued answer, and closes the writer's connection.
+        """
+
+        if self.writer:
+            await self.pending.put(None)
+            await self.writer
+            self.writer = None
+
+        await asyncio.get_event_loop().run_in_executor(self.executor, self.close_database)
+        self.executor.shutdown()
+
+    def connect(self):
+        if self.database is None:
+            self.database = Database(self.database_path, commit_policy="exit")
+
+        return self.database
+
+    def close_database(self):
+        if self.database:
+            self.database.close()
+            self.database = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"error": f"{type(e).__name__}: {e}"}
+
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+    async def handle_request(self, request):
+        session = await self.load_session(str(request["user"]))
+
+        if request["op"] == "next":
+            q = self.questions[(session.start + session.position * session.stride) % len(self.questions)]
+            session.position += 1
+
+            return {
+                "question_id": q.question_id,
+                "text": q.text,
+                "answers": [{"letter": a.letter, "text": a.text} for a in q.answers],
+                "choose": len(q.correct_answers)
+            }
+
+        if request["op"] == "answer":
+            return self.answer(str(request["user"]), session, request["question_id"], request["letters"])
+
+        if request["op"] == "progress":
+            return self.grades(session)
+
+        raise ValueError(f"'{request['op']}' is not a valid op; expected 'next', 'answer' or 'progress'.")
+
+    async def load_session(self, user):
+        session = self.sessions.get(user)
+
+        if session is None:
+            rows = await asyncio.get_event_loop().run_in_executor(
+                self.executor, lambda: self.connect().fetch_all(
+                    "SELECT question_id, attempted_count, correct_count FROM user_progress WHERE user = ?", (user,)
+                )
+            )
+
+            # another request for the same user may have loaded it in the meantime
+            session = self.sessions.setdefault(
+                user, UserSession({r[0]: QuestionProgress(r[1], r[2]) for r in rows}, len(self.questions))
+            )
+
+        return session
+
+    def answer(self, user, session, question_id, letters):
+        q = self.questions_by_id.get(question_id)
+
+        if q is None:
+            raise ValueError(f"{question_id} is not an enabled question.")
+
+        if not isinstance(letters, str) or not letters.isalpha() or Question.mask_letters(letters) >> len(q.answers):
+            raise ValueError(f"'{letters}' doesn't name one of the question's answers.")
+
+        if bin(Question.mask_letters(letters)).count("1") != len(q.correct_answers):
+            raise ValueError(f"please provide exactly {len(q.correct_answers)} answer(s).")
+
+        chosen_mask = Question.mask_letters(letters)
+        is_correct = chosen_mask == q.correct_mask
+
+        progress = session.progress.setdefault(question_id, QuestionProgress())
+        session.scoreboard.record(progress, is_correct)
+        progress.attempted_count += 1
+        progress.correct_count += 1 if is_correct else 0
+
+        chosen_answer_ids = ",".join(str(a.answer_id) for i, a in enumerate(q.answers) if chosen_mask >> i & 1)
+        self.pending.put_nowait((user, question_id, is_correct, time.time(), chosen_answer_ids))
+
+        return dict(
+            self.grades(session),
+            correct=is_correct,
+            correct_letters="".join(a.letter for a in q.correct_answers),
+            postmortem=q.postmortem
+        )
+
+    @staticmethod
+    def grades(session):
+        scoreboard = session.scoreboard
+
+        return {
+            "session_percent": (
+                round(scoreboard.current_session_percent, 2) if scoreboard.current_session_displayed_count else 0.0
+            ),
+            "overall_percent": round(scoreboard.overall_percent, 2) if scoreboard.overall_attempted_count else 0.0,
+            "answered": scoreboard.current_session_displayed_count,
+            "unseen": scoreboard.unseen_count
+        }
+
+    async def write_stats(self):
+        """
+        Applies queued answers in batches: whatever is queued when the writer comes round (up to `batch_size`) is
+        written in one transaction, so the more answers arrive at once, the fewer transactions they take.
+        """
+
+        loop = asyncio.get_event_loop()
+        closing = False
+
+        while not closing:
+            batch = [await self.pending.get()]
+
+            while len(batch) < self.batch_size and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+
+            if batch[-1] is None:
+                closing = True
+                batch.pop()
+
+            if batch:
+                await loop.run_in_executor(self.executor, self.write_batch, batch)
+
+    def write_batch(self, batch):
+        user_deltas, question_deltas = {}, {}
+
+        for user, question_id, is_correct, _, _ in batch:
+            attempted_count, correct_count = user_deltas.get((user, question_id), (0, 0))
+            user_deltas[(user, question_id)] = (attempted_count + 1, correct_count + (1 if is_correct else 0))
+
+            attempted_count, correct_count = question_deltas.get(question_id, (0, 0))
+            question_deltas[question_id] = (attempted_count + 1, correct_count + (1 if is_correct else 0))
+
+        database = self.connect()
+
+        database.execute_many(
+            "INSERT INTO user_progress (user, question_id, attempted_count, correct_count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user, question_id) DO UPDATE SET "
+            "attempted_count = attempted_count + excluded.attempted_count, "
+            "correct_count = correct_count + excluded.correct_count",
+            [(u, q, a, c) for (u, q), (a, c) in user_deltas.items()]
+        )
+
+        database.execute_many(
+            "UPDATE questions "
+            "SET attempted_count = attempted_count + ?, correct_count = correct_count + ? "
+            "WHERE id = ?",
+            [(a, c, q) for q, (a, c) in question_deltas.items()]
+        )
+
+        # each user's answers are logged under their name, as the session they belong to
+        database.execute_many(
+            "INSERT INTO attempts (session_id, question_id, answered_at, chosen_answer_ids, is_correct) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(u, q, answered_at, chosen, 1 if c else 0) for u, q, c, answered_at, chosen in batch]
+        )
+
+        database.commit()
+
+        self.written_count += len(batch)
+        self.batch_count += 1
+
+    @staticmethod
+    def main(database_path, host, port):
+        if not os.path.exists(database_path):
+            print(f"ERROR: {database_path} was not found.")
+            exit(1)
+
+        server = SessionServer(database_path)
+
+        async def serve():
+            tcp_server = await server.start(host, port)
+
+            print(
+                f"INFO: serving {len(server.questions)} questions from {database_path} on "
+                f"{host}:{tcp_server.sockets[0].getsockname()[1]} ..."
+            )
+
+            try:
+                await tcp_server.serve_forever()
+
+            finally:
+                tcp_server.close()
+                await server.close()
+                print(f"INFO: {server.written_count} answers have been recorded in {database_path}.")
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+
+
+class SessionClient:
+    """
+    A minimal client for `SessionServer`, as used by the load test.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port, limit=1024 * 1024)
+
+    async def request(self, op, **kwargs):
+        self.writer.write(json.dumps(dict(kwargs, op=op, user=self.user)).encode("utf-8") + b"\n")
+        await self.writer.drain()
+
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+
+
+async def run_load_test(database_path, user_count, answers_per_user, batch_size=256):
+    """
+    Serves a database on a local port, and has `user_count` concurrent clients each answer `answers_per_user`
+    questions as fast as they can, timing every answer from request to response.
+    """
+
+    server = SessionServer(database_path, batch_size)
+    tcp_server = await server.start()
+    port = tcp_server.sockets[0].getsockname()[1]
+
+    latencies = []
+
+    async def simulate(user):
+        client = SessionClient(user)
+        await client.connect("127.0.0.1", port)
+
+        for _ in range(answers_per_user):
+            question = await client.request("next")
+            letters = "".join(a["letter"] for a in random.sample(question["answers"], question["choose"]))
+
+            start = time.perf_counter()
+            await client.request("answer", question_id=question["question_id"], letters=letters)
+            latencies.append(time.perf_counter() - start)
+
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[simulate(f"loadtest-{i}") for i in range(user_count)])
+    seconds = time.perf_counter() - start
+
+    tcp_server.close()
+    await tcp_server.wait_closed()
+    await server.close()
+
+    latencies.sort()
+
+    return {
+        "users": user_count,
+        "answers": len(latencies),
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(len(latencies) / seconds),
+        "p50_answer_milliseconds": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_answer_milliseconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        "write_batches": server.batch_count,
+        "answers_written": server.written_count
+    }
+
+
+def load_test(database_path, user_count, answers_per_user):
+    """
+    Runs a load test against a copy of a database, so that its statistics aren't affected, and prints the results.
+    """
+
+    if not os.path.exists(database_path):
+        print(f"ERROR: {database_path} was not found.")
+        exit(1)
+
+    with tempfile.TemporaryDirectory() as d:
+        copy_path = os.path.join(d, os.path.basename(database_path))
+
+        source, copy = sqlite3.connect(database_path), sqlite3.connect(copy_path)
+        source.backup(copy)
+        source.close()
+        copy.close()
+
+        results = asyncio.run(run_load_test(copy_path, user_count, answers_per_user))
+
+    print(json.dumps(results, indent=4))
+
+    return results
@@ -1,17 +1,85 @@
+import io
+import os
+import atexit
+import json
+import sqlite3
+import asyncio
+import threading
+import tempfile
 import unittest
+from unittest import mock
 from models import *
 from dumpy import Dumpy
-from utils import DumpyfileUtils
+from utils import DumpyfileUtils, DumpyfileReader
+from database import Database
+from instrumentation import Instrumentation
+from grader import AnswerSheet, BatchGrader
+from importer import BulkImporter, import_dumpyfile
+from bank import CompiledBank
+from server import SessionServer, SessionClient
+from attempts import AttemptLog
+from dedup import DuplicateFinder
+from renderer import TerminalRenderer
+from federation import FederatedDatabase
+from validator import DumpyfileValidator
+from selection import SessionFilter
+from progress import ProgressSnapshot
 
 
-class DumpyTests(unittest.TestCase):
+def write_dumpyfile(directory, name, dumpyfile_contents):
+    dumpyfile_path = os.path.join(directory, name + ".dumpy")
+
+    with open(dumpyfile_path, "w") as dumpyfile:
+        dumpyfile.write(json.dumps(dumpyfile_contents, indent=4))
+
+    return dumpyfile_path
+
+
+def write_baseline_database(database_path, dumpyfile_contents, attempted_count=0, correct_count=0):
+    """
+    Creates a database the way the first release of dumpy imported one, before any columns were added to its schema.
+    """
+
+    conn = sqlite3.connect(database_path)
 
-    @staticmethod
-    @unittest.skip
-    def test_example():
+    with conn:
+        conn.execute(
+            "CREATE TABLE metadata (`description` TEXT, `shuffle_answers` INTEGER DEFAULT 0, "
+            "`shuffle_questions_by_weight` INTEGER DEFAULT 1, `database_created_time` TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE questions (`id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE, `text` TEXT NOT NULL, "
+            "`postmortem` TEXT, `attempted_count` INTEGER DEFAULT 0, `correct_count` INTEGER DEFAULT 0, "
+            "`enabled` INTEGER DEFAULT 1)"
+        )
+        conn.execute(
+            "CREATE TABLE answers (`id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE, "
+            "`question_id` INTEGER NOT NULL, `text` TEXT NOT NULL, `is_correct` INTEGER NOT NULL DEFAULT 0)"
+        )
 
-        dumpy = Dumpy()
+        metadata = dumpyfile_contents["metadata"]
+        conn.execute(
+            "INSERT INTO metadata VALUES (?, ?, ?, '2019-01-01')",
+            (metadata["description"], 1 if metadata["shuffle_answers"] else 0,
+             1 if metadata["shuffle_questions_by_weight"] else 0)
+        )
 
+        for i, q in enumerate(dumpyfile_contents["questions"]):
+            conn.execute(
+                "INSERT INTO questions VALUES (?, ?, ?, ?, ?, 1)",
+                (i + 1, q["text"], q.get("postmortem") or "", attempted_count, correct_count)
+            )
+            conn.executemany(
+                "INSERT INTO answers (question_id, text, is_correct) VALUES (?, ?, ?)",
+                [(i + 1, a["text"], 1 if a["is_correct"] else 0) for a in q["answers"]]
+            )
+
+    conn.close()
+
+
+class DumpyTests(unittest.TestCase):
+
+    def test_example(self):
         metadata = Metadata(
             description="An example .dumpy file.",
             shuffle_answers=True
@@ -27,7 +95,10 @@ class DumpyTests(unittest.TestCase):
                     Answer(text=2018),
                     Answer(text=2019, is_correct=True)
                 ],
-                postmortem="It's 2019!"
+                postmortem="It's 2019!",
+                attempted_count=0,
+                correct_count=0,
+                enabled=1
             ),
             Question(
                 text="Which of these are numbers?",
@@ -37,10 +108,1424 @@ class DumpyTests(unittest.TestCase):
                     Answer(text=1, is_correct=True),
                     Answer(text=2, is_correct=True)
                 ],
-                postmortem="'A' and 'B' are letters, but 1 and 2 are numbers."
+                postmortem="'A' and 'B' are letters, but 1 and 2 are numbers.",
+                attempted_count=0,
+                correct_count=0,
+                enabled=1
             )
         ]
 
-        DumpyfileUtils.create(metadata, questions, dumpy.dumpyfile_path)  # todo: test this
+        with tempfile.TemporaryDirectory() as directory:
+            DumpyfileUtils.create(metadata, questions, "example", dumpyfiles_directory=directory)
+
+            dumpy = Dumpy(
+                selected_database=os.path.join(directory, "example.db"),
+                selected_dumpyfile=os.path.join(directory, "example.dumpy")
+            )
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.import_dumpyfile()
+                dumpy.load_questions_from_database()
+
+            # the year is answered correctly, and the numbers question is answered with both letters
+            responses = iter([
+                r
+                for q in dumpy.questions
+                for r in [
+                    "".join(a.letter for a in q.answers if a.is_correct) if "year" in q.text
+                    else "".join(a.letter for a in q.answers if not a.is_correct),
+                    ""
+                ]
+            ])
+
+            with mock.patch("builtins.input", lambda *args: next(responses)), mock.patch("os.system"), \
+                    mock.patch("sys.stdout", io.StringIO()) as output:
+                dumpy.begin_braindump()
+
+            counts = sqlite3.connect(dumpy.selected_database).execute(
+                "SELECT text, attempted_count, correct_count FROM questions ORDER BY id"
+            ).fetchall()
+
+        self.assertIn("CURRENT GRADE", output.getvalue())
+        self.assertEqual(counts, [("What year is it?", 1, 1), ("Which of these are numbers?", 1, 0)])
+
+    def test_dumpyfile_reader_streams_questions(self):
+        dumpyfile_contents = {
+            "questions": [
+                {
+                    "text": f"Question {i} \"quoted\" é",
+                    "answers": [{"text": 1.5, "is_correct": True}, {"text": "No", "is_correct": False}]
+                }
+                for i in range(50)
+            ],
+            "metadata": {"description": "Streaming", "shuffle_answers": False, "shuffle_questions_by_weight": True}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "streaming", dumpyfile_contents)
+
+            # a tiny chunk size forces values to straddle chunk boundaries
+            events = list(DumpyfileReader(dumpyfile_path, chunk_size=7))
+
+        self.assertEqual([v for k, v in events if k == "question"], dumpyfile_contents["questions"])
+        self.assertEqual(events[-1], ("metadata", dumpyfile_contents["metadata"]))
+
+    def test_import_dumpyfile_handles_quotes(self):
+        dumpyfile_contents = {
+            "metadata": {
+                "description": "A \"quoted\" description, with 'both' kinds of quotes",
+                "shuffle_answers": False,
+                "shuffle_questions_by_weight": False
+            },
+            "questions": [
+                {
+                    "text": "Isn't this \"quoted\"?",
+                    "answers": [{"text": "It's so", "is_correct": True}, {"text": "No", "is_correct": "False"}],
+                    "postmortem": "It's \"quoted\"."
+                }
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "quotes", dumpyfile_contents)
+            database_path = os.path.join(directory, "quotes.db")
+
+            Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            conn = sqlite3.connect(database_path)
+            metadata = conn.execute("SELECT description FROM metadata").fetchone()
+            question = conn.execute("SELECT text, postmortem FROM questions").fetchone()
+            answers = conn.execute("SELECT text, is_correct FROM answers ORDER BY id").fetchall()
+            conn.close()
+
+        self.assertEqual(metadata[0], dumpyfile_contents["metadata"]["description"])
+        self.assertEqual(question, ("Isn't this \"quoted\"?", "It's \"quoted\"."))
+        self.assertEqual(answers, [("It's so", 1), ("No", 0)])
+
+    def test_sync_dumpyfile_only_touches_changed_questions(self):
+        def question(text, postmortem=None):
+            return {
+                "text": text,
+                "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}],
+                "postmortem": postmortem
+            }
+
+        metadata = {"description": "Sync", "shuffle_answers": False, "shuffle_questions_by_weight": False}
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "sync.db")
+            dumpyfile_path = write_dumpyfile(directory, "sync", {
+                "metadata": metadata,
+                "questions": [question("Edited?"), question("Removed?"), question("Unchanged?")]
+            })
+
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+            dumpy.import_dumpyfile()
+
+            conn = sqlite3.connect(database_path)
+            conn.execute("UPDATE questions SET attempted_count = 3, correct_count = 2")
+            conn.commit()
+
+            edited_question = question("Edited?", "Now with a postmortem.")
+            edited_question["answers"].append({"text": "Maybe", "is_correct": False})
+
+            write_dumpyfile(directory, "sync", {
+                "metadata": metadata,
+                "questions": [edited_question, question("Unchanged?"), question("Inserted?")]
+            })
+
+            dumpy.sync_dumpyfile()
+
+            questions = conn.execute(
+                "SELECT id, text, postmortem, attempted_count, correct_count, enabled FROM questions ORDER BY id"
+            ).fetchall()
+
+            answers = conn.execute("SELECT id, text FROM answers WHERE question_id = 1 ORDER BY id").fetchall()
+            conn.close()
+
+        self.assertEqual(questions, [
+            (1, "Edited?", "Now with a postmortem.", 3, 2, 1),
+            (2, "Removed?", "", 3, 2, 0),
+            (3, "Unchanged?", "", 3, 2, 1),
+            (4, "Inserted?", "", 0, 0, 1)
+        ])
+
+        self.assertEqual(answers, [(1, "Yes"), (2, "No"), (7, "Maybe")])
+
+    def test_sync_dumpyfile_restores_removed_questions_and_keeps_answer_order(self):
+        def question(text, answers=("A", "B", "C")):
+            return {"text": text, "answers": [{"text": a, "is_correct": a == "A"} for a in answers]}
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "restore.db")
+            dumpyfile_path = write_dumpyfile(directory, "restore", {"questions": [question("One"), question("Two")]})
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.import_dumpyfile()
+
+                # "Two" is removed, then added back, with one of "One"'s answers edited in the meantime
+                write_dumpyfile(directory, "restore", {"questions": [question("One")]})
+                dumpy.sync_dumpyfile()
+
+                write_dumpyfile(directory, "restore", {
+                    "questions": [question("One", ("A", "B edited", "C")), question("Two")]
+                })
+                dumpy.sync_dumpyfile()
+
+            conn = sqlite3.connect(database_path)
+            questions = conn.execute("SELECT id, text, enabled FROM questions ORDER BY id").fetchall()
+            answers = conn.execute("SELECT id, text FROM answers WHERE question_id = 1 ORDER BY id").fetchall()
+            conn.close()
+
+        self.assertEqual(questions, [(1, "One", 1), (2, "Two", 1)])
+        self.assertEqual(answers, [(1, "A"), (2, "B edited"), (3, "C")])
+
+    def test_database_commits_according_to_commit_policy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "policy.db")
+
+            conn = sqlite3.connect(database_path)
+            conn.execute("CREATE TABLE questions (id INTEGER PRIMARY KEY, attempted_count INTEGER DEFAULT 0)")
+            conn.execute("INSERT INTO questions (id) VALUES (1)")
+            conn.commit()
+
+            def committed_attempts():
+                return conn.execute("SELECT attempted_count FROM questions").fetchone()[0]
+
+            database = Database(database_path, commit_policy=2)
+            increment = [("UPDATE questions SET attempted_count = attempted_count + 1 WHERE id = ?", (1,))]
+
+            database.write(increment)
+            self.assertEqual(committed_attempts(), 0)
+
+            database.write(increment)
+            self.assertEqual(committed_attempts(), 2)
+
+            database.write(increment)
+            database.close()
+            self.assertEqual(committed_attempts(), 3)
+
+            conn.close()
+
+        with self.assertRaises(ValueError):
+            Database(":memory:", commit_policy="sometimes")
+
+    def test_load_questions_groups_answers_by_question(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = Database(os.path.join(directory, "load.db"))
+
+            for s in Database.schema:
+                database.execute(s)
+
+            database.execute("INSERT INTO metadata (description) VALUES ('Load')")
+            database.execute("INSERT INTO questions (id, text) VALUES (1, 'One'), (2, 'Two'), (3, 'Three')")
+
+            # answers are interleaved, and one belongs to a question that no longer exists
+            database.execute(
+                "INSERT INTO answers (question_id, text, is_correct) VALUES "
+                "(3, '3a', 1), (1, '1a', 0), (9, 'orphan', 0), (1, '1b', 1), (3, '3b', 0)"
+            )
+
+            questions = database.load_questions()
+            database.close()
+
+        self.assertEqual(
+            [(q.question_id, [a.text for a in q.answers], q.correct_answer_ids) for q in questions],
+            [(1, ["1a", "1b"], [4]), (2, [], []), (3, ["3a", "3b"], [1])]
+        )
+
+    def test_leitner_scheduler_reschedules_answered_questions(self):
+        now = [1000000.0]
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "leitner", {
+                "metadata": {"description": "Leitner", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+                "questions": [
+                    {"text": text, "answers": [{"text": "Yes", "is_correct": True}]} for text in ["One", "Two"]
+                ]
+            })
+
+            dumpy = Dumpy(selected_database=os.path.join(directory, "leitner.db"), selected_dumpyfile=dumpyfile_path)
+            dumpy.import_dumpyfile()
+            dumpy.scheduler_name = "leitner"
+            dumpy.load_questions_from_database()
+            dumpy.scheduler.clock = lambda: now[0]
+
+            answered = []
+
+            # "One" is always answered incorrectly, so it's due again a minute later; "Two" is answered correctly
+            for q in dumpy.questions:
+                answered.append(q.text)
+                dumpy.record_answer(q, q.text == "Two")
+
+                if len(answered) >= 2:
+                    self.assertIsNone(dumpy.scheduler.next_question_id())
+                    now[0] += 60
+
+                if len(answered) == 4:
+                    break
+
+            boxes = dumpy.connect().fetch_all("SELECT text, box, attempted_count FROM questions ORDER BY id")
+            dumpy.disconnect()
+
+        self.assertEqual(sorted(answered[:2]), ["One", "Two"])
+        self.assertEqual(answered[2:], ["One", "One"])
+        self.assertEqual(boxes, [("One", 0, 3), ("Two", 1, 1)])
+
+    def test_scoreboard_matches_database_counts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "scoreboard", {
+                "metadata": {"description": "Scores", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+                "questions": [
+                    {"text": f"Question {i}", "answers": [{"text": "Yes", "is_correct": True}]} for i in range(4)
+                ]
+            })
+
+            dumpy = Dumpy(selected_database=os.path.join(directory, "scoreboard.db"), selected_dumpyfile=dumpyfile_path)
+            dumpy.import_dumpyfile()
+            dumpy.load_questions_from_database()
+
+            for q, is_correct in zip(dumpy.questions + dumpy.questions, [False, True, False, False, True, True]):
+                dumpy.record_answer(q, is_correct)
+
+            scoreboard = dumpy.scoreboard
+            overall_counts = dumpy.connect().load_overall_counts()
+            dumpy.disconnect()
+
+        self.assertEqual(overall_counts, (4, 2, 0))
+
+        self.assertEqual(overall_counts, (
+            scoreboard.overall_attempted_count,
+            scoreboard.overall_correct_at_least_once_count,
+            scoreboard.unseen_count
+        ))
+        self.assertEqual((scoreboard.current_session_correct_count, scoreboard.current_session_displayed_count), (3, 6))
+
+    def test_question_grades_responses_with_correct_mask(self):
+        question = Question(
+            text="Which of these are numbers?",
+            answers=[
+                Answer(text="A"), Answer(text=1, is_correct=True), Answer(text="B"), Answer(text=2, is_correct=True)
+            ],
+            postmortem=None,
+            attempted_count=0,
+            correct_count=0,
+            enabled=1
+        )
+
+        question.shuffle_answers()
+        question.assign_letters_to_answers()
+
+        correct_letters = "".join(a.letter for a in question.answers if a.is_correct)
+
+        self.assertTrue(question.grade(correct_letters))
+        self.assertTrue(question.grade(correct_letters[::-1].lower()))
+        self.assertFalse(question.grade(correct_letters[0]))
+        self.assertEqual([a.text for a in question.correct_answers], [a.text for a in question.answers if a.is_correct])
+
+    def test_instrumentation_writes_chrome_trace(self):
+        instrumentation = Instrumentation(max_events=3)
+
+        with instrumentation.span("disabled"):
+            pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, "trace.json")
+            instrumentation.enable(trace_path)
+
+            for _ in instrumentation.iterate("parse", range(3)):
+                with instrumentation.span("sql"):
+                    pass
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                instrumentation.write()
+
+            atexit.unregister(instrumentation.write)
+
+            with open(trace_path) as trace_file:
+                trace = json.loads(trace_file.read())
+
+        self.assertEqual(len(trace["traceEvents"]), 3)
+        self.assertEqual(trace["traceEvents"][0]["ph"], "X")
+        self.assertEqual({name: s["count"] for name, s in trace["summary"].items()}, {"parse": 3, "sql": 3})
+
+    def test_batch_grader_grades_and_records_answer_sheets(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Grading", "shuffle_answers": True, "shuffle_questions_by_weight": True},
+            "questions": [
+                {
+                    "text": "Pick B.",
+                    "answers": [{"text": "A", "is_correct": False}, {"text": "B", "is_correct": True}],
+                    "postmortem": ""
+                },
+                {
+                    "text": "Pick A and C.",
+                    "answers": [
+                        {"text": "A", "is_correct": True},
+                        {"text": "B", "is_correct": False},
+                        {"text": "C", "is_correct": True}
+                    ],
+                    "postmortem": ""
+                }
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "grading", dumpyfile_contents)
+            database_path = os.path.join(directory, "grading.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            json_path = os.path.join(directory, "alice.json")
+
+            with open(json_path, "w") as json_file:
+                json_file.write(json.dumps({"1": "b", "2": "CA", "3": "A", "q1": "A"}))
+
+            csv_path = os.path.join(directory, "class.csv")
+
+            with open(csv_path, "w") as csv_file:
+                csv_file.write("sheet,question_id,letters\nbob,1,A\nbob,2,AC\ncarol,1,Z\n")
+
+            sheets = AnswerSheet.read(json_path) + AnswerSheet.read(csv_path)
+
+            grader = BatchGrader(database_path)
+            results, question_deltas, attempts = grader.grade(sheets)
+            grader.record(question_deltas, attempts)
+
+            conn = sqlite3.connect(database_path)
+            counts = conn.execute("SELECT attempted_count, correct_count FROM questions ORDER BY id").fetchall()
+            logged = conn.execute(
+                "SELECT question_id, chosen_answer_ids, is_correct FROM attempts ORDER BY id"
+            ).fetchall()
+            conn.close()
+
+            # letters that aren't a string are invalid, rather than an error
+            malformed_results, malformed_deltas, _ = grader.grade([AnswerSheet("dave", {1: 2, 2: ["A", "C"]})])
+
+            self.assertEqual((malformed_results[0]["answered"], malformed_results[0]["invalid"]), (0, 2))
+            self.assertEqual(malformed_deltas, [])
+
+            # the graded answers are in the log, so rebuilding the counters from it keeps them
+            database = Database(database_path)
+            self.assertEqual(AttemptLog(database).rebuild_counters(), 0)
+            database.close()
+
+        self.assertEqual(
+            [(r["sheet"], r["answered"], r["correct"], r["invalid"]) for r in results],
+            [("alice.json", 2, 2, 2), ("class.csv#bob", 2, 1, 0), ("class.csv#carol", 0, 0, 1)]
+        )
+        self.assertEqual(counts, [(2, 1), (2, 2)])
+        self.assertEqual(logged, [(1, "2", 1), (2, "3,5", 1), (1, "1", 0), (2, "3,5", 1)])
+        self.assertEqual(len(set(a[0] for a in attempts)), 2)
+
+    def test_bulk_importer_imports_in_parallel_and_skips_unchanged_dumpyfiles(self):
+        def bank(text):
+            return {
+                "metadata": {"description": text, "shuffle_answers": False, "shuffle_questions_by_weight": False},
+                "questions": [
+                    {
+                        "text": text,
+                        "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}]
+                    }
+                ]
+            }
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_dumpyfile(directory, "first", bank("First?"))
+            second_path = write_dumpyfile(directory, "second", bank("Second?"))
+
+            with open(os.path.join(directory, "broken.dumpy"), "w") as broken_dumpyfile:
+                broken_dumpyfile.write('{"questions": [{"text": ')
+
+            importer = BulkImporter(os.path.join(directory, "databases"), jobs=2)
+            dumpyfile_paths = BulkImporter.find_dumpyfiles(directory)
+
+            first_run = importer.run(dumpyfile_paths)
+
+            write_dumpyfile(directory, "second", bank("Second, edited?"))
+            second_run = importer.run(dumpyfile_paths)
+
+            conn = sqlite3.connect(importer.database_path(second_path))
+            texts = conn.execute("SELECT text FROM questions WHERE enabled = 1").fetchall()
+            conn.close()
+
+        self.assertEqual([r["status"] for r in first_run], ["failed", "imported", "imported"])
+        self.assertIn("has 1 error(s)", first_run[0]["error"])
+        self.assertEqual([r["status"] for r in second_run], ["failed", "skipped", "synced"])
+        self.assertEqual(texts, [("Second, edited?",)])
+
+    def test_export_streams_database_back_to_dumpyfile(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Export", "shuffle_answers": False, "shuffle_questions_by_weight": True},
+            "questions": [
+                {
+                    "text": "One?",
+                    "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}],
+                    "postmortem": "Because."
+                },
+                {"text": "Two?", "answers": [{"text": "Yes", "is_correct": False}, {"text": "No", "is_correct": True}]}
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "export", dumpyfile_contents)
+            database_path = os.path.join(directory, "export.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            conn = sqlite3.connect(database_path)
+            conn.execute("UPDATE questions SET attempted_count = 3, correct_count = 2 WHERE id = 1")
+            conn.commit()
+            conn.close()
+
+            exported = {}
+
+            for include_statistics in [True, False]:
+                output_path = os.path.join(directory, f"exported-{include_statistics}.dumpy")
+                DumpyfileUtils.generate_dumpyfile_from_database(database_path, output_path, include_statistics)
+
+                with open(output_path) as output_file:
+                    exported[include_statistics] = json.loads(output_file.read())
+
+            # an exported dumpyfile imports as it was, as does one exported with 0/1 flags by an earlier version
+            reimported = []
+
+            for name, metadata in [
+                ("exported-True", None),
+                ("flags", {"description": "Export", "shuffle_answers": 0, "shuffle_questions_by_weight": 1})
+            ]:
+                if metadata:
+                    write_dumpyfile(directory, name, dict(exported[True], metadata=metadata))
+
+                dumpy = Dumpy(
+                    selected_database=os.path.join(directory, f"{name}.db"),
+                    selected_dumpyfile=os.path.join(directory, f"{name}.dumpy")
+                )
+
+                with mock.patch("sys.stdout", io.StringIO()):
+                    self.assertTrue(dumpy.import_dumpyfile())
+
+                database = dumpy.connect()
+                reimported.append((database.load_metadata(), len(database.load_questions())))
+                dumpy.disconnect()
+
+        self.assertEqual(reimported, [(("Export", 0, 1), 2), (("Export", 0, 1), 2)])
+        self.assertEqual(exported[True]["metadata"]["shuffle_answers"], False)
+        self.assertEqual(exported[True]["metadata"]["description"], "Export")
+        self.assertEqual(
+            [(q["postmortem"], q["attempted_count"], q["correct_count"]) for q in exported[True]["questions"]],
+            [("Because.", 3, 2), ("", 0, 0)]
+        )
+        self.assertEqual(
+            exported[False]["questions"],
+            [dict(q, postmortem=q.get("postmortem", "")) for q in dumpyfile_contents["questions"]]
+        )
+
+    def test_compiled_bank_matches_database_and_runs_read_only_sessions(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Bank", "shuffle_answers": True, "shuffle_questions_by_weight": True},
+            "questions": [
+                {
+                    "text": f"Question {i} \u2713?",
+                    "answers": [{"text": "Right", "is_correct": True}, {"text": "Wrong", "is_correct": False}],
+                    "postmortem": f"Postmortem {i}" if i % 2 else ""
+                }
+                for i in range(20)
+            ]
+        }
+
+        def summarize(questions):
+            return [
+                (
+                    q.question_id, q.text, q.postmortem, q.attempted_count,
+                    [(a.answer_id, a.text, a.is_correct) for a in q.answers]
+                )
+                for q in questions
+            ]
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "bank", dumpyfile_contents)
+            database_path = os.path.join(directory, "bank.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            conn = sqlite3.connect(database_path)
+            conn.execute("UPDATE questions SET attempted_count = 2, correct_count = 1 WHERE id = 7")
+            conn.commit()
+            conn.close()
+
+            database = Database(database_path)
+            expected = summarize(database.load_questions())
+            database.close()
+
+            banks = {}
+
+            for source_path, compress in [(dumpyfile_path, False), (database_path, True)]:
+                bank_path = os.path.join(directory, f"bank-{compress}.bank")
+                CompiledBank.compile(source_path, bank_path, compress)
+                banks[compress] = bank_path
+
+            dumpyfile_bank = CompiledBank(banks[False])
+            database_bank = CompiledBank(banks[True])
+
+            self.assertEqual(database_bank.load_metadata(), ("Bank", 1, 1))
+            self.assertEqual(summarize(database_bank.load_questions()), expected)
+            self.assertEqual(summarize([database_bank.load_question(7)]), expected[6:7])
+            self.assertIsNone(database_bank.load_question(21))
+            self.assertEqual(
+                [s[:3] + s[4:] for s in summarize(dumpyfile_bank.load_questions())], [s[:3] + s[4:] for s in expected]
+            )
+
+            dumpyfile_bank.close()
+            database_bank.close()
+
+            # an invalid dumpyfile isn't compiled, and leaves no bank (or partial bank) behind
+            bad_path = write_dumpyfile(directory, "bad", {"questions": [{"text": "Q", "answers": [{"text": "A"}]}]})
+            bad_bank_path = os.path.join(directory, "bad.bank")
+
+            with mock.patch("sys.stdout", io.StringIO()) as out, self.assertRaises(SystemExit):
+                CompiledBank.main(bad_path, bad_bank_path)
+
+            self.assertIn("is_correct: is missing", out.getvalue())
+            self.assertFalse(any(p.startswith("bad.bank") for p in os.listdir(directory)))
+
+            # a file too short to be a bank is reported as one that isn't
+            with open(bad_bank_path, "wb") as bad_bank_file:
+                bad_bank_file.write(b"DMPB")
+
+            with self.assertRaises(ValueError):
+                CompiledBank(bad_bank_path)
+
+            # a bank can't be searched, so a search is rejected rather than ignored
+            with mock.patch.dict(os.environ, {"DUMPY_SEARCH": "Question"}):
+                with mock.patch("sys.stdout", io.StringIO()) as out, self.assertRaises(SystemExit):
+                    Dumpy(selected_bank=banks[True]).load_questions_from_bank()
+
+            self.assertIn("`DUMPY_SEARCH` can't be used with a compiled bank", out.getvalue())
+
+            dumpy = Dumpy(selected_bank=banks[True])
+            dumpy.load_questions_from_bank()
+
+            responses = iter(["a", ""] * 20)
+
+            with mock.patch("builtins.input", lambda *args: next(responses)), mock.patch("os.system"), \
+                    mock.patch("sys.stdout", io.StringIO()):
+                dumpy.begin_braindump()
+
+        self.assertEqual(dumpy.scoreboard.current_session_displayed_count, 20)
+        self.assertEqual(dumpy.scoreboard.overall_attempted_count, 20)
+
+    def test_dumpyfile_is_unchanged_checks_size_and_mtime_before_hashing(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Cache", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [{"text": "Fresh?", "answers": [{"text": "Yes", "is_correct": True}]}]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "cache", dumpyfile_contents)
+            dumpy = Dumpy(selected_database=os.path.join(directory, "cache.db"), selected_dumpyfile=dumpyfile_path)
+
+            self.assertFalse(dumpy.dumpyfile_is_unchanged())
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.import_dumpyfile()
+
+            with mock.patch("dumpy.DumpyfileUtils.hash_dumpyfile", side_effect=AssertionError("hashed")):
+                self.assertTrue(dumpy.dumpyfile_is_unchanged())
+
+            # touching the dumpyfile means it's hashed once, and the new mtime is then recorded
+            os.utime(dumpyfile_path, (0, 12345))
+            self.assertTrue(dumpy.dumpyfile_is_unchanged())
+
+            with mock.patch("dumpy.DumpyfileUtils.hash_dumpyfile", side_effect=AssertionError("hashed")):
+                self.assertTrue(dumpy.dumpyfile_is_unchanged())
+
+            dumpyfile_contents["questions"][0]["text"] = "Stale, now?"
+            write_dumpyfile(directory, "cache", dumpyfile_contents)
+            os.utime(dumpyfile_path, (0, 12345))
+
+            self.assertFalse(dumpy.dumpyfile_is_unchanged())
+
+    def test_session_server_serves_users_concurrently_and_batches_writes(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Server", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                {
+                    "text": f"Question {i}?",
+                    "answers": [{"text": "Right", "is_correct": True}, {"text": "Wrong", "is_correct": False}]
+                }
+                for i in range(5)
+            ]
+        }
+
+        async def simulate(port, user, letters):
+            client = SessionClient(user)
+            await client.connect("127.0.0.1", port)
+
+            responses = []
+
+            for _ in range(5):
+                question = await client.request("next")
+                responses.append(await client.request("answer", question_id=question["question_id"], letters=letters))
+
+            responses.append(await client.request("answer", question_id=1, letters="AB"))
+            responses.append(await client.request("answer", question_id=1, letters=5))
+            responses.append(await client.request("progress"))
+            await client.close()
+
+            return responses
+
+        async def serve(database_path):
+            server = SessionServer(database_path)
+            tcp_server = await server.start()
+            port = tcp_server.sockets[0].getsockname()[1]
+
+            results = await asyncio.gather(simulate(port, "alice", "A"), simulate(port, "bob", "B"))
+
+            tcp_server.close()
+            await tcp_server.wait_closed()
+            await server.close()
+
+            return results
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "server", dumpyfile_contents)
+            database_path = os.path.join(directory, "server.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            alice, bob = asyncio.run(serve(database_path))
+
+            conn = sqlite3.connect(database_path)
+            progress = conn.execute(
+                "SELECT user, COUNT(*), SUM(attempted_count), SUM(correct_count) FROM user_progress GROUP BY user"
+            ).fetchall()
+            counts = conn.execute("SELECT SUM(attempted_count), SUM(correct_count) FROM questions").fetchone()
+            conn.close()
+
+        self.assertTrue(all(r["correct"] for r in alice[:5]))
+        self.assertFalse(any(r["correct"] for r in bob[:5]))
+        self.assertIn("error", alice[5])
+        self.assertIn("error", alice[6])
+        self.assertEqual((alice[7]["answered"], alice[7]["unseen"], alice[7]["overall_percent"]), (5, 0, 100.0))
+        self.assertEqual(progress, [("alice", 5, 5, 5), ("bob", 5, 5, 0)])
+        self.assertEqual(counts, (10, 5))
+
+    def test_attempt_log_buffers_answers_and_rebuilds_counters(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Attempts", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                {
+                    "text": f"Question {i}?",
+                    "answers": [{"text": "Right", "is_correct": True}, {"text": "Wrong", "is_correct": False}]
+                }
+                for i in range(3)
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "attempts", dumpyfile_contents)
+            database_path = os.path.join(directory, "attempts.db")
+
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.import_dumpyfile()
+                dumpy.load_questions_from_database()
+
+            dumpy.attempt_log.flush_every = 4
+
+            # question 1 is answered wrongly (and slowly), the others correctly
+            for q in dumpy.questions:
+                if q.question_id == 1:
+                    dumpy.record_answer(q, False, q.mask_letters("B"), 5.0)
+                else:
+                    dumpy.record_answer(q, True, q.mask_letters("A"), 1.0)
+
+            self.assertEqual(len(dumpy.attempt_log.buffer), 3)
+            dumpy.disconnect()
+
+            database = Database(database_path)
+            log = AttemptLog(database)
+
+            attempts = database.fetch_all("SELECT question_id, chosen_answer_ids, is_correct FROM attempts ORDER BY id")
+            accuracy = log.accuracy_by_question(days=1)
+            slowest = log.slowest_questions(limit=1)
+
+            database.execute("UPDATE questions SET attempted_count = 7, correct_count = 7")
+            rebuilt_count = log.rebuild_counters()
+            counts = database.fetch_all("SELECT attempted_count, correct_count FROM questions ORDER BY id")
+
+            log.close()
+            database.close()
+
+        self.assertEqual(sorted(a[:2] for a in attempts), [(1, "2"), (2, "3"), (3, "5")])
+        self.assertEqual(accuracy[0], (1, 1, 0, 0.0))
+        self.assertEqual(slowest, [(1, 1, 5.0)])
+        self.assertEqual(rebuilt_count, 3)
+        self.assertEqual(counts, [(1, 0), (1, 1), (1, 1)])
+
+    def test_search_sessions_load_only_matching_questions(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Search", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                {
+                    "text": "Which IAM entity can be assumed?",
+                    "answers": [{"text": "A role", "is_correct": True}, {"text": "A group", "is_correct": False}]
+                },
+                {
+                    "text": "How many addresses does a /28 have?",
+                    "answers": [{"text": "16", "is_correct": True}, {"text": "28", "is_correct": False}],
+                    "postmortem": "AWS reserves 5 of them in every subnet."
+                },
+                {
+                    "text": "Which service stores objects?",
+                    "answers": [{"text": "S3-bucket storage", "is_correct": True}, {"text": "EBS", "is_correct": False}]
+                }
+            ]
+        }
+
+        def search(database_path, query):
+            with mock.patch.dict(os.environ, {"DUMPY_SEARCH": query}):
+                dumpy = Dumpy(selected_database=database_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.load_questions_from_database()
+
+            dumpy.disconnect()
+
+            return sorted(q.question_id for q in dumpy.questions)
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "search", dumpyfile_contents)
+            database_path = os.path.join(directory, "search.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            self.assertEqual(search(database_path, "iam"), [1])
+            self.assertEqual(search(database_path, "Subnet"), [2])
+            self.assertEqual(search(database_path, "s3-bucket"), [3])
+            self.assertEqual(search(database_path, "which"), [1, 3])
+
+            dumpyfile_contents["questions"][0]["answers"][1]["text"] = "A subnet"
+            write_dumpyfile(directory, "search", dumpyfile_contents)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).sync_dumpyfile()
+
+            self.assertEqual(search(database_path, "subnet"), [1, 2])
+
+    def test_session_filters_select_questions_in_sql(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Filters", "shuffle_answers": False, "shuffle_questions_by_weight": True},
+            "questions": [
+                {
+                    "text": f"Question {i}",
+                    "tag": "networking" if i % 2 else "storage",
+                    "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}]
+                }
+                for i in range(1, 11)
+            ]
+        }
+
+        def session(database_path, environment):
+            with mock.patch.dict(os.environ, environment):
+                dumpy = Dumpy(selected_database=database_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.load_questions_from_database()
+
+            dumpy.disconnect()
+
+            return sorted(q.question_id for q in dumpy.questions)
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "filters", dumpyfile_contents)
+            database_path = os.path.join(directory, "filters.db")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            with sqlite3.connect(database_path) as conn:
+                conn.execute("UPDATE questions SET enabled = 0 WHERE id = 1")
+                conn.execute("UPDATE questions SET attempted_count = 4, correct_count = 1 WHERE id IN (3, 4)")
+                conn.execute("UPDATE questions SET attempted_count = 2, correct_count = 1 WHERE id = 5")
+
+            self.assertEqual(session(database_path, {}), list(range(2, 11)))
+            self.assertEqual(session(database_path, {"DUMPY_TAG": "networking"}), [3, 5, 7, 9])
+            self.assertEqual(session(database_path, {"DUMPY_UNSEEN": "1"}), [2, 6, 7, 8, 9, 10])
+            self.assertEqual(session(database_path, {"DUMPY_MISSED": "2"}), [3, 4])
+            self.assertEqual(session(database_path, {"DUMPY_MISSED": "0", "DUMPY_TAG": "networking"}), [3, 5])
+
+            # sampled by weight, so the unseen questions come first
+            sample = session(database_path, {"DUMPY_SAMPLE": "3"})
+            self.assertEqual(len(sample), 3)
+            self.assertTrue(set(sample) <= {2, 6, 7, 8, 9, 10})
+
+            # tags are exported, and a changed tag is synced in place
+            DumpyfileUtils.generate_dumpyfile_from_database(database_path, os.path.join(directory, "export.dumpy"))
+
+            with open(os.path.join(directory, "export.dumpy")) as export_file:
+                self.assertEqual(json.load(export_file)["questions"][1]["tag"], "storage")
+
+            dumpyfile_contents["questions"][1]["tag"] = "networking"
+            write_dumpyfile(directory, "filters", dumpyfile_contents)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).sync_dumpyfile()
+
+            # question 1 was disabled by hand rather than removed, so it stays disabled
+            self.assertEqual(session(database_path, {"DUMPY_TAG": "networking"}), [2, 3, 5, 7, 9])
+
+    def test_duplicate_finder_clusters_and_merges_near_duplicates(self):
+        def question(text, answers):
+            return {
+                "text": text,
+                "answers": [{"text": a, "is_correct": i == 0} for i, a in enumerate(answers)]
+            }
+
+        dumpyfile_contents = {
+            "metadata": {"description": "Dedup", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                question("Which AWS service provides object storage?", ["S3", "EBS", "EFS"]),
+                question("Which AWS service provides block storage for EC2 instances?", ["EBS", "S3", "EFS"]),
+                question("Which AWS service provides  object-storage ?", ["EFS", "S3", "EBS"]),
+                question("How many availability zones should a highly available deployment span?", ["2", "1"]),
+                question("which AWS service provides object storage", ["S3", "EBS", "EFS"])
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "dedup", dumpyfile_contents)
+            database_path = os.path.join(directory, "dedup.db")
+
+            with mock.patch.dict(os.environ, {"DUMPY_DEDUP": "report"}), mock.patch("sys.stdout", io.StringIO()) as out:
+                Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            self.assertIn("1 clusters of near-duplicate questions were found (2 duplicates)", out.getvalue())
+
+            database = Database(database_path)
+            AttemptLog(database, flush_every=1).record(3, [], True, 1.0)
+            database.execute("UPDATE questions SET attempted_count = 2, correct_count = 1 WHERE id = 3")
+            database.execute("UPDATE questions SET attempted_count = 1, correct_count = 1 WHERE id = 5")
+            database.close()
+
+            with sqlite3.connect(database_path) as conn:
+                clusters = DuplicateFinder().find_clusters(conn)
+
+                # the most attempted question of the cluster is kept
+                self.assertEqual(clusters, [[3, 5, 1]])
+                self.assertEqual(DuplicateFinder.resolve(conn, clusters, "merge"), 2)
+
+            with sqlite3.connect(database_path) as conn:
+                self.assertEqual(
+                    conn.execute("SELECT id, attempted_count, correct_count, enabled FROM questions").fetchall(),
+                    [(1, 0, 0, 0), (2, 0, 0, 1), (3, 3, 2, 1), (4, 0, 0, 1), (5, 0, 0, 0)]
+                )
+
+                self.assertEqual(DuplicateFinder().find_clusters(conn), [])
+
+    def test_renderer_draws_each_frame_in_one_write(self):
+        output = mock.Mock()
+
+        with mock.patch("sys.stdout", output):
+            TerminalRenderer(clear_screen=True).frame("What year is it?", "", "  A. 2021", "")
+
+            self.assertEqual(
+                output.write.call_args_list,
+                [mock.call(TerminalRenderer.clear_sequence + "What year is it?\n\n  A. 2021\n\n")]
+            )
+
+            output.isatty.return_value = False
+            TerminalRenderer().frame("Piped")
+
+        self.assertEqual(output.write.call_args.args, ("Piped\n",))
+
+    def test_session_engine_writes_in_background_and_saves_answers_when_interrupted(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Engine", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                {"text": text, "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}]}
+                for text in ["One", "Two", "Three"]
+            ]
+        }
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        def braindump(dumpy, responses):
+            responses = iter(responses)
+            write = Database.write
+            writing_threads = set()
+
+            def record_thread(database, sql_statements):
+                writing_threads.add(threading.current_thread().name)
+                write(database, sql_statements)
+
+            with mock.patch("builtins.input", lambda *args: next(responses)()), \
+                    mock.patch.object(Database, "write", record_thread), mock.patch("sys.stdout", io.StringIO()) as out:
+                dumpy.begin_braindump()
+
+            return writing_threads, out.getvalue()
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "engine", dumpyfile_contents)
+            database_path = os.path.join(directory, "engine.db")
+
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.import_dumpyfile()
+                dumpy.load_questions_from_database()
+
+            # two questions are answered, and the session is interrupted while the second one's result is showing
+            profile = Instrumentation()
+            profile.enabled = True
+
+            with mock.patch("dumpy.instrumentation", profile), mock.patch("engine.instrumentation", profile):
+                writing_threads, output = braindump(dumpy, [lambda: "A", lambda: "", lambda: "B", interrupt])
+
+            self.assertEqual(writing_threads, {"dumpy-session"})
+
+            # the writes are still timed, on the thread that makes them
+            self.assertEqual(
+                {name: totals["count"] for name, totals in profile.summary().items() if name.startswith("answer.")},
+                {"answer.queue": 2, "answer.write": 2}
+            )
+            self.assertEqual(profile.summary()["sql.write"]["count"], 2)
+            self.assertIn("every answer given has been saved", output)
+
+            with sqlite3.connect(database_path) as conn:
+                self.assertEqual(
+                    conn.execute("SELECT SUM(attempted_count), SUM(correct_count) FROM questions").fetchone(), (2, 1)
+                )
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM attempts").fetchone(), (2,))
+
+            # a scheduled question is only picked once the previous answer has been written, so the first question
+            # (answered incorrectly) isn't picked again, since it isn't due until a minute later
+            with mock.patch.dict(os.environ, {"DUMPY_SCHEDULER": "leitner"}):
+                dumpy = Dumpy(selected_database=database_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                dumpy.load_questions_from_database()
+
+            dumpy.scheduler.clock = lambda: 10.0
+            braindump(dumpy, [lambda: "B", lambda: "", lambda: "A", lambda: "", lambda: "A", lambda: ""])
+
+            with sqlite3.connect(database_path) as conn:
+                self.assertEqual(
+                    conn.execute("SELECT box, due_at FROM questions ORDER BY box").fetchall(),
+                    [(0, 70.0), (1, 610.0), (1, 610.0)]
+                )
+
+    def test_validator_reports_every_error_before_import(self):
+        invalid_contents = {
+            "metadata": {"description": "Invalid", "shuffle_answers": "yes"},
+            "questions": [
+                {"text": "Fine?", "answers": [{"text": "Yes", "is_correct": True}]},
+                {"answers": [{"text": "Yes", "is_correct": "False"}, {"text": "No"}]},
+                {"text": "Listless?", "answers": {"text": "Yes", "is_correct": True}},
+                "Not a question"
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            write_dumpyfile(directory, "invalid", invalid_contents)
+            dumpyfile_path = write_dumpyfile(directory, "valid", {
+                "questions": [{"text": "Untitled?", "answers": [{"text": "Yes", "is_correct": True}]}]
+            })
+
+            validator = DumpyfileValidator()
+            self.assertFalse(validator.validate(os.path.join(directory, "invalid.dumpy")))
+
+            self.assertEqual(validator.errors, [
+                "$.metadata.shuffle_answers: must be true or false",
+                "$.questions[1].text: is missing",
+                "$.questions[1].answers[1].is_correct: is missing",
+                "$.questions[1].answers: no answer is marked correct",
+                "$.questions[2].answers: must be a list",
+                "$.questions[3]: must be an object"
+            ])
+
+            # a valid dumpyfile without metadata is imported with the defaults
+            database_path = os.path.join(directory, "valid.db")
+
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                self.assertTrue(dumpy.import_dumpyfile())
+
+            with sqlite3.connect(database_path) as conn:
+                metadata = conn.execute(
+                    "SELECT description, shuffle_answers, shuffle_questions_by_weight FROM metadata"
+                ).fetchall()
+
+            self.assertEqual(metadata, [(None, 0, 1)])
+
+            # an invalid dumpyfile leaves the database it would have replaced untouched
+            os.replace(os.path.join(directory, "invalid.dumpy"), dumpyfile_path)
+
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+
+            with mock.patch("sys.stdout", io.StringIO()) as out:
+                self.assertFalse(dumpy.import_dumpyfile())
+
+            self.assertIn("has 6 error(s)", out.getvalue())
+
+            with sqlite3.connect(database_path) as conn:
+                self.assertEqual(conn.execute("SELECT text FROM questions").fetchall(), [("Untitled?",)])
+
+            write_dumpyfile(directory, "another", invalid_contents)
+
+            with mock.patch("sys.stdout", io.StringIO()) as out, self.assertRaises(SystemExit):
+                DumpyfileValidator.main(directory, jobs=2)
+
+            self.assertIn("2 dumpyfiles were validated with 2 workers", out.getvalue())
+
+    def test_validator_rejects_malformed_json(self):
+        valid = '{"questions": [{"text": "Q", "answers": [{"text": "A", "is_correct": true}]}]}\n'
+
+        malformed = {
+            "missing member comma": valid.replace('{"questions"', '{"metadata": {} "questions"'),
+            "repeated member comma": valid.replace('{"questions"', '{"metadata": {},, "questions"'),
+            "trailing member comma": valid.replace("]}\n", "],}\n"),
+            "missing element comma": valid.replace("}]}\n", "} {}]}\n"),
+            "trailing element comma": valid.replace("}]}\n", "},]}\n"),
+            "trailing data": valid + "{}"
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = os.path.join(directory, "malformed.dumpy")
+
+            with open(dumpyfile_path, "w") as dumpyfile:
+                dumpyfile.write(valid)
+
+            self.assertTrue(DumpyfileValidator().validate(dumpyfile_path))
+
+            for name, contents in malformed.items():
+                with self.assertRaises(json.JSONDecodeError, msg=name):
+                    json.loads(contents)
+
+                with open(dumpyfile_path, "w") as dumpyfile:
+                    dumpyfile.write(contents)
+
+                validator = DumpyfileValidator()
+                self.assertFalse(validator.validate(dumpyfile_path), msg=name)
+                self.assertEqual(len(validator.errors), 1, msg=name)
+                self.assertTrue(validator.errors[0].startswith("$: "), msg=name)
+
+    def test_federated_session_writes_answers_back_to_each_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database_paths = []
+
+            for name, texts in [("first", ["One", "Two", "Three"]), ("second", ["Four", "Five"])]:
+                dumpyfile_path = write_dumpyfile(directory, name, {
+                    "metadata": {"description": name, "shuffle_answers": False, "shuffle_questions_by_weight": False},
+                    "questions": [
+                        {"text": text, "tag": None if text == "Four" else "exam", "answers": [
+                            {"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}
+                        ]}
+                        for text in texts
+                    ]
+                })
+
+                database_paths.append(os.path.join(directory, f"{name}.db"))
+
+                with mock.patch("sys.stdout", io.StringIO()):
+                    Dumpy(selected_database=database_paths[-1], selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            dumpy = Dumpy(selected_databases=database_paths)
+            dumpy.session_filter = SessionFilter(tag="exam")
+            dumpy.load_questions_from_database()
+
+            self.assertEqual(sorted(q.text for q in dumpy.questions), ["Five", "One", "Three", "Two"])
+            self.assertEqual(dumpy.description, "first + second")
+            self.assertEqual(dumpy.scoreboard.unseen_count, 5)
+
+            # "One", "Two" and "Three" are answered correctly, "Five" incorrectly
+            dumpy.engine = dumpy.start_engine()
+
+            for q in dumpy.engine:
+                dumpy.record_answer(q, q.text != "Five", q.mask_letters("A" if q.text != "Five" else "B"), 1.0)
+
+            dumpy.disconnect()
+
+            counts, attempts = [], []
+
+            for database_path in database_paths:
+                with sqlite3.connect(database_path) as conn:
+                    counts.append(conn.execute(
+                        "SELECT text, attempted_count, correct_count FROM questions ORDER BY id"
+                    ).fetchall())
+
+                    attempts.append(conn.execute(
+                        "SELECT q.text, a.text, t.is_correct FROM attempts t "
+                        "JOIN questions q ON q.id = t.question_id JOIN answers a ON a.id = t.chosen_answer_ids "
+                        "ORDER BY q.id"
+                    ).fetchall())
+
+                conn.close()
+
+            dumpy = Dumpy(selected_databases=database_paths + database_paths[:1])
+            dumpy.session_filter = SessionFilter(sample=2)
+
+            # a sample isn't asked in id order, even when the bank isn't shuffled by weight
+            with mock.patch("dumpy.shuffle") as shuffled:
+                dumpy.load_questions_from_database()
+
+            shuffled.assert_called_once_with(dumpy.questions)
+            sampled_ids = [q.question_id for q in dumpy.questions]
+            dumpy.disconnect()
+
+            # SQLite can't attach more than 10 databases to a connection, so neither can a federated session
+            with self.assertRaises(ValueError):
+                FederatedDatabase([os.path.join(directory, f"{i}.db") for i in range(11)])
+
+            # a database that can't be read says so, rather than that it's empty
+            corrupt_path = os.path.join(directory, "corrupt.db")
+
+            with open(corrupt_path, "w") as corrupt_file:
+                corrupt_file.write("not a database" * 100)
+
+            with mock.patch("sys.stdout", io.StringIO()) as stdout, self.assertRaises(SystemExit):
+                Dumpy(selected_database=corrupt_path).load_questions_from_database()
+
+            self.assertIn("could not be loaded", stdout.getvalue())
+            self.assertNotIn("empty", stdout.getvalue())
+
+        self.assertEqual(counts, [
+            [("One", 1, 1), ("Two", 1, 1), ("Three", 1, 1)],
+            [("Four", 0, 0), ("Five", 1, 0)]
+        ])
+
+        self.assertEqual(attempts, [
+            [("One", "Yes", 1), ("Two", "Yes", 1), ("Three", "Yes", 1)],
+            [("Five", "No", 0)]
+        ])
+
+        # a database given twice is only attached once
+        self.assertEqual(len(set(sampled_ids)), 2)
+
+    def test_progress_snapshots_sync_between_databases(self):
+        texts = ["One", "Two", "Three", "Two"]
+
+        def answer(database_path, text, is_correct, order=0):
+            with sqlite3.connect(database_path) as conn:
+                conn.execute(
+                    "UPDATE questions SET attempted_count = attempted_count + 1, correct_count = correct_count + ? "
+                    "WHERE id = (SELECT id FROM questions WHERE text = ? ORDER BY id LIMIT 1 OFFSET ?)",
+                    (1 if is_correct else 0, text, order)
+                )
+
+            conn.close()
+
+        def progress(database_path):
+            with sqlite3.connect(database_path) as conn:
+                rows = conn.execute(
+                    "SELECT text, attempted_count, correct_count, enabled FROM questions ORDER BY text, id"
+                ).fetchall()
+
+            conn.close()
+            return rows
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_paths = []
+
+            # the same bank, imported in a different order on each machine, so its questions' ids differ
+            for name, ordered_texts in [("first", texts), ("second", texts[::-1])]:
+                dumpyfile_path = write_dumpyfile(directory, name, {
+                    "questions": [
+                        {"text": text, "answers": [{"text": "Yes", "is_correct": True}]} for text in ordered_texts
+                    ]
+                })
+
+                database_paths.append(os.path.join(directory, f"{name}.db"))
+
+                with mock.patch("sys.stdout", io.StringIO()):
+                    Dumpy(selected_database=database_paths[-1], selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+            first, second = database_paths
+            snapshot_path = os.path.join(directory, "progress.snapshot")
+
+            answer(first, "One", True)
+            answer(first, "Two", False, order=1)
+
+            with sqlite3.connect(first) as conn:
+                conn.execute("UPDATE questions SET enabled = 0 WHERE text = 'Three'")
+
+            conn.close()
+
+            with mock.patch("sys.stdout", io.StringIO()) as out:
+                ProgressSnapshot.export_main(first, snapshot_path)
+
+                # merging a full snapshot twice changes nothing
+                ProgressSnapshot.merge_main(second, [snapshot_path, snapshot_path])
+
+            self.assertIn("3 questions' progress have been exported", out.getvalue())
+            self.assertEqual(progress(first), progress(second))
+
+            # each machine carries on, and they exchange only what changed
+            answer(first, "Two", True, order=1)
+            answer(second, "One", True)
+            answer(second, "Two", False)
+
+            first_snapshot_path = os.path.join(directory, "first.snapshot")
+            second_snapshot_path = os.path.join(directory, "second.snapshot")
+
+            with mock.patch("sys.stdout", io.StringIO()):
+                ProgressSnapshot.export_main(first, first_snapshot_path, delta=True)
+                ProgressSnapshot.export_main(second, second_snapshot_path, delta=True)
+                ProgressSnapshot.merge_main(second, [first_snapshot_path])
+                ProgressSnapshot.merge_main(first, [second_snapshot_path])
+                ProgressSnapshot.export_main(first, snapshot_path, delta=True)
+
+            self.assertEqual(len(ProgressSnapshot.read(first_snapshot_path)), 1)
+            self.assertTrue(ProgressSnapshot.read(second_snapshot_path).delta)
+
+            self.assertEqual(
+                progress(first), [("One", 2, 2, 1), ("Three", 0, 0, 0), ("Two", 1, 0, 1), ("Two", 2, 1, 1)]
+            )
+            self.assertEqual(progress(first), progress(second))
+
+            # what was merged in isn't sent back
+            self.assertEqual(len(ProgressSnapshot.read(snapshot_path)), 0)
+
+    def test_database_migrates_databases_from_earlier_versions(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Old", "shuffle_answers": False, "shuffle_questions_by_weight": True},
+            "questions": [
+                {"text": f"Question {i}?", "answers": [{"text": "Yes", "is_correct": True}]} for i in range(3)
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "old.db")
+            write_baseline_database(database_path, dumpyfile_contents, attempted_count=2, correct_count=1)
+
+            conn = sqlite3.connect(database_path)
+            added_columns = Database.migrate(conn)
+            conn.commit()
+
+            columns = {
+                table: [column[1] for column in conn.execute(f"PRAGMA table_info({table})")]
+                for table in ["metadata", "questions", "answers", "attempts"]
+            }
+
+            self.assertEqual(Database.migrate(conn), [])
+            conn.close()
+
+            database = Database(database_path)
+            self.assertEqual(database.load_overall_counts(), (3, 3, 0))
+            self.assertEqual(database.fetch_one("SELECT COUNT(*) FROM questions WHERE due_at BETWEEN 0 AND 1")[0], 3)
+            database.close()
+
+        self.assertEqual(added_columns, [(table, column) for table, column, _ in Database.columns])
+        self.assertTrue(all(column in columns[table] for table, column, _ in Database.columns))
+        self.assertIn("chosen_answer_ids", columns["attempts"])
+
+    def test_sync_migrates_databases_from_earlier_versions_and_keeps_their_progress(self):
+        dumpyfile_contents = {
+            "metadata": {"description": "Old", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                {
+                    "text": f"Question {i}?",
+                    "answers": [{"text": "Yes", "is_correct": True}, {"text": "No", "is_correct": False}],
+                    **({"postmortem": "Because."} if i % 2 else {})
+                }
+                for i in range(4)
+            ]
+        }
+
+        def counts(database_path):
+            with sqlite3.connect(database_path) as conn:
+                rows = conn.execute("SELECT id, attempted_count, correct_count, enabled FROM questions").fetchall()
+
+            conn.close()
+            return rows
+
+        with tempfile.TemporaryDirectory() as directory:
+            dumpyfile_path = write_dumpyfile(directory, "old", dumpyfile_contents)
+            database_path = os.path.join(directory, "old.db")
+            write_baseline_database(database_path, dumpyfile_contents, attempted_count=7, correct_count=5)
+
+            # loading the database from the menu syncs it, since no dumpyfile was ever recorded against it
+            dumpy = Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path)
+            self.assertFalse(dumpy.dumpyfile_is_unchanged())
+
+            with mock.patch("sys.stdout", io.StringIO()) as out:
+                self.assertTrue(dumpy.sync_dumpyfile())
+
+            self.assertIn("4 questions in", out.getvalue())
+            self.assertIn("0 inserted, 0 updated, 0 disabled, 4 unchanged", out.getvalue())
+            self.assertEqual(counts(database_path), [(i, 7, 5, 1) for i in range(1, 5)])
+            self.assertTrue(dumpy.dumpyfile_is_unchanged())
+
+            # `import-all` syncs an existing database the same way
+            write_baseline_database(os.path.join(directory, "older.db"), dumpyfile_contents, 7, 5)
+            result = import_dumpyfile(dumpyfile_path, os.path.join(directory, "older.db"))
+
+            self.assertEqual(result["status"], "synced")
+            self.assertEqual(counts(os.path.join(directory, "older.db")), [(i, 7, 5, 1) for i in range(1, 5)])
+
+    def test_sync_keeps_duplicates_disabled(self):
+        def question(text, postmortem=""):
+            return {
+                "text": text,
+                "postmortem": postmortem,
+                "answers": [{"text": "S3", "is_correct": True}, {"text": "EBS", "is_correct": False}]
+            }
+
+        dumpyfile_contents = {
+            "metadata": {"description": "Dedup", "shuffle_answers": False, "shuffle_questions_by_weight": False},
+            "questions": [
+                question("Which AWS service provides object storage?"),
+                question("which AWS service provides object storage"),
+                question("How many availability zones should a highly available deployment span?")
+            ]
+        }
+
+        def enabled(database_path):
+            with sqlite3.connect(database_path) as conn:
+                rows = conn.execute("SELECT id, enabled, attempted_count FROM questions ORDER BY id").fetchall()
+
+            conn.close()
+            return rows
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = {}
+
+            for action in ["disable", "merge"]:
+                dumpyfile_path = write_dumpyfile(directory, action, dumpyfile_contents)
+                database_path = os.path.join(directory, f"{action}.db")
+
+                with mock.patch.dict(os.environ, {"DUMPY_DEDUP": action}), mock.patch("sys.stdout", io.StringIO()):
+                    Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).import_dumpyfile()
+
+                with sqlite3.connect(database_path) as conn:
+                    conn.execute("UPDATE questions SET attempted_count = 1")
+
+                conn.close()
+
+                # an unrelated question changes, and is removed and added back
+                changed_contents = dict(dumpyfile_contents, questions=dumpyfile_contents["questions"][:2])
+                write_dumpyfile(directory, action, changed_contents)
+
+                with mock.patch("sys.stdout", io.StringIO()):
+                    Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).sync_dumpyfile()
+
+                changed_contents["questions"].append(question(dumpyfile_contents["questions"][2]["text"], "Two."))
+                write_dumpyfile(directory, action, changed_contents)
+
+                with mock.patch("sys.stdout", io.StringIO()):
+                    Dumpy(selected_database=database_path, selected_dumpyfile=dumpyfile_path).sync_dumpyfile()
+
+                results[action] = enabled(database_path)
 
-        dumpy.execute_braindump()
+        self.assertEqual(results["disable"], [(1, 1, 1), (2, 0, 1), (3, 1, 1)])
+        self.assertEqual(results["merge"], [(1, 1, 1), (2, 0, 1), (3, 1, 1)])
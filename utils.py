@@ -1,8 +1,12 @@
 import os
 import json
+import codecs
+import hashlib
 import sqlite3
 import datetime
-from models import Question
+from itertools import chain, groupby
+from models import Question, Answer
+from database import Database
 
 
 class DumpyfileUtils:
@@ -10,7 +14,7 @@ class DumpyfileUtils:
         pass
 
     @staticmethod
-    def create(metadata, questions, context):
+    def create(metadata, questions, context, dumpyfiles_directory=None):
         """
         Creates a .dumpy file in the local ~/dumpy/dumpyfiles/ directory based on the provided Questions.
 
@@ -20,25 +24,31 @@ class DumpyfileUtils:
         :type metadata: Metadata
         :param context: The name of the resulting dumpyfile (e.g. if context=test --> test.dumpy will be created).
         :type context: str
+        :param dumpyfiles_directory: The directory to create the dumpyfile in, if not ~/dumpy/dumpyfiles/.
+        :type dumpyfiles_directory: str
         """
 
         dumpyfile_path = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            "dumpyfiles",
+            dumpyfiles_directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), "dumpyfiles"),
             context.lower() + ".dumpy"
         )
 
         # serialize questions object to json
         def obj_dict(obj):
-            return obj.__dict__
+            if isinstance(obj, Question):
+                return {
+                    "text": obj.text,
+                    "answers": obj.answers,
+                    "postmortem": obj.postmortem,
+                    "attempted_count": obj.attempted_count,
+                    "correct_count": obj.correct_count,
+                    "enabled": obj.enabled
+                }
 
-        for q in questions:
-            del q.question_id
+            if isinstance(obj, Answer):
+                return {"text": obj.text, "is_correct": obj.is_correct}
 
-            for a in q.answers:
-                del a.answer_id
-                del a.letter
-                del a.question_id
+            return obj.__dict__
 
         json_contents = {
             "metadata": metadata,
@@ -76,66 +86,252 @@ class DumpyfileUtils:
             return j
 
     @staticmethod
-    def generate_dumpyfile_from_database(database_path, output_path):
+    def hash_dumpyfile(dumpyfile_path, chunk_size=1024 * 1024):
+        """
+        Hashes a .dumpy file's raw contents, to tell whether it has changed since it was imported.
+        """
+
+        source_hash = hashlib.sha1()
+
+        with open(dumpyfile_path, 'rb') as dumpyfile:
+            for chunk in iter(lambda: dumpyfile.read(chunk_size), b""):
+                source_hash.update(chunk)
+
+        return source_hash.hexdigest()
+
+    @staticmethod
+    def generate_dumpyfile_from_database(database_path, output_path, include_statistics=True):
+        """
+        Exports a database to a .dumpy file, optionally including each question's learner statistics.
 
-        questions, answers, metadata, conn = None, None, None, None
+        Questions and their answers are read through a single join, ordered by question id, and written out one
+        question at a time, so memory use stays constant and export time is linear in the size of the bank.
+        """
+
+        database, question_count = None, 0
 
         try:
-            conn = sqlite3.connect(database_path)
-            c = conn.cursor()
+            database = Database(database_path)
+
+            # the join is read in question order through this index, rather than sorted
+            database.create_indexes()
+
+            metadata = database.load_metadata()
+
+            rows = database.execute(
+                "SELECT q.id, q.text, q.postmortem, q.attempted_count, q.correct_count, q.enabled, "
+                "a.text, a.is_correct, q.tag "
+                "FROM questions q LEFT JOIN answers a ON a.question_id = q.id "
+                "ORDER BY q.id, a.id"
+            )
+
+            with open(output_path, "w+") as output_file:
+                output_file.write('{\n    "metadata": ')
+                output_file.write(
+                    json.dumps(
+                        {
+                            "description": metadata[0],
+                            "shuffle_answers": bool(metadata[1]),
+                            "shuffle_questions_by_weight": bool(metadata[2]),
+                            # "database_created_time": datetime.datetime.strftime(datetime.datetime.now())
+                        },
+                        indent=4
+                    ).replace("\n", "\n    ")
+                )
+                output_file.write(',\n    "questions": [')
 
-            c.execute("SELECT * FROM metadata")
-            metadata = c.fetchone()
+                for _, question_rows in groupby(rows, key=lambda r: r[0]):
+                    q = next(question_rows)
 
-            c.execute("SELECT * FROM questions")
-            questions = c.fetchall()
+                    question = {"text": q[1], "postmortem": q[2]}
 
-            c.execute("SELECT * FROM answers")
-            answers = c.fetchall()
+                    if q[8] is not None:
+                        question["tag"] = q[8]
 
-            conn.close()
+                    if include_statistics:
+                        question["attempted_count"] = q[3]
+                        question["correct_count"] = q[4]
+                        question["enabled"] = q[5]
+
+                    question["answers"] = [
+                        {"text": a[6], "is_correct": a[7] == 1} for a in chain([q], question_rows) if a[6] is not None
+                    ]
+
+                    # each question is laid out exactly as it would be if the whole document were dumped at once
+                    output_file.write("\n" if question_count == 0 else ",\n")
+                    output_file.write("        " + json.dumps(question, indent=4).replace("\n", "\n        "))
+
+                    question_count += 1
+
+                output_file.write("\n    ]\n}" if question_count else "]\n}")
 
         except sqlite3.Error as e:
             print(e)
 
         finally:
-            if conn:
-                conn.close()
+            if database:
+                database.close()
 
-        description = metadata[0]
-        shuffle_answers = metadata[1]
-        shuffle_questions_by_weight = metadata[2]
+        return question_count
 
-        dumpyfile = {
-            "metadata": {
-                "description": description,
-                "shuffle_answers": shuffle_answers,
-                "shuffle_questions_by_weight": shuffle_questions_by_weight,
-                # "database_created_time": datetime.datetime.strftime(datetime.datetime.now())
-            },
-            "questions": []
-        }
 
-        for q in questions:
-            new_question = {
-                    "text": q[1],
-                    "portmortem": q[2],
-                    "attempted_count": q[3],
-                    "correct_count": q[4],
-                    "enabled": q[5],
-                    "answers": []
-                }
+class DumpyfileReader:
+    """
+    Reads a .dumpy file incrementally, so that arbitrarily large dumpyfiles can be processed with flat memory usage.
 
-            for a in answers:
-                if a[1] == q[0]:
-                    new_question["answers"].append(
-                        {
-                            "text": a[2],
-                            "is_correct": True if a[3] == 1 else False
-                        }
-                    )
+    Iterating over a reader yields ("question", dict) for each element of the top-level `questions` array, and
+    (key, value) for every other top-level key (e.g. ("metadata", dict)), in the order in which they appear in the file.
+    Once the file has been read, `source_hash` is the same hash of its contents as `DumpyfileUtils.hash_dumpyfile`.
+    """
+
+    def __init__(self, dumpyfile_path, chunk_size=65536):
+        self.dumpyfile_path = dumpyfile_path
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(dumpyfile_path)
+        self.bytes_read = 0
+
+        self._decoder = json.JSONDecoder()
+        self._hash = hashlib.sha1()
+        self._file = None
+        self._text_decoder = None
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    @property
+    def percent_read(self):
+        return int(self.bytes_read * 100 / self.size) if self.size else 100
+
+    @property
+    def source_hash(self):
+        return self._hash.hexdigest()
+
+    def __iter__(self):
+        with open(self.dumpyfile_path, 'rb') as dumpyfile:
+            self._file = dumpyfile
+            self._text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+            self._buffer, self._position, self._eof, self.bytes_read = "", 0, False, 0
+            self._hash = hashlib.sha1()
+
+            self._expect("{")
+
+            # members are separated by exactly one comma, so a missing, repeated or trailing comma is an error
+            if self._peek() == "}":
+                self._position += 1
+            else:
+                while True:
+                    key = self._decode()
 
-            dumpyfile["questions"].append(new_question)
+                    if not isinstance(key, str):
+                        raise ValueError(f"{self.dumpyfile_path}: expected a key near byte {self.bytes_read}.")
+
+                    self._expect(":")
+
+                    if key != "questions":
+                        yield key, self._decode()
+
+                    else:
+                        self._expect("[")
+
+                        if self._peek() == "]":
+                            self._position += 1
+                        else:
+                            while True:
+                                yield "question", self._decode()
+
+                                if self._expect(",]") == "]":
+                                    break
+
+                    if self._expect(",}") == "}":
+                        break
+
+            # only whitespace (e.g. a trailing newline) may follow the closing brace, and it's still hashed
+            trailing = self._buffer[self._position:]
+
+            while True:
+                if trailing.strip(" \t\r\n"):
+                    raise ValueError(f"{self.dumpyfile_path}: unexpected data after the closing '}}'.")
+
+                if self._eof:
+                    break
+
+                chunk = self._file.read(self.chunk_size)
+                self._hash.update(chunk)
+                self.bytes_read += len(chunk)
+                self._eof = not chunk
+                trailing = self._text_decoder.decode(chunk, final=self._eof)
+
+    def _fill(self, size=None):
+        """
+        Reads another chunk of the file into the buffer, discarding whatever has already been parsed.
+        """
+
+        if self._position:
+            self._buffer = self._buffer[self._position:]
+            self._position = 0
+
+        chunk = self._file.read(size or self.chunk_size)
+        self._hash.update(chunk)
+        self.bytes_read += len(chunk)
+        self._eof = not chunk
+        self._buffer += self._text_decoder.decode(chunk, final=self._eof)
+
+    def _peek(self):
+        """
+        Skips whitespace and returns the next character without consuming it.
+        """
+
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in " \t\r\n":
+                self._position += 1
+
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+
+            if self._eof:
+                raise ValueError(f"{self.dumpyfile_path} ended unexpectedly.")
+
+            self._fill()
+
+    def _expect(self, characters):
+        """
+        Consumes the next character, which must be one of `characters`, and returns it.
+        """
+
+        c = self._peek()
+
+        if c not in characters:
+            raise ValueError(
+                f"{self.dumpyfile_path}: expected {' or '.join(repr(e) for e in characters)} but found '{c}' "
+                f"near byte {self.bytes_read}."
+            )
+
+        self._position += 1
+
+        return c
+
+    def _decode(self):
+        """
+        Decodes the next JSON value, reading more of the file until the value is complete.
+        """
+
+        self._peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+
+                # a value that runs to the very end of the buffer (e.g. a number) might continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._position = end
+                    return value
+
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(
+                        f"{self.dumpyfile_path}: {e.msg.lower()} near byte "
+                        f"{self.bytes_read - len(self._buffer[e.pos:].encode('utf-8'))}."
+                    )
 
-        with open(output_path, "w+") as output_file:
-            output_file.write(json.dumps(dumpyfile, indent=4))
+            # grow reads with the size of the pending value so that very large values are still parsed in linear time
+            self._fill(max(self.chunk_size, len(self._buffer) - self._position))
@@ -0,0 +1,198 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils import DumpyfileReader
+from importer import BulkImporter
+
+
+def validate_dumpyfile(dumpyfile_path, max_errors=100):
+    """
+    Validates one .dumpy file, in a worker process, and returns what was found.
+    """
+
+    start = time.perf_counter()
+    validator = DumpyfileValidator(max_errors)
+    validator.validate(dumpyfile_path)
+
+    return {
+        "dumpyfile": dumpyfile_path,
+        "questions": validator.question_count,
+        "error_count": validator.error_count,
+        "errors": validator.errors,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+class DumpyfileValidator:
+    """
+    Checks a .dumpy file against the dumpyfile format in a single streaming pass, so that it can be checked in full
+    before anything is imported from it.
+
+    Every problem is reported, each with the JSON path of the value at fault (e.g. `$.questions[12].answers[0].text`,
+    where 12 is the question's index in the file), rather than just the first.  Memory use is bounded regardless of
+    the size of the file: questions are read one at a time, and only the first `max_errors` errors are kept (though
+    all of them are counted).
+    """
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+
+        self.errors = []
+        self.error_count = 0
+        self.question_count = 0
+
+    @property
+    def is_valid(self):
+        return self.error_count == 0
+
+    def error(self, path, message):
+        self.error_count += 1
+
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"{path}: {message}")
+
+    def validate(self, dumpyfile_path):
+        """
+        Validates a .dumpy file, returning whether it's valid.  Its errors are left in `errors`.
+        """
+
+        self.errors, self.error_count, self.question_count = [], 0, 0
+
+        try:
+            for key, value in DumpyfileReader(dumpyfile_path):
+                if key == "question":
+                    self.check_question(f"$.questions[{self.question_count}]", value)
+                    self.question_count += 1
+
+                elif key == "metadata":
+                    self.check_metadata("$.metadata", value)
+
+        # the file can't be read any further, but whatever was found before this point still stands
+        except (OSError, ValueError) as e:
+            self.error("$", str(e))
+            return False
+
+        if self.question_count == 0:
+            self.error("$.questions", "there are no questions")
+
+        return self.is_valid
+
+    def check_metadata(self, path, metadata):
+        if not isinstance(metadata, dict):
+            self.error(path, "must be an object")
+            return
+
+        if metadata.get("description") is not None and not isinstance(metadata["description"], str):
+            self.error(f"{path}.description", "must be a string")
+
+        # databases store these as 0 or 1, which is how dumpyfiles exported by earlier versions wrote them
+        for key in ["shuffle_answers", "shuffle_questions_by_weight"]:
+            if key in metadata and not isinstance(metadata[key], bool) and metadata[key] not in [0, 1]:
+                self.error(f"{path}.{key}", "must be true or false")
+
+    def check_text(self, path, parent, key):
+        if key not in parent:
+            self.error(path, "is missing")
+
+        elif isinstance(parent[key], bool) or not isinstance(parent[key], (str, int, float)):
+            self.error(path, "must be a string")
+
+        elif str(parent[key]).strip() == "":
+            self.error(path, "is empty")
+
+    def check_question(self, path, question):
+        if not isinstance(question, dict):
+            self.error(path, "must be an object")
+            return
+
+        self.check_text(f"{path}.text", question, "text")
+
+        for key in ["postmortem", "tag"]:
+            if question.get(key) is not None and not isinstance(question[key], str):
+                self.error(f"{path}.{key}", "must be a string")
+
+        answers = question.get("answers")
+
+        if answers is None:
+            self.error(f"{path}.answers", "is missing")
+            return
+
+        if not isinstance(answers, list):
+            self.error(f"{path}.answers", "must be a list")
+            return
+
+        if len(answers) == 0:
+            self.error(f"{path}.answers", "there are no answers")
+            return
+
+        # answers are lettered A to Z
+        if len(answers) > 26:
+            self.error(f"{path}.answers", f"there are {len(answers)} answers, but there can be at most 26")
+
+        correct_count = 0
+
+        for i, answer in enumerate(answers):
+            answer_path = f"{path}.answers[{i}]"
+
+            if not isinstance(answer, dict):
+                self.error(answer_path, "must be an object")
+                continue
+
+            self.check_text(f"{answer_path}.text", answer, "text")
+
+            # "True" and "False" are accepted, as older dumpyfiles were written with them
+            if "is_correct" not in answer:
+                self.error(f"{answer_path}.is_correct", "is missing")
+            elif not isinstance(answer["is_correct"], bool) and answer["is_correct"] not in ["True", "False"]:
+                self.error(f"{answer_path}.is_correct", "must be true or false")
+            elif answer["is_correct"] is True or answer["is_correct"] == "True":
+                correct_count += 1
+
+        if correct_count == 0:
+            self.error(f"{path}.answers", "no answer is marked correct")
+
+    @staticmethod
+    def main(pattern, jobs=None, max_errors=20):
+        """
+        Validates every .dumpy file matching a glob (or in a directory, or a single file), in parallel, and prints what
+        was found.  Exits with an error if any file is invalid.
+        """
+
+        dumpyfile_paths = BulkImporter.find_dumpyfiles(pattern)
+
+        if not dumpyfile_paths:
+            print(f"ERROR: no .dumpy files were found matching {pattern}.")
+            exit(1)
+
+        jobs = min(jobs or os.cpu_count() or 1, len(dumpyfile_paths))
+        start = time.perf_counter()
+
+        if jobs == 1:
+            results = [validate_dumpyfile(p, max_errors) for p in dumpyfile_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(validate_dumpyfile, p, max_errors) for p in dumpyfile_paths]
+                results = sorted((f.result() for f in as_completed(futures)), key=lambda r: r["dumpyfile"])
+
+        for r in results:
+            if r["error_count"] == 0:
+                print(f"INFO: {r['dumpyfile']} is valid ({r['questions']} questions, {r['seconds']}s).")
+                continue
+
+            print(f"ERROR: {r['dumpyfile']} has {r['error_count']} error(s):")
+
+            for e in r["errors"]:
+                print(f"    {e}")
+
+            if r["error_count"] > len(r["errors"]):
+                print(f"    ... and {r['error_count'] - len(r['errors'])} more.")
+
+        invalid_count = sum(1 for r in results if r["error_count"])
+
+        print(
+            f"INFO: {len(results)} dumpyfiles were validated with {jobs} workers in "
+            f"{round(time.perf_counter() - start, 2)}s ({invalid_count} invalid)."
+        )
+
+        if invalid_count:
+            exit(1)